@@ -0,0 +1,95 @@
+"""
+Measures the overhead and concurrency of the Agent pipeline with the LLM
+replaced by recorded responses, no network needed once the fixture exists.
+
+Record a fixture once (needs OPENAI_API_KEY):
+    python benchmarks/bench_agent_replay.py fixtures/gpt-3.5-turbo.json --record
+
+then replay it, from the top level directory of the travel mapper project:
+    python benchmarks/bench_agent_replay.py fixtures/gpt-3.5-turbo.json --latency 1.5 --jitter 0.5
+"""
+
+from travel_mapper.agent.Agent import Agent
+from travel_mapper.agent.LLMResponseCache import LLMResponseCache
+from travel_mapper.agent.ReplayChatModel import ReplayChatModel
+from travel_mapper.constants import MODEL_NAME, TEMPERATURE
+from travel_mapper.TravelMapper import load_secrets
+from langchain.chat_models import ChatOpenAI
+import argparse
+import asyncio
+import time
+
+QUERY = """
+I want to do a 5 day roadtrip from Cape Town to Pretoria in South Africa.
+I want to visit remote locations with mountain views
+"""
+
+
+def make_agent(chat_model, speculative):
+    return Agent(
+        load_secrets()["OPENAI_API_KEY"],
+        None,
+        model=chat_model.model_name,
+        debug=False,
+        # a fresh in-memory cache, every run has to go through the chains
+        response_cache=LLMResponseCache(db_path=None),
+        speculative=speculative,
+        chat_models={chat_model.model_name: chat_model},
+    )
+
+
+async def run_concurrently(agent, n_requests):
+    chains = agent.chains.get(agent.model_name)
+    # the uncached entry point, identical queries would be coalesced otherwise
+    return await asyncio.gather(
+        *[agent._asuggest_travel(QUERY, chains) for _ in range(n_requests)]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("fixture_path")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.record:
+        recorder = ChatOpenAI(model=MODEL_NAME, temperature=TEMPERATURE)
+        chat_model = ReplayChatModel.from_fixture(args.fixture_path, recorder=recorder)
+        # serial and speculative runs send the same prompts
+        make_agent(chat_model, speculative=False).suggest_travel(QUERY)
+        print("recorded {} responses".format(len(chat_model.recordings)))
+        return
+
+    chat_model = ReplayChatModel.from_fixture(
+        args.fixture_path, latency=args.latency, jitter=args.jitter
+    )
+    for speculative in (False, True):
+        agent = make_agent(chat_model, speculative)
+
+        t1 = time.perf_counter()
+        agent.suggest_travel(QUERY)
+        single = time.perf_counter() - t1
+
+        t1 = time.perf_counter()
+        asyncio.run(run_concurrently(agent, args.requests))
+        concurrent = time.perf_counter() - t1
+
+        print("speculative                       : {}".format(speculative))
+        print("one request                       : {:.3f}s".format(single))
+        print(
+            "{} concurrent requests            : {:.3f}s".format(
+                args.requests, concurrent
+            )
+        )
+        print(
+            "throughput                        : {:.1f} requests/s".format(
+                args.requests / concurrent
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Cold start of the travel mapper entry points, measured with python -X importtime
+in a fresh interpreter each: total import time, the slowest packages and which
+of the map and UI libraries got loaded.
+
+Run from the top level directory of the travel mapper project:
+    python benchmarks/bench_import_time.py
+"""
+
+import os
+import subprocess
+import sys
+
+ENTRY_POINTS = [
+    "travel_mapper.TravelMapper",
+    "travel_mapper.batch",
+    "travel_mapper.user_interface.driver",
+]
+# imported lazily, only drawing a map or serving the UI should load them
+MAP_AND_UI_PACKAGES = ["folium", "branca", "leafmap", "geopandas", "gradio"]
+REPEATS = 3
+TOP = 8
+
+
+def import_times(module):
+    """cumulative import time in seconds of module and of each top level package it pulled in"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.getcwd()] + sys.path))
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            cumulative = int(cumulative) / 1e6
+        except ValueError:
+            # the header line
+            continue
+        name = name.strip()
+        # a module's cumulative time includes its children, keep the outermost entry
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0.0), cumulative)
+        if name == module:
+            total = cumulative
+    return total, packages
+
+
+def loaded(module):
+    code = (
+        "import sys, {}; print(' '.join(m for m in {!r} if m in sys.modules))".format(
+            module, MAP_AND_UI_PACKAGES
+        )
+    )
+    return subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split()
+
+
+def main():
+    for module in ENTRY_POINTS:
+        runs = [import_times(module) for _ in range(REPEATS)]
+        total, packages = min(runs, key=lambda run: run[0])
+        print("{} : {:.3f}s (best of {})".format(module, total, REPEATS))
+        slowest = sorted(packages.items(), key=lambda kv: -kv[1])[:TOP]
+        for package, seconds in slowest:
+            print("    {:<20} {:.3f}s".format(package, seconds))
+        print("    map / UI packages loaded : {}".format(loaded(module) or "none"))
+
+
+if __name__ == "__main__":
+    main()
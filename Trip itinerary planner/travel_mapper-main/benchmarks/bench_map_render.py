@@ -0,0 +1,114 @@
+"""
+Compares the single GeoJSON layer map renderer with the FeatureGroup, PolyLine
+and Marker per leg one it replaced: size of the generated HTML and time to
+build and render the map, on a synthetic long trip.
+
+Run from the top level directory of the travel mapper project:
+    python benchmarks/bench_map_render.py
+"""
+
+from travel_mapper.mapping.geojson import add_route_layer, map_start
+from travel_mapper.mapping.simplify import simplify_route
+from travel_mapper.routing.RouteFinder import RouteFinder
+from tests.routing.fake_maps import FakeMapsClient
+import folium
+import time
+
+N_WAYPOINTS = 40
+POINTS_PER_LEG = 2000
+SIMPLIFY_ZOOMS = [None, 13]
+REPEATS = 3
+
+
+def legacy_route_map(directions_list, route_dict, simplify_zoom):
+    # RouteMapper.generate_route_map / generate_leafmap before the GeoJSON layer
+    if simplify_zoom is not None:
+        route_dict, _ = simplify_route(route_dict, zoom=simplify_zoom)
+    map = folium.Map(location=map_start(directions_list), zoom_start=10)
+
+    marker_points = []
+    for segment in directions_list:
+        for leg in segment["legs"]:
+            leg_start_loc = leg["start_location"]
+            marker_points.append(
+                ([leg_start_loc["lat"], leg_start_loc["lng"]], leg["start_address"])
+            )
+    last_stop = directions_list[-1]["legs"][-1]
+    last_stop_coords = last_stop["end_location"]
+    marker_points.append(
+        ([last_stop_coords["lat"], last_stop_coords["lng"]], last_stop["end_address"])
+    )
+
+    for location, address in marker_points:
+        folium.Marker(
+            location=location,
+            popup=address,
+            tooltip="<strong>Click for address</strong>",
+            icon=folium.Icon(color="red", icon="info-sign"),
+        ).add_to(map)
+
+    for leg_id, route_points in route_dict.items():
+        f_group = folium.FeatureGroup("Leg {}".format(leg_id))
+        folium.vector_layers.PolyLine(
+            route_points["route"],
+            popup="<b>Route segment {}</b>".format(leg_id),
+            tooltip="Distance: {}, Duration: {}".format(
+                route_points["distance"], route_points["duration"]
+            ),
+            color="blue",
+            weight=2,
+        ).add_to(f_group)
+        f_group.add_to(map)
+    return map
+
+
+def geojson_route_map(directions_list, route_dict, simplify_zoom):
+    map = folium.Map(location=map_start(directions_list), zoom_start=10)
+    add_route_layer(map, directions_list, route_dict, simplify_zoom=simplify_zoom)
+    return map
+
+
+def render(build):
+    best, html = float("inf"), None
+    for _ in range(REPEATS):
+        t1 = time.perf_counter()
+        html = build().get_root().render()
+        best = min(best, time.perf_counter() - t1)
+    return best, len(html.encode("utf-8"))
+
+
+def main():
+    directions = FakeMapsClient(points_per_leg=POINTS_PER_LEG).directions(
+        "Los Angeles CA",
+        "New York City",
+        waypoints=["Stop {}".format(i) for i in range(N_WAYPOINTS)],
+    )
+    route = RouteFinder.sample_route_with_legs(RouteFinder.get_route(directions))
+    n_points = sum(len(leg["route"]) for leg in route.values())
+    print("{} legs, {} route points".format(len(route), n_points))
+
+    for zoom in SIMPLIFY_ZOOMS:
+        legacy_time, legacy_size = render(
+            lambda: legacy_route_map(directions, route, zoom)
+        )
+        geojson_time, geojson_size = render(
+            lambda: geojson_route_map(directions, route, zoom)
+        )
+        print("simplify zoom {}".format(zoom))
+        print(
+            "  per leg layers : {:8.1f} kB  {:.3f}s".format(
+                legacy_size / 1e3, legacy_time
+            )
+        )
+        print(
+            "  geojson layer  : {:8.1f} kB  {:.3f}s  ({:.1f}x smaller, {:.1f}x faster)".format(
+                geojson_size / 1e3,
+                geojson_time,
+                legacy_size / geojson_size,
+                legacy_time / geojson_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compares the vectorized resampler in sample_route_with_legs with the per-point
+Python loop it replaced, on a synthetic 1M point route.
+
+Run from the top level directory of the travel mapper project:
+    python benchmarks/bench_resampling.py
+"""
+
+from travel_mapper.routing.Route import Route, RouteLeg
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.resampling import resample_legs
+import numpy as np
+import time
+
+N_POINTS = 1_000_000
+N_LEGS = 20
+DISTANCE_PER_POINT_IN_KM = 0.25
+
+
+def legacy_sample_route_with_legs(route, distance_per_point_in_km=0.25):
+    # sample_route_with_legs before it was vectorized
+    all_distances = sum(
+        [float(route[i]["distance"].split(" ")[0].replace(",", "")) for i in route]
+    )
+    npoints = int(np.ceil(all_distances / distance_per_point_in_km))
+    points_per_leg = [len(v["route"]) for k, v in route.items()]
+    total_points = sum(points_per_leg)
+    n_sampled_per_leg = [
+        max(1, np.round(npoints * (x / total_points), 0)) for x in points_per_leg
+    ]
+
+    sampled_points = {}
+    for leg_id, route_info in route.items():
+        total_points = int(points_per_leg[leg_id])
+        total_sampled_points = int(n_sampled_per_leg[leg_id])
+        step_size = int(max(total_points // total_sampled_points, 1.0))
+        route_sampled = [
+            route_info["route"][idx] for idx in range(0, total_points, step_size)
+        ]
+        sampled_points[leg_id] = {
+            "route": [
+                (float(x.split(",")[0]), float(x.split(",")[1])) for x in route_sampled
+            ],
+            "duration": route_info["duration"],
+            "distance": route_info["distance"],
+        }
+    return sampled_points
+
+
+def make_route():
+    # a random walk from Los Angeles heading east, ~40 m between raw vertices
+    rng = np.random.default_rng(0)
+    steps = rng.normal(0, 1.5e-4, size=(N_POINTS, 2)) + [0.0, 4e-4]
+    coords = np.cumsum(steps, axis=0) + [34.05, -118.24]
+
+    legs = {}
+    for leg_id, leg_coords in enumerate(np.array_split(coords, N_LEGS)):
+        (distance_km,) = [
+            sum(
+                np.hypot(*np.diff(leg_coords, axis=0).T) * 111.0,
+            )
+        ]
+        legs[leg_id] = RouteLeg(
+            leg_coords,
+            distance_km * 1000,
+            3600,
+            "{:,.0f} km".format(distance_km),
+            "1 hour",
+        )
+    return Route(legs)
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - t1)
+    return min(timings), result
+
+
+def main():
+    route = make_route()
+    legacy_route = route.to_dict()
+    arrays = [route.leg(leg_id).latlng for leg_id in route]
+
+    legacy_time, legacy = best_of(
+        lambda: legacy_sample_route_with_legs(legacy_route, DISTANCE_PER_POINT_IN_KM)
+    )
+    vectorized_time, _ = best_of(
+        lambda: resample_legs(arrays, DISTANCE_PER_POINT_IN_KM)
+    )
+    end_to_end_time, sampled = best_of(
+        lambda: RouteFinder.sample_route_with_legs(route, DISTANCE_PER_POINT_IN_KM)
+    )
+
+    print("route points                      : {:,}".format(N_POINTS))
+    print(
+        "legacy per-point loop             : {:.3f}s ({:,} points)".format(
+            legacy_time, sum(len(v["route"]) for v in legacy.values())
+        )
+    )
+    print("vectorized resample_legs          : {:.3f}s".format(vectorized_time))
+    print(
+        "sample_route_with_legs (Route)    : {:.3f}s ({:,} points)".format(
+            end_to_end_time, sum(len(v["route"]) for v in sampled.values())
+        )
+    )
+    print(
+        "speedup vs legacy                 : {:.1f}x".format(
+            legacy_time / end_to_end_time
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Offline stand-in for the chat model, answering each of the Agent's prompts with a canned response"""
+
+from langchain.llms.base import LLM
+from travel_mapper.agent.Agent import Agent
+from travel_mapper.agent.LLMResponseCache import LLMResponseCache
+from typing import Any, Dict, List
+from unittest import mock
+import os
+import time
+
+VALID = '{"plan_is_valid": "yes", "updated_request": ""}'
+INVALID = '{"plan_is_valid": "no", "updated_request": "Drive to Las Vegas instead"}'
+ITINERARY = "Day 1: drive from Los Angeles to Barstow, Day 2: on to Las Vegas"
+TRIP = (
+    '{"start": "Los Angeles CA", "end": "Las Vegas NV", '
+    '"waypoints": ["Barstow CA"], "transit": "driving"}'
+)
+
+
+class FakeChatModel(LLM):
+    model_name: str = "fake-model"
+    responses: Dict[str, str] = {
+        "validation": VALID,
+        "itinerary": ITINERARY,
+        "mapping": TRIP,
+    }
+    delay: float = 0.0
+    # the chains hold copies of the model, so record calls on a shared list
+    prompts: List[Any] = []
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        kind = self.prompt_kind(prompt)
+        self.prompts.append(kind)
+        time.sleep(self.delay)
+        return self.responses[kind]
+
+    @staticmethod
+    def prompt_kind(prompt):
+        # chains may run concurrently, so answer by prompt rather than by call order
+        if "did not satisfy the constraints" in prompt:
+            return "fix"
+        if "plan_is_valid" in prompt:
+            return "validation"
+        if "list of destinations" in prompt:
+            return "mapping"
+        return "itinerary"
+
+
+def make_agent(**kwargs):
+    # the default OpenAI chains want a key while they are built, don't leave it set
+    with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-fake"}):
+        agent = Agent(
+            "sk-fake",
+            None,
+            debug=False,
+            response_cache=LLMResponseCache(db_path=None),
+            speculative=kwargs.pop("speculative", False),
+            local_trip_extraction=kwargs.pop("local_trip_extraction", False),
+        )
+    agent.chains.register(
+        agent.set_up_chains(FakeChatModel(prompts=[], **kwargs), debug=False)
+    )
+    agent.model_name = FakeChatModel.__fields__["model_name"].default
+    return agent
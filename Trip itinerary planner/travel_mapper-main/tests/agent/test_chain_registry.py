@@ -0,0 +1,74 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+from travel_mapper.agent.ChainRegistry import ChainRegistry
+from tests.agent.fake_llm import FakeChatModel, make_agent
+
+
+class TestChainRegistry(unittest.TestCase):
+    def test_builds_supported_models_once(self):
+        built = []
+
+        def build(model_name):
+            built.append(model_name)
+            if model_name == "broken":
+                raise ValueError("no API key")
+            return model_name.upper()
+
+        registry = ChainRegistry(build, model_names=["a", "b", "broken"])
+        self.assertEqual(registry.model_names, ["a", "b"])
+        self.assertEqual(registry.get("a"), "A")
+        self.assertEqual(registry.get("c"), "C")
+        self.assertEqual(registry.get("c"), "C")
+        self.assertEqual(built, ["a", "b", "broken", "c"])
+
+        with self.assertRaises(ValueError):
+            registry.get("broken")
+
+    def test_fake_agent_leaves_the_environment_alone(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("OPENAI_API_KEY", None)
+            make_agent()
+            self.assertNotIn("OPENAI_API_KEY", os.environ)
+
+    def test_requests_pick_their_model(self):
+        agent = make_agent()
+        other = FakeChatModel(model_name="other-model", prompts=[])
+        agent.chains.register(agent.set_up_chains(other, debug=False))
+        default_chains = agent.chains.get(agent.model_name)
+
+        async def run():
+            return await asyncio.gather(
+                agent.asuggest_travel("LA to Vegas"),
+                agent.asuggest_travel("LA to Vegas", "other-model"),
+            )
+
+        asyncio.run(run())
+        self.assertEqual(len(agent.chat_model.prompts), 3)
+        self.assertEqual(len(other.prompts), 3)
+        # nothing shared was switched over to the other model
+        self.assertIs(agent.chains.get(agent.model_name), default_chains)
+        self.assertEqual(agent.chat_model.model_name, "fake-model")
+
+        # results are cached per model
+        agent.suggest_travel("LA to Vegas", "other-model")
+        self.assertEqual(len(other.prompts), 3)
+
+    def test_supported_models_are_prebuilt(self):
+        agent = make_agent()
+        for model_name in ["gpt-3.5-turbo", "gpt-4"]:
+            chains = agent.chains.get(model_name)
+            self.assertEqual(chains.model_name, model_name)
+            self.assertEqual(
+                chains.validation_chain.chains[0].chain.llm_chain.llm.model_name,
+                model_name,
+            )
+
+        agent.update_model_family("gpt-4")
+        self.assertEqual(agent.chat_model.model_name, "gpt-4")
+        self.assertIs(agent.agent_chain, agent.chains.get("gpt-4").agent_chain)
+
+
+if __name__ == "__main__":
+    unittest.main()
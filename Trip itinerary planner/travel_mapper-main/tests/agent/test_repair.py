@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+from langchain.schema import OutputParserException
+from travel_mapper.agent.repair import repair_json
+from travel_mapper.agent.templates import MappingTemplate, ValidationTemplate
+from tests.agent.fake_llm import ITINERARY, TRIP, VALID, make_agent
+
+
+class TestRepairJson(unittest.TestCase):
+    def test_repairs(self):
+        expected = {"plan_is_valid": "yes", "updated_request": ""}
+        for text in [
+            'Here you go:\n```json\n{"plan_is_valid": "yes", "updated_request": "",}\n```',
+            "{'plan_is_valid': 'yes', 'updated_request': ''}",
+            '{plan_is_valid: "yes", updated_request: ""}',
+            "{“plan_is_valid”: “yes”, “updated_request”: “”}",
+        ]:
+            self.assertEqual(repair_json(text), expected, text)
+
+    def test_key_value_lines(self):
+        text = (
+            "Start: Buckingham Palace, The Mall, London SW1A 1AA\n"
+            "End: Tower Bridge, Tower Bridge Rd, London SE1 2UP\n"
+            'Waypoints: ["Tower of London, Tower Hill", "Covent Garden",]\n'
+            "Transit: driving"
+        )
+        trip = MappingTemplate().parser.parse(text)
+        self.assertEqual(trip.start, "Buckingham Palace, The Mall, London SW1A 1AA")
+        self.assertEqual(
+            trip.waypoints, ["Tower of London, Tower Hill", "Covent Garden"]
+        )
+        self.assertEqual(trip.transit, "driving")
+
+    def test_unrepairable(self):
+        with self.assertRaises(ValueError):
+            repair_json("I can't help with that")
+        with self.assertRaises(OutputParserException):
+            ValidationTemplate().parser.parse("I can't help with that")
+
+    def test_coercions(self):
+        parser = ValidationTemplate().parser
+        for answer, expected in [(0, "no"), ("1", "yes"), (True, "yes"), ("No.", "no")]:
+            validation = parser.parse(
+                '{"plan_is_valid": %s, "updated_request": ""}'
+                % ('"%s"' % answer if isinstance(answer, str) else str(answer).lower())
+            )
+            self.assertEqual(validation.plan_is_valid, expected)
+
+        trip = MappingTemplate().parser.parse(
+            '{"start": "A", "end": "B", "waypoints": "C; D", "transit": "driving"}'
+        )
+        self.assertEqual(trip.waypoints, ["C", "D"])
+
+
+class TestReask(unittest.TestCase):
+    def test_local_repair_needs_no_extra_call(self):
+        responses = {
+            "validation": "```{'plan_is_valid': 1, 'updated_request': '',}```",
+            "itinerary": ITINERARY,
+            "mapping": TRIP,
+        }
+        agent = make_agent(responses=responses)
+        _, list_of_places, validation = agent.suggest_travel("LA to Vegas")
+
+        self.assertEqual(validation["validation_output"].plan_is_valid, "yes")
+        self.assertEqual(list_of_places["end"], "Las Vegas NV")
+        self.assertEqual(len(agent.chat_model.prompts), 3)
+
+    def test_reasks_only_the_failing_chain(self):
+        responses = {
+            "validation": "Looks like a great trip!",
+            "fix": VALID,
+            "itinerary": ITINERARY,
+            "mapping": TRIP,
+        }
+        for suggest in (
+            lambda agent: agent.suggest_travel("LA to Vegas"),
+            lambda agent: asyncio.run(agent.asuggest_travel("LA to Vegas")),
+        ):
+            agent = make_agent(responses=responses)
+            _, _, validation = suggest(agent)
+
+            self.assertEqual(validation["validation_output"].plan_is_valid, "yes")
+            self.assertEqual(
+                sorted(agent.chat_model.prompts),
+                ["fix", "itinerary", "mapping", "validation"],
+            )
+
+    def test_gives_up_after_reasking(self):
+        responses = {
+            "validation": "Looks like a great trip!",
+            "fix": "Still looks great!",
+            "itinerary": ITINERARY,
+            "mapping": TRIP,
+        }
+        agent = make_agent(responses=responses)
+        with self.assertRaises(OutputParserException):
+            agent.suggest_travel("LA to Vegas")
+
+
+if __name__ == "__main__":
+    unittest.main()
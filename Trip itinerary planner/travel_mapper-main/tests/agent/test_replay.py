@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from travel_mapper.agent.Agent import Agent, has_native_async
+from travel_mapper.agent.LLMResponseCache import LLMResponseCache
+from travel_mapper.agent.ReplayChatModel import ReplayChatModel
+from tests.agent.fake_llm import ITINERARY, FakeChatModel, make_agent
+
+QUERY = "2 day road trip from LA to Las Vegas"
+
+
+def make_replay_agent(chat_model, **kwargs):
+    return Agent(
+        "sk-fake",
+        None,
+        debug=False,
+        response_cache=LLMResponseCache(db_path=None),
+        speculative=kwargs.pop("speculative", False),
+        local_trip_extraction=False,
+        chat_models={"gpt-3.5-turbo": chat_model},
+        **kwargs
+    )
+
+
+class TestReplayChatModel(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fixture_path = os.path.join(self.tmp_dir.name, "gpt-3.5-turbo.json")
+
+        self.recorder = FakeChatModel(model_name="gpt-3.5-turbo", prompts=[])
+        recording = ReplayChatModel.from_fixture(
+            self.fixture_path, recorder=self.recorder
+        )
+        self.recorded = make_replay_agent(recording).suggest_travel(QUERY)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_replay_runs_natively_async(self):
+        replay = ReplayChatModel.from_fixture(self.fixture_path)
+        self.assertTrue(has_native_async(replay))
+        # only implements _call, its async calls are langchain's defaults
+        self.assertFalse(has_native_async(self.recorder))
+
+    def test_record_then_replay(self):
+        self.assertEqual(len(self.recorder.prompts), 3)
+        with open(self.fixture_path) as f:
+            fixture = json.load(f)
+        self.assertEqual(fixture["model_name"], "gpt-3.5-turbo")
+        self.assertEqual(len(fixture["recordings"]), 3)
+
+        replay = ReplayChatModel.from_fixture(self.fixture_path)
+        for suggest in (
+            lambda agent: agent.suggest_travel(QUERY),
+            lambda agent: asyncio.run(agent.asuggest_travel(QUERY)),
+        ):
+            replayed = suggest(make_replay_agent(replay, speculative=True))
+            self.assertEqual(replayed[:2], self.recorded[:2])
+            self.assertEqual(
+                replayed[2]["validation_output"], self.recorded[2]["validation_output"]
+            )
+        self.assertEqual(len(self.recorder.prompts), 3)
+
+    def test_unrecorded_prompt(self):
+        agent = make_replay_agent(ReplayChatModel.from_fixture(self.fixture_path))
+        with self.assertRaises(KeyError):
+            agent.suggest_travel("a week in Lisbon")
+
+        with self.assertRaises(FileNotFoundError):
+            ReplayChatModel.from_fixture(self.fixture_path + ".missing")
+
+    def test_latency_and_concurrency(self):
+        replay = ReplayChatModel.from_fixture(
+            self.fixture_path, latency=0.2, jitter=0.05
+        )
+        agent = make_replay_agent(replay)
+
+        async def run():
+            # replay is natively async, the requests don't queue for threads
+            return await asyncio.gather(
+                *[agent._asuggest_travel(QUERY, agent.chains.get("gpt-3.5-turbo"))] * 20
+            )
+
+        t0 = time.time()
+        results = asyncio.run(run())
+        elapsed = time.time() - t0
+
+        # three calls of 0.15 to 0.25s each, for every request at once
+        self.assertGreater(elapsed, 0.45)
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual({result[0] for result in results}, {ITINERARY})
+
+    def test_streams_replayed_itinerary(self):
+        agent = make_replay_agent(ReplayChatModel.from_fixture(self.fixture_path))
+
+        async def run():
+            return [event async for event in agent.astream_travel(QUERY)]
+
+        tokens = [value for kind, value in asyncio.run(run()) if kind == "token"]
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual("".join(tokens), ITINERARY)
+
+
+if __name__ == "__main__":
+    unittest.main()
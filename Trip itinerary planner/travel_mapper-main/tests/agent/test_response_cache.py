@@ -0,0 +1,37 @@
+import asyncio
+import unittest
+from travel_mapper.agent.LLMResponseCache import LLMResponseCache
+from tests.agent.fake_llm import make_agent
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_repeated_query_is_served_from_cache(self):
+        agent = make_agent()
+        first = agent.suggest_travel("2 day trip from LA to Las Vegas")
+        self.assertEqual(len(agent.chat_model.prompts), 3)
+
+        second = agent.suggest_travel("  2 day trip from la to Las Vegas. ")
+        self.assertEqual(len(agent.chat_model.prompts), 3)
+        self.assertEqual(first[:2], second[:2])
+        self.assertEqual(first[2]["validation_output"], second[2]["validation_output"])
+        self.assertEqual(agent.response_cache.stats()["memory_hits"], 1)
+        self.assertEqual(agent.response_cache.stats()["misses"], 1)
+
+    def test_async_shares_the_cache(self):
+        agent = make_agent()
+        itinerary, list_of_places, _ = agent.suggest_travel("LA to Vegas")
+        list_of_places["waypoints"].append("somewhere")
+
+        cached = asyncio.run(agent.asuggest_travel("LA to Vegas"))
+        self.assertEqual(cached[0], itinerary)
+        self.assertEqual(cached[1]["waypoints"], ["Barstow CA"])
+
+    def test_key_depends_on_model_and_templates(self):
+        cache = LLMResponseCache(db_path=None)
+        self.assertNotEqual(cache.key("a", "v1", "q"), cache.key("b", "v1", "q"))
+        self.assertNotEqual(cache.key("a", "v1", "q"), cache.key("a", "v2", "q"))
+        self.assertEqual(cache.key("a", "v1", "Q "), cache.key("a", "v1", "q"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import asyncio
+import time
+import unittest
+from tests.agent.fake_llm import INVALID, ITINERARY, TRIP, make_agent
+
+
+class TestSpeculativeAgent(unittest.TestCase):
+    def test_matches_serial_agent(self):
+        serial = make_agent().suggest_travel("LA to Vegas")
+        speculative = make_agent(speculative=True).suggest_travel("LA to Vegas")
+
+        self.assertEqual(serial[:2], speculative[:2])
+        self.assertEqual(
+            serial[2]["validation_output"], speculative[2]["validation_output"]
+        )
+
+    def test_validation_and_itinerary_overlap(self):
+        for suggest in (
+            lambda agent: agent.suggest_travel("LA to Vegas"),
+            lambda agent: asyncio.run(agent.asuggest_travel("LA to Vegas")),
+        ):
+            agent = make_agent(speculative=True, delay=0.3)
+            t0 = time.time()
+            itinerary, list_of_places, _ = suggest(agent)
+
+            # validation, itinerary and mapping each take 0.3s, serially 0.9s
+            self.assertLess(time.time() - t0, 0.8)
+            self.assertEqual(itinerary, ITINERARY)
+            self.assertEqual(list_of_places["end"], "Las Vegas NV")
+
+    def test_invalid_query_discards_itinerary(self):
+        responses = {"validation": INVALID, "itinerary": ITINERARY, "mapping": TRIP}
+        for suggest in (
+            lambda agent: agent.suggest_travel("walk to the moon"),
+            lambda agent: asyncio.run(agent.asuggest_travel("walk to the moon")),
+        ):
+            agent = make_agent(speculative=True, responses=responses, delay=0.1)
+            itinerary, list_of_places, validation_result = suggest(agent)
+
+            self.assertIsNone(itinerary)
+            self.assertIsNone(list_of_places)
+            self.assertEqual(validation_result["validation_output"].plan_is_valid, "no")
+            # only the itinerary was started ahead of validation, never the mapping
+            agent._speculation_executor.shutdown(wait=True)
+            self.assertNotIn("mapping", agent.chat_model.prompts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+from travel_mapper.agent.Agent import TokenQueueHandler
+from tests.agent.fake_llm import INVALID, ITINERARY, TRIP, make_agent
+
+
+def collect(agent, query):
+    async def run():
+        return [event async for event in agent.astream_travel(query)]
+
+    return asyncio.run(run())
+
+
+class TestStreaming(unittest.TestCase):
+    def test_stream_ends_with_the_suggestion(self):
+        events = collect(make_agent(), "LA to Vegas")
+        kinds = [kind for kind, _ in events]
+
+        self.assertEqual(sorted(kinds[:-1]), ["token", "validation"])
+        self.assertEqual(kinds[-1], "result")
+        tokens = "".join(value for kind, value in events if kind == "token")
+        self.assertEqual(tokens, ITINERARY)
+
+        expected = make_agent().suggest_travel("LA to Vegas")
+        itinerary, list_of_places, validation_result = events[-1][1]
+        self.assertEqual((itinerary, list_of_places), expected[:2])
+        self.assertEqual(
+            validation_result["validation_output"], expected[2]["validation_output"]
+        )
+
+    def test_invalid_query_stops_after_validation(self):
+        responses = {"validation": INVALID, "itinerary": ITINERARY, "mapping": TRIP}
+        agent = make_agent(responses=responses, delay=0.1)
+        events = collect(agent, "walk to the moon")
+
+        self.assertEqual([kind for kind, _ in events], ["validation", "result"])
+        self.assertEqual(events[-1][1][:2], (None, None))
+
+    def test_streamed_result_is_cached(self):
+        agent = make_agent()
+        collect(agent, "LA to Vegas")
+        calls = len(agent.chat_model.prompts)
+
+        events = collect(agent, "LA to Vegas")
+        self.assertEqual(len(agent.chat_model.prompts), calls)
+        self.assertEqual(events[-1][1][0], ITINERARY)
+
+    def test_token_handler_feeds_queue(self):
+        async def run():
+            queue = asyncio.Queue()
+            handler = TokenQueueHandler(queue)
+            for token in ["Day", " 1"]:
+                await handler.on_llm_new_token(token)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(run()), ["Day", " 1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
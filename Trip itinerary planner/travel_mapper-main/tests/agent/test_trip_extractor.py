@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from travel_mapper.agent.TripExtractor import TripExtractor
+from travel_mapper.constants import LOCAL_TRIP_MIN_CONFIDENCE
+from tests.agent.fake_llm import VALID, TRIP, make_agent
+
+LONDON = """
+Itinerary for a 2-day driving trip within London:
+- Day 1:
+  - Start at Buckingham Palace (The Mall, London SW1A 1AA)
+  - Visit the Tower of London (Tower Hill, London EC3N 4AB)
+  - Have lunch at a local pub
+  - End the day at Covent Garden (Covent Garden, London WC2E 8RF)
+- Day 2:
+  - Explore the Natural History Museum (Cromwell Rd, Kensington, London SW7 5BD)
+  - End the trip at the Tower Bridge (Tower Bridge Rd, London SE1 2UP)
+"""
+
+COAST = """Here is your 3 day itinerary:
+
+**Start location:** San Francisco, CA
+**End location:** Los Angeles, CA
+**Mode of transportation:** Car
+
+- Day 1: Drive from San Francisco to Monterey, CA (approx 2 hours).
+- Day 2: Continue along Highway 1 to Big Sur and stop at McWay Falls. Stay overnight in San Luis Obispo.
+- Day 3: Drive to Santa Barbara for lunch, then on to Los Angeles in the evening.
+"""
+
+
+class TestTripExtractor(unittest.TestCase):
+    def setUp(self):
+        self.extractor = TripExtractor()
+
+    def test_places_with_addresses(self):
+        trip, confidence = self.extractor.extract(LONDON)
+
+        self.assertEqual(trip.start, "Buckingham Palace, The Mall, London SW1A 1AA")
+        self.assertEqual(trip.end, "Tower Bridge, Tower Bridge Rd, London SE1 2UP")
+        self.assertEqual(
+            trip.waypoints,
+            [
+                "Tower of London, Tower Hill, London EC3N 4AB",
+                "Covent Garden, Covent Garden, London WC2E 8RF",
+                "Natural History Museum, Cromwell Rd, Kensington, London SW7 5BD",
+            ],
+        )
+        self.assertEqual(trip.transit, "driving")
+        # start and end aren't labelled, the mapping LLM has the last word
+        self.assertLess(confidence, LOCAL_TRIP_MIN_CONFIDENCE)
+
+    def test_labelled_start_end_and_transit(self):
+        trip, confidence = self.extractor.extract(COAST)
+
+        self.assertEqual(
+            (trip.start, trip.end), ("San Francisco, CA", "Los Angeles, CA")
+        )
+        self.assertEqual(
+            trip.waypoints,
+            [
+                "Monterey, CA",
+                "Big Sur",
+                "McWay Falls",
+                "San Luis Obispo",
+                "Santa Barbara",
+            ],
+        )
+        self.assertEqual(confidence, 1.0)
+
+    def test_transit_keywords(self):
+        self.assertEqual(
+            TripExtractor.transit_of(
+                None, "Fly to Paris, then take the train to Lyon by train"
+            ),
+            ("train", True),
+        )
+        self.assertEqual(TripExtractor.transit_of("Plane", "drive"), ("flight", True))
+        # a tie is ambiguous
+        self.assertFalse(TripExtractor.transit_of(None, "fly, then drive")[1])
+        self.assertEqual(TripExtractor.transit_of(None, "walk"), (None, False))
+
+    def test_no_places_or_unclear_transit(self):
+        self.assertEqual(self.extractor.extract("Have a great time!"), (None, 0.0))
+
+        trip, confidence = self.extractor.extract(
+            "Day 1: from Paris to Lyon\nDay 2: continue to Marseille"
+        )
+        self.assertEqual(trip.waypoints, ["Lyon"])
+        self.assertLess(confidence, LOCAL_TRIP_MIN_CONFIDENCE)
+
+    def test_unlabelled_ends_are_not_trusted(self):
+        trip, confidence = self.extractor.extract(
+            "Day 1: Drive from San Francisco to Monterey along the coast.\n"
+            "Day 2: Drive on to Big Sur and finish in Los Angeles. "
+            "Enjoy dinner at The Ivy.\n"
+            "Refer to the guide in Appendix A."
+        )
+        # the last capitalised words are taken for the end
+        self.assertEqual(trip.end, "Appendix A")
+        self.assertLess(confidence, LOCAL_TRIP_MIN_CONFIDENCE)
+
+
+class TestAgentTripExtraction(unittest.TestCase):
+    def test_mapping_llm_is_skipped_when_confident(self):
+        responses = {"validation": VALID, "itinerary": COAST, "mapping": TRIP}
+        agent = make_agent(responses=responses, local_trip_extraction=True)
+
+        itinerary, list_of_places, _ = agent.suggest_travel("SF to LA along the coast")
+        self.assertEqual(itinerary, COAST)
+        self.assertEqual(list_of_places["start"], "San Francisco, CA")
+        self.assertNotIn("mapping", agent.chat_model.prompts)
+        self.assertEqual(agent.trip_extractor.counts, {"local": 1, "fallback": 0})
+
+    def test_falls_back_to_mapping_llm(self):
+        responses = {"validation": VALID, "itinerary": "Have fun!", "mapping": TRIP}
+        agent = make_agent(responses=responses, local_trip_extraction=True)
+
+        _, list_of_places, _ = asyncio.run(agent.asuggest_travel("LA to Vegas"))
+        self.assertEqual(list_of_places["start"], "Los Angeles CA")
+        self.assertIn("mapping", agent.chat_model.prompts)
+        self.assertEqual(agent.trip_extractor.counts, {"local": 0, "fallback": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from travel_mapper.caching.SingleFlight import SingleFlight
+from travel_mapper.caching.TieredCache import TieredCache
+
+
+class SlowFunction(object):
+    def __init__(self, result="result", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.2)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    async def acall(self):
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        single_flight = SingleFlight()
+        fn = SlowFunction()
+        with ThreadPoolExecutor(8) as executor:
+            results = list(
+                executor.map(lambda _: single_flight.do("key", fn), range(8))
+            )
+
+        self.assertEqual(results, ["result"] * 8)
+        self.assertEqual(fn.calls, 1)
+        self.assertEqual(single_flight.stats()["coalesced"], 7)
+        self.assertEqual(single_flight.stats()["in_flight"], 0)
+
+    def test_errors_are_shared_and_not_kept(self):
+        single_flight = SingleFlight()
+        fn = SlowFunction(error=ValueError("boom"))
+
+        def call(_):
+            try:
+                return single_flight.do("key", fn)
+            except ValueError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual(list(executor.map(call, range(4))), ["boom"] * 4)
+        self.assertEqual(fn.calls, 1)
+
+        # the next call runs again
+        self.assertEqual(single_flight.do("key", SlowFunction("again")), "again")
+
+    def test_different_keys_run_separately(self):
+        single_flight = SingleFlight()
+        fn = SlowFunction()
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(lambda key: single_flight.do(key, fn), ["a", "b"]))
+        self.assertEqual(fn.calls, 2)
+
+    def test_async_calls_share_one_execution(self):
+        single_flight = SingleFlight()
+        fn = SlowFunction()
+
+        async def run():
+            return await asyncio.gather(
+                *[single_flight.ado("key", fn.acall) for _ in range(5)]
+            )
+
+        self.assertEqual(asyncio.run(run()), ["result"] * 5)
+        self.assertEqual(fn.calls, 1)
+
+    def test_cancelled_leader_leaves_the_call_running(self):
+        single_flight = SingleFlight()
+        fn = SlowFunction()
+
+        async def run():
+            leader = asyncio.ensure_future(single_flight.ado("key", fn.acall))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(single_flight.ado("key", fn.acall))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            result = await waiter
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return result
+
+        self.assertEqual(asyncio.run(run()), "result")
+        self.assertEqual(fn.calls, 1)
+        self.assertEqual(single_flight.stats()["in_flight"], 0)
+
+    def test_cache_misses_are_coalesced(self):
+        cache = TieredCache("coalesced", db_path=None)
+        fn = SlowFunction(result=[1, 2, 3])
+        with ThreadPoolExecutor(4) as executor:
+            results = list(
+                executor.map(lambda _: cache.get_or_compute("key", fn), range(4))
+            )
+
+        self.assertEqual(results, [[1, 2, 3]] * 4)
+        self.assertEqual(fn.calls, 1)
+        self.assertEqual(cache.stats()["coalesced"], 3)
+        self.assertEqual(cache.get("key"), [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import folium
+from travel_mapper.mapping.geojson import add_route_layer, route_geojson, stops_of
+from travel_mapper.routing.RouteFinder import RouteFinder
+from tests.routing.fake_maps import FakeMapsClient
+
+
+class TestGeoJSON(unittest.TestCase):
+    def setUp(self):
+        self.directions = FakeMapsClient(points_per_leg=300).directions(
+            "Los Angeles CA", "Las Vegas NV", waypoints=["Barstow CA"]
+        )
+        self.sampled_route = RouteFinder.sample_route_with_legs(
+            RouteFinder.get_route(self.directions)
+        )
+
+    def test_one_feature_per_leg_and_stop(self):
+        collection = route_geojson(self.directions, self.sampled_route, precision=4)
+        lines = [
+            f for f in collection["features"] if f["geometry"]["type"] == "LineString"
+        ]
+        points = [f for f in collection["features"] if f["geometry"]["type"] == "Point"]
+
+        self.assertEqual(len(lines), len(self.sampled_route))
+        self.assertEqual(
+            [f["properties"]["label"] for f in points],
+            ["Los Angeles CA", "Barstow CA", "Las Vegas NV"],
+        )
+        for line, (leg_id, leg) in zip(lines, self.sampled_route.items()):
+            self.assertEqual(line["properties"]["leg"], leg_id)
+            self.assertEqual(line["properties"]["distance"], leg["distance"])
+            self.assertEqual(len(line["geometry"]["coordinates"]), len(leg["route"]))
+            # GeoJSON is lng, lat
+            lat, lng = leg["route"][0]
+            self.assertEqual(
+                line["geometry"]["coordinates"][0], [round(lng, 4), round(lat, 4)]
+            )
+
+    def test_stops(self):
+        stops = stops_of(self.directions)
+        self.assertEqual(len(stops), 3)
+        self.assertEqual(stops[-1][1], "Las Vegas NV")
+
+    def test_single_layer(self):
+        map = folium.Map(location=[35, -115])
+        report = add_route_layer(
+            map, self.directions, self.sampled_route, simplify_zoom=13
+        )
+
+        layers = [
+            child
+            for child in map._children.values()
+            if not isinstance(child, folium.TileLayer)
+        ]
+        self.assertEqual([type(layer) for layer in layers], [folium.GeoJson])
+        self.assertLess(report["points_after"], report["points_before"])
+        html = map.get_root().render()
+        self.assertIn("Barstow CA", html)
+        self.assertNotIn("PolyLine", html)
+
+
+if __name__ == "__main__":
+    unittest.main()
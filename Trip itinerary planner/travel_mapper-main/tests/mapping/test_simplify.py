@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from travel_mapper.mapping.RouteMapper import RouteMapper
+from travel_mapper.mapping.simplify import (
+    douglas_peucker,
+    simplify_route,
+    zoom_tolerance_m,
+)
+from travel_mapper.routing.RouteFinder import RouteFinder
+from tests.routing.fake_maps import FakeMapsClient
+
+
+class TestSimplify(unittest.TestCase):
+    def setUp(self):
+        self.directions = FakeMapsClient(points_per_leg=300).directions(
+            "Los Angeles CA", "Las Vegas NV", waypoints=["Barstow CA"]
+        )
+        self.sampled_route = RouteFinder.sample_route_with_legs(
+            RouteFinder.get_route(self.directions)
+        )
+
+    def test_straight_line_collapses_to_endpoints(self):
+        points = np.column_stack(
+            [np.linspace(36, 37, 100), np.linspace(-115, -114, 100)]
+        )
+        self.assertEqual(douglas_peucker(points, 1.0).tolist(), [0, 99])
+
+    def test_keeps_detail_above_tolerance(self):
+        points = np.array([[36.0, -115.0], [36.01, -114.5], [36.0, -114.0]])
+        # the middle point is ~1.1 km off the straight line
+        self.assertEqual(douglas_peucker(points, 100.0).tolist(), [0, 1, 2])
+        self.assertEqual(douglas_peucker(points, 2000.0).tolist(), [0, 2])
+
+    def test_zoom_tolerance(self):
+        self.assertAlmostEqual(zoom_tolerance_m(0), 156543.03392)
+        self.assertAlmostEqual(zoom_tolerance_m(1, latitude=60), 156543.03392 / 4)
+
+    def test_simplify_route_preserves_leg_endpoints(self):
+        simplified, report = simplify_route(self.sampled_route, zoom=13)
+
+        self.assertEqual(simplified.keys(), self.sampled_route.keys())
+        for leg_id, leg in self.sampled_route.items():
+            self.assertEqual(simplified[leg_id]["route"][0], leg["route"][0])
+            self.assertEqual(simplified[leg_id]["route"][-1], leg["route"][-1])
+            self.assertEqual(simplified[leg_id]["distance"], leg["distance"])
+
+        self.assertLess(report["points_after"], report["points_before"])
+        self.assertLess(report["bytes_after"], report["bytes_before"])
+
+    def test_route_mapper_reports_reduction(self):
+        mapper = RouteMapper()
+        mapper.save_map = False
+        mapper.generate_route_map(self.directions, self.sampled_route, simplify_zoom=13)
+        self.assertIsNotNone(mapper.map)
+        self.assertLess(
+            mapper.simplification_report["points_after"],
+            mapper.simplification_report["points_before"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+
+
+class TestGeocodeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "geocode.sqlite")
+        self.cache = GeocodeCache(db_path=self.db_path, max_size=2, ttl=60)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_normalized_keys_share_entry(self):
+        self.cache.set("Los Angeles,CA.", [{"place_id": "la"}])
+        self.assertEqual(self.cache.get("  los angeles, ca "), [{"place_id": "la"}])
+        self.assertEqual(self.cache.stats()["memory_hits"], 1)
+
+    def test_lru_eviction_falls_back_to_disk(self):
+        for name in ["a", "b", "c"]:
+            self.cache.set(name, [{"place_id": name}])
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["memory_size"], 2)
+
+        # "a" was evicted from memory but is still in the sqlite store
+        self.assertEqual(self.cache.get("a"), [{"place_id": "a"}])
+        self.assertEqual(self.cache.stats()["disk_hits"], 1)
+
+    def test_shared_between_instances(self):
+        self.cache.set("Zion National Park", [{"place_id": "zion"}])
+        other = GeocodeCache(db_path=self.db_path)
+        self.assertEqual(other.get("zion national park"), [{"place_id": "zion"}])
+
+    def test_ttl_expiry(self):
+        self.cache.set("Las Vegas NV", [{"place_id": "lv"}], ttl=-1)
+        self.assertIsNone(self.cache.get("Las Vegas NV"))
+        stats = self.cache.stats()
+        self.assertEqual(stats["expired"], 2)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_get_or_compute_skips_empty_results(self):
+        calls = []
+
+        def geocode():
+            calls.append(1)
+            return []
+
+        self.assertEqual(self.cache.get_or_compute("nowhere", geocode), [])
+        self.assertEqual(self.cache.get_or_compute("nowhere", geocode), [])
+        self.assertEqual(len(calls), 2)
+
+        self.assertEqual(
+            self.cache.get_or_compute("somewhere", lambda: [{"place_id": "x"}]),
+            [{"place_id": "x"}],
+        )
+        self.assertEqual(
+            self.cache.get_or_compute("somewhere", lambda: time.sleep(10)),
+            [{"place_id": "x"}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+from functools import partial
+from unittest import mock
+import json
+import numpy as np
+import os
+import sqlite3
+import tempfile
+import unittest
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.GraphBackend import GraphBackend
+from travel_mapper.routing.RouteFinder import RouteFinder
+from tests.routing.fake_maps import FakeMapsClient
+
+
+def grid_graph(size=10):
+    # size x size grid of roads 0.1 degrees apart, with a slow diagonal shortcut
+    nodes = {
+        "{}_{}".format(i, j): [34.0 + 0.1 * i, -118.0 + 0.1 * j]
+        for i in range(size)
+        for j in range(size)
+    }
+    edges = []
+    for i in range(size):
+        for j in range(size):
+            if i + 1 < size:
+                edges.append(
+                    ["{}_{}".format(i, j), "{}_{}".format(i + 1, j), 11100, 600]
+                )
+            if j + 1 < size:
+                edges.append(
+                    ["{}_{}".format(i, j), "{}_{}".format(i, j + 1), 9200, 500]
+                )
+    places = {
+        "Los Angeles CA": "0_0",
+        "Barstow CA": "5_5",
+        "Las Vegas NV": "{0}_{0}".format(size - 1),
+    }
+    return {"nodes": nodes, "edges": edges, "places": places}
+
+
+class TestGraphBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "graph.json")
+        with open(path, "w") as f:
+            json.dump(grid_graph(), f)
+        self.backend = GraphBackend.from_file(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_geocode(self):
+        (result,) = self.backend.geocode("  los angeles ca ")
+        self.assertEqual(result["place_id"], "node:0_0")
+        self.assertEqual(result["formatted_address"], "Los Angeles CA")
+        self.assertEqual(result["geometry"]["location"], {"lat": 34.0, "lng": -118.0})
+
+        self.assertEqual(
+            self.backend.geocode("34.31,-117.69")[0]["place_id"], "node:3_3"
+        )
+        self.assertEqual(self.backend.geocode("Atlantis"), [])
+
+    def test_directions_shape(self):
+        (route,) = self.backend.directions(
+            "place_id:node:0_0", "Las Vegas NV", waypoints=["place_id:node:5_5"]
+        )
+        self.assertEqual(len(route["legs"]), 2)
+        leg = route["legs"][0]
+        self.assertEqual(leg["start_address"], "Los Angeles CA")
+        self.assertEqual(leg["end_address"], "Barstow CA")
+        # 5 steps north and 5 steps east on the grid
+        self.assertEqual(leg["distance"]["value"], 5 * 11100 + 5 * 9200)
+        self.assertEqual(leg["duration"]["value"], 5 * 600 + 5 * 500)
+        self.assertEqual(self.backend.directions("Los Angeles CA", "Atlantis"), [])
+
+    def test_route_finder_runs_offline(self):
+        route_finder = RouteFinder(
+            geocode_cache=GeocodeCache(db_path=None),
+            directions_cache=DirectionsCache(db_path=None),
+            backend=self.backend,
+        )
+        trip = {
+            "start": "Los Angeles CA",
+            "end": "Las Vegas NV",
+            "waypoints": ["Barstow CA"],
+            "transit": "driving",
+        }
+        directions, sampled_route, mapping_dict = route_finder.build_route_segments(
+            trip, verbose=False
+        )
+        self.assertEqual(len(sampled_route), 2)
+        self.assertEqual(mapping_dict["waypoint_0"]["place_id"], "node:5_5")
+        np.testing.assert_allclose(sampled_route[1]["route"][-1], (34.9, -117.1))
+
+    def test_backends_never_share_cached_answers(self):
+        trip = {
+            "start": "Los Angeles CA",
+            "end": "Las Vegas NV",
+            "waypoints": ["Barstow CA"],
+            "transit": "driving",
+        }
+
+        class GoogleLike(FakeMapsClient):
+            cache_namespace = "google_maps"
+
+        # both backends use the default caches, in one cache directory
+        geocode_path = os.path.join(self.tmp_dir.name, "geocode.sqlite")
+        directions_path = os.path.join(self.tmp_dir.name, "directions.sqlite")
+        with mock.patch(
+            "travel_mapper.routing.RouteFinder.GeocodeCache",
+            partial(GeocodeCache, db_path=geocode_path),
+        ), mock.patch(
+            "travel_mapper.routing.RouteFinder.DirectionsCache",
+            partial(DirectionsCache, db_path=directions_path),
+        ):
+            RouteFinder(backend=self.backend).build_route_segments(trip, verbose=False)
+            google = RouteFinder(backend=GoogleLike())
+            _, _, mapping_dict = google.build_route_segments(trip, verbose=False)
+            # the road graph's answers weren't read back
+            self.assertEqual(google.backend.calls, {"geocode": 3, "directions": 1})
+            self.assertEqual(mapping_dict["waypoint_0"]["place_id"], "barstow_ca")
+
+            # while its own answers are shared across instances
+            again = RouteFinder(backend=GoogleLike())
+            again.build_route_segments(trip, verbose=False)
+            self.assertEqual(again.backend.calls, {"geocode": 0, "directions": 0})
+
+        with sqlite3.connect(geocode_path) as conn:
+            tables = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table'"
+                )
+            ]
+        self.assertEqual(tables, ["geocode_google_maps"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import timedelta
+import time
+import unittest
+from googlemaps.exceptions import ApiError, HTTPError
+from travel_mapper.constants import MAPS_CLIENT_RETRY_TIMEOUT
+from travel_mapper.routing.KeyPool import KeyPool, TokenBucket
+from travel_mapper.routing.RoutingBackend import GoogleMapsBackend
+
+
+class FlakyRequest(object):
+    """Fails with the given errors before succeeding, recording the keys used"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.keys = []
+
+    def __call__(self, key):
+        self.keys.append(key)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+    async def acall(self, key):
+        return self(key)
+
+
+def make_pool(keys="AIza-a, AIza-b", **kwargs):
+    kwargs.setdefault("queries_per_second", 1000)
+    return KeyPool(keys, base_delay=0, max_delay=0, **kwargs)
+
+
+class TestKeyPool(unittest.TestCase):
+    def test_comma_separated_keys_used_round_robin(self):
+        pool = make_pool()
+        request = FlakyRequest([])
+        for _ in range(4):
+            pool.call(request)
+
+        self.assertEqual(request.keys, ["AIza-a", "AIza-b", "AIza-a", "AIza-b"])
+        self.assertEqual(
+            [counters["requests"] for counters in pool.usage().values()], [2, 2]
+        )
+
+    def test_quota_errors_are_retried_on_the_next_key(self):
+        pool = make_pool()
+        request = FlakyRequest([ApiError("OVER_QUERY_LIMIT"), HTTPError(503)])
+
+        self.assertEqual(pool.call(request), "ok")
+        self.assertEqual(request.keys, ["AIza-a", "AIza-b", "AIza-a"])
+        usage = pool.usage()
+        self.assertEqual(usage["key_0 (...za-a)"]["over_query_limit"], 1)
+        self.assertEqual(usage["key_1 (...za-b)"]["retried"], 1)
+
+    def test_other_errors_are_raised_straight_away(self):
+        pool = make_pool()
+        request = FlakyRequest([ApiError("REQUEST_DENIED")])
+
+        with self.assertRaises(ApiError):
+            pool.call(request)
+        self.assertEqual(len(request.keys), 1)
+
+    def test_gives_up_after_max_retries(self):
+        pool = make_pool(max_retries=2)
+        request = FlakyRequest([ApiError("OVER_QUERY_LIMIT")] * 5)
+
+        with self.assertRaises(ApiError):
+            pool.call(request)
+        self.assertEqual(len(request.keys), 3)
+
+    def test_async_calls_are_retried(self):
+        pool = make_pool()
+        request = FlakyRequest([ApiError("OVER_QUERY_LIMIT")])
+
+        self.assertEqual(asyncio.run(pool.acall(request.acall)), "ok")
+        self.assertEqual(len(request.keys), 2)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=200, burst=1)
+        t0 = time.monotonic()
+        for _ in range(21):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - t0, 0.09)
+
+    def test_backend_has_a_client_per_key(self):
+        backend = GoogleMapsBackend("AIza-a,AIza-b")
+        self.assertEqual(sorted(backend.clients), ["AIza-a", "AIza-b"])
+        self.assertIs(backend.async_gmaps.key_pool, backend.key_pool)
+
+    def test_clients_leave_retries_to_the_key_pool(self):
+        backend = GoogleMapsBackend("AIza-a,AIza-b")
+        for client in backend.clients.values():
+            self.assertFalse(client.retry_over_query_limit)
+            self.assertEqual(
+                client.retry_timeout, timedelta(seconds=MAPS_CLIENT_RETRY_TIMEOUT)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
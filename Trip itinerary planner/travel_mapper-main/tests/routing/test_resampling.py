@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from travel_mapper.routing.resampling import haversine_km, resample_legs
+
+
+def spacing_km(points):
+    return haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+
+
+class TestResampling(unittest.TestCase):
+    def test_fixed_spacing_regardless_of_vertex_density(self):
+        # a dense "city" section followed by a sparse "highway" section
+        dense = np.column_stack([np.full(500, 36.0), np.linspace(-115.0, -114.99, 500)])
+        sparse = np.column_stack([np.full(5, 36.0), np.linspace(-114.99, -114.0, 5)])
+        leg = np.concatenate([dense, sparse[1:]])
+
+        (points,) = resample_legs([leg], distance_per_point_in_km=1.0)
+        spacing = spacing_km(points)
+
+        np.testing.assert_allclose(spacing[:-1], 1.0, rtol=1e-3)
+        self.assertLessEqual(spacing[-1], 1.0 + 1e-6)
+        np.testing.assert_allclose(points[0], leg[0])
+        np.testing.assert_allclose(points[-1], leg[-1])
+
+    def test_legs_stay_separate(self):
+        leg_0 = np.array([[36.0, -115.0], [36.0, -114.0]])
+        leg_1 = np.array([[36.0, -114.0], [37.0, -114.0]])
+        single_point = np.array([[37.0, -114.0]])
+
+        resampled = resample_legs([leg_0, leg_1, single_point], 10.0)
+
+        self.assertEqual(len(resampled), 3)
+        np.testing.assert_allclose(resampled[0][[0, -1]], leg_0)
+        np.testing.assert_allclose(resampled[1][[0, -1]], leg_1)
+        np.testing.assert_allclose(resampled[1][:, 1], -114.0)
+        np.testing.assert_allclose(resampled[2], single_point)
+        self.assertEqual(len(resampled[1]), int(np.ceil(111.2 / 10.0)) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
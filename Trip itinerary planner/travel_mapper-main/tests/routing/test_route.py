@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from googlemaps.convert import decode_polyline, encode_polyline
+from travel_mapper.routing.Route import Route, decode_polyline_array
+from travel_mapper.routing.RouteFinder import RouteFinder
+from tests.routing.fake_maps import FakeMapsClient
+
+
+def legacy_get_route(directions_result):
+    # get_route as it was before routes became array backed
+    waypoints = {}
+    for leg_number, leg in enumerate(directions_result[0]["legs"]):
+        leg_route_points = []
+        for step in leg["steps"]:
+            for p in decode_polyline(step["polyline"]["points"]):
+                leg_route_points.append(f'{p["lat"]},{p["lng"]}')
+        waypoints[leg_number] = {
+            "distance": leg["distance"]["text"],
+            "duration": leg["duration"]["text"],
+            "route": leg_route_points,
+        }
+    return waypoints
+
+
+class TestRoute(unittest.TestCase):
+    def setUp(self):
+        self.directions = FakeMapsClient(points_per_leg=200).directions(
+            "Los Angeles CA", "Las Vegas NV", waypoints=["Barstow CA", "Zion UT"]
+        )
+
+    def test_decode_matches_googlemaps(self):
+        rng = np.random.default_rng(0)
+        points = [
+            {"lat": lat, "lng": lng}
+            for lat, lng in zip(rng.uniform(-80, 80, 500), rng.uniform(-179, 179, 500))
+        ]
+        polyline = encode_polyline(points)
+        expected = [[p["lat"], p["lng"]] for p in decode_polyline(polyline)]
+        self.assertEqual(decode_polyline_array(polyline).tolist(), expected)
+        self.assertEqual(decode_polyline_array("").shape, (0, 2))
+
+    def test_dict_view_matches_legacy_output(self):
+        route = RouteFinder.get_route(self.directions)
+        self.assertIsInstance(route, Route)
+        self.assertEqual(route.to_dict(), legacy_get_route(self.directions))
+        self.assertEqual(route[1], legacy_get_route(self.directions)[1])
+        self.assertEqual(
+            route.total_distance_m,
+            sum(leg["distance"]["value"] for leg in self.directions[0]["legs"]),
+        )
+
+    def test_quantized_legs(self):
+        route = RouteFinder.get_route(self.directions)
+        quantized = RouteFinder.get_route(self.directions, quantize=True)
+        self.assertEqual(quantized.leg(0).coords.dtype, np.int32)
+        np.testing.assert_allclose(
+            quantized.leg(0).latlng, route.leg(0).latlng, atol=1e-7
+        )
+
+    def test_sampling_matches_legacy_dict(self):
+        route = RouteFinder.get_route(self.directions)
+        from_arrays = RouteFinder.sample_route_with_legs(route, 5)
+        from_dict = RouteFinder.sample_route_with_legs(route.to_dict(), 5)
+        self.assertEqual(from_arrays.keys(), from_dict.keys())
+        for leg_id in from_arrays:
+            self.assertEqual(
+                from_arrays[leg_id]["distance"], from_dict[leg_id]["distance"]
+            )
+            self.assertIsInstance(from_arrays[leg_id]["route"][0], tuple)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+import asyncio
+from datetime import datetime, timedelta
+import numpy as np
+import threading
+import time
+import unittest
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.RouteFinder import RouteFinder
+from tests.routing.fake_maps import FakeMapsClient
+
+
+def make_route_finder(max_workers, backend=None):
+    return RouteFinder(
+        geocode_cache=GeocodeCache(db_path=None),
+        directions_cache=DirectionsCache(db_path=None),
+        max_workers=max_workers,
+        backend=backend if backend else FakeMapsClient(),
+    )
+
+
+def make_trip(number_of_stops):
+    return {
+        "start": "Los Angeles CA",
+        "end": "New York City",
+        "waypoints": ["Stop {}".format(i) for i in range(number_of_stops)],
+        "transit": "driving",
+    }
+
+
+class TestRouteFinder(unittest.TestCase):
+    def test_concurrent_segments_match_serial(self):
+        trip = make_trip(60)
+        serial = make_route_finder(1).build_route_segments(trip, verbose=False)
+        concurrent = make_route_finder(8).build_route_segments(trip, verbose=False)
+
+        self.assertEqual(serial, concurrent)
+        directions, sampled_route, mapping_dict = concurrent
+        self.assertEqual(len(directions), 3)
+        self.assertEqual(mapping_dict["start"]["formatted_address"], "Los Angeles CA")
+        self.assertEqual(mapping_dict["end"]["formatted_address"], "New York City")
+
+    def test_each_place_geocoded_once(self):
+        route_finder = make_route_finder(8)
+        route_finder.build_route_segments(make_trip(60), verbose=False)
+        self.assertEqual(route_finder.backend.calls["geocode"], 62)
+
+    def test_concurrent_fallback_keeps_edge_order(self):
+        trip = make_trip(10)
+        serial = make_route_finder(1, FakeMapsClient(fail_with_waypoints=True))
+        concurrent = make_route_finder(8, FakeMapsClient(fail_with_waypoints=True))
+
+        serial_result = serial.build_route_segments(trip, verbose=False)
+        concurrent_result = concurrent.build_route_segments(trip, verbose=False)
+
+        self.assertEqual(serial_result, concurrent_result)
+        directions, sampled_route, _ = concurrent_result
+        self.assertEqual(len(directions), 11)
+        self.assertEqual(directions[1]["legs"][0]["start_address"], "stop_0")
+        self.assertEqual(list(sampled_route.keys()), list(range(11)))
+
+    def test_nested_map_stays_within_max_workers(self):
+        route_finder = make_route_finder(4)
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def leaf(item):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return item
+
+        def outer(item):
+            return route_finder.map_concurrently(leaf, range(item, item + 4))
+
+        result = route_finder.map_concurrently(outer, range(8))
+
+        self.assertEqual(result, [list(range(i, i + 4)) for i in range(8)])
+        self.assertLessEqual(peak[0], 4)
+
+    def test_async_route_matches_sync(self):
+        cases = [(make_trip(5), False), (make_trip(60), False), (make_trip(10), True)]
+        for trip, fail in cases:
+            sync_result = make_route_finder(
+                1, FakeMapsClient(fail_with_waypoints=fail)
+            ).build_route_segments(trip, verbose=False)
+            async_result = asyncio.run(
+                make_route_finder(
+                    8, FakeMapsClient(fail_with_waypoints=fail)
+                ).abuild_route_segments(trip, verbose=False)
+            )
+            self.assertEqual(sync_result, async_result)
+
+    def test_shared_legs_come_from_cache(self):
+        route_finder = make_route_finder(8)
+        first = route_finder.build_route_segments(make_trip(5), verbose=False)
+        self.assertEqual(route_finder.backend.calls["directions"], 1)
+
+        # same trip again, every leg is cached
+        second = route_finder.build_route_segments(make_trip(5), verbose=False)
+        self.assertEqual(route_finder.backend.calls["directions"], 1)
+        self.assertEqual(first[1], second[1])
+
+        # one extra stop: the API has to choose where it goes, so the trip is
+        # requested whole
+        trip = make_trip(5)
+        trip["waypoints"].append("Chicago IL")
+        directions, sampled_route, _ = route_finder.build_route_segments(
+            trip, verbose=False
+        )
+        self.assertEqual(route_finder.backend.calls["directions"], 2)
+        self.assertEqual(len(directions), 1)
+        self.assertEqual(len(sampled_route), 7)
+        self.assertEqual(sampled_route[0], first[1][0])
+
+    def mapping_dict(self, route_finder, trip):
+        return route_finder.build_mapping_dict(
+            trip["start"], trip["end"], trip["waypoints"]
+        )
+
+    def test_missing_legs_in_order_are_fetched_a_run_per_call(self):
+        route_finder = make_route_finder(8)
+        trip = make_trip(10)
+        route_finder.build_directions_and_route(
+            self.mapping_dict(route_finder, trip),
+            verbose=False,
+            optimize_waypoints=False,
+        )
+        self.assertEqual(route_finder.backend.calls["directions"], 1)
+
+        # a new stop in the middle, the two legs around it come from one call
+        trip["waypoints"].insert(4, "Chicago IL")
+        directions, route = route_finder.build_directions_and_route(
+            self.mapping_dict(route_finder, trip),
+            verbose=False,
+            optimize_waypoints=False,
+        )
+        self.assertEqual(route_finder.backend.calls["directions"], 2)
+        self.assertEqual(directions[0]["legs"][4]["end_address"], "chicago_il")
+        self.assertEqual(len(route), 12)
+
+        # new stops all over the trip, requested whole rather than a call per gap
+        for i in (1, 5, 9):
+            trip["waypoints"][i] = "Elsewhere {}".format(i)
+        directions, route = route_finder.build_directions_and_route(
+            self.mapping_dict(route_finder, trip),
+            verbose=False,
+            optimize_waypoints=False,
+        )
+        self.assertEqual(route_finder.backend.calls["directions"], 3)
+        self.assertEqual(len(directions[0]["legs"]), 12)
+
+    def test_optimized_order_is_kept_for_cached_trips(self):
+        route_finder = make_route_finder(8, FakeMapsClient(reverse_optimized=True))
+        mapping_dict = self.mapping_dict(route_finder, make_trip(5))
+        first, first_route = route_finder.build_directions_and_route(
+            mapping_dict, verbose=False
+        )
+        self.assertEqual(first[0]["waypoint_order"], [4, 3, 2, 1, 0])
+
+        # the same request again, its legs are looked up in the order they were stored
+        second = route_finder.build_directions_and_route(mapping_dict, verbose=False)
+        third = asyncio.run(
+            route_finder.abuild_directions_and_route(mapping_dict, verbose=False)
+        )
+        self.assertEqual(route_finder.backend.calls["directions"], 1)
+        for directions, route in (second, third):
+            self.assertEqual(directions[0]["waypoint_order"], [4, 3, 2, 1, 0])
+            self.assertEqual(directions[0]["legs"], first[0]["legs"])
+            self.assertEqual(route.stops, first_route.stops)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestUpdateRoute(unittest.TestCase):
+    def assert_update_matches_rebuild(self, old_trip, new_trip, expected_calls):
+        route_finder = make_route_finder(8)
+        directions, sampled_route, _ = route_finder.build_route_segments(
+            old_trip, verbose=False
+        )
+        calls_before = route_finder.backend.calls["directions"]
+
+        updated = route_finder.update_route(
+            old_trip, new_trip, directions, sampled_route
+        )
+        self.assertEqual(
+            route_finder.backend.calls["directions"] - calls_before, expected_calls
+        )
+
+        rebuilt = make_route_finder(8).build_route_segments(new_trip, verbose=False)
+        self.assertEqual(list(updated[1]), list(rebuilt[1]))
+        for leg_id, leg in rebuilt[1].items():
+            # legs resampled on their own may differ from a full pass in the last bits
+            np.testing.assert_allclose(updated[1][leg_id]["route"], leg["route"])
+            self.assertEqual(
+                dict(updated[1][leg_id], route=None), dict(leg, route=None)
+            )
+        self.assertEqual(updated[2], rebuilt[2])
+        self.assertEqual(updated[0][0]["legs"], rebuilt[0][0]["legs"])
+        return updated
+
+    def test_replace_one_stop(self):
+        old_trip = make_trip(6)
+        new_trip = dict(old_trip, waypoints=list(old_trip["waypoints"]))
+        new_trip["waypoints"][3] = "Somewhere else"
+        self.assert_update_matches_rebuild(old_trip, new_trip, expected_calls=2)
+
+    def test_insert_and_remove_stops(self):
+        old_trip = make_trip(6)
+        inserted = dict(old_trip, waypoints=list(old_trip["waypoints"]))
+        inserted["waypoints"].insert(2, "Detour")
+        self.assert_update_matches_rebuild(old_trip, inserted, expected_calls=2)
+
+        removed = dict(old_trip, waypoints=old_trip["waypoints"][1:])
+        self.assert_update_matches_rebuild(old_trip, removed, expected_calls=1)
+
+    def test_other_transit_type_or_departure_rebuilds(self):
+        old_trip = make_trip(6)
+        new_trip = dict(old_trip, waypoints=list(old_trip["waypoints"]))
+        new_trip["waypoints"][3] = "Somewhere else"
+        tomorrow = datetime.now() + timedelta(days=1)
+
+        for kwargs in ({"transit_type": "walking"}, {"start_time": tomorrow}):
+            with self.subTest(**kwargs):
+                route_finder = make_route_finder(8)
+                directions, sampled_route, _ = route_finder.build_route_segments(
+                    old_trip, verbose=False
+                )
+                updated = route_finder.update_route(
+                    old_trip, new_trip, directions, sampled_route, **kwargs
+                )
+                rebuilt = make_route_finder(8).build_route_segments(
+                    new_trip, verbose=False, **kwargs
+                )
+                self.assertEqual(updated, rebuilt)
+
+                bucket = route_finder.directions_cache.departure_bucket(
+                    kwargs.get("start_time", datetime.now())
+                )
+                for leg in updated[1].values():
+                    self.assertEqual(
+                        leg["transit_type"], kwargs.get("transit_type", "driving")
+                    )
+                    self.assertEqual(leg["departure_bucket"], bucket)
+
+    def test_async_update_matches_sync(self):
+        old_trip = make_trip(6)
+        new_trip = dict(old_trip, end="Boston MA")
+        route_finder = make_route_finder(8)
+        directions, sampled_route, _ = route_finder.build_route_segments(
+            old_trip, verbose=False
+        )
+
+        sync_result = route_finder.update_route(
+            old_trip, new_trip, directions, sampled_route
+        )
+        async_result = asyncio.run(
+            make_route_finder(8).aupdate_route(
+                old_trip, new_trip, directions, sampled_route
+            )
+        )
+        self.assertEqual(sync_result, async_result)
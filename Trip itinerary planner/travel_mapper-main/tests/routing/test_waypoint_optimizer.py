@@ -0,0 +1,57 @@
+import random
+import unittest
+from travel_mapper.routing.WaypointOptimizer import WaypointOptimizer
+from tests.routing.test_route_finder import make_route_finder, make_trip
+from tests.routing.fake_maps import haversine_km
+
+
+def place(name, lat, lng):
+    return {"place_id": name, "geometry": {"location": {"lat": lat, "lng": lng}}}
+
+
+def trip_length_km(mapping_dict):
+    stops = [mapping_dict["start"]]
+    stops += [v for k, v in mapping_dict.items() if k.startswith("waypoint_")]
+    stops.append(mapping_dict["end"])
+    locations = [stop["geometry"]["location"] for stop in stops]
+    return sum(haversine_km(a, b) for a, b in zip(locations[:-1], locations[1:]))
+
+
+class TestWaypointOptimizer(unittest.TestCase):
+    def test_recovers_order_along_a_line(self):
+        start, end = place("start", 40.0, -120.0), place("end", 40.0, -80.0)
+        waypoints = [place("w{}".format(i), 40.0, -119.0 + i) for i in range(38)]
+        shuffled = list(range(len(waypoints)))
+        random.Random(0).shuffle(shuffled)
+
+        order = WaypointOptimizer().order(start, [waypoints[i] for i in shuffled], end)
+        self.assertEqual([shuffled[i] for i in order], list(range(len(waypoints))))
+
+    def test_distances_are_cached(self):
+        optimizer = WaypointOptimizer()
+        places = [place(str(i), 40.0 + i, -100.0) for i in range(4)]
+        first = optimizer.distance_matrix(places)
+        self.assertEqual(len(optimizer._distances), 12)
+
+        second = optimizer.distance_matrix(places[::-1])
+        self.assertEqual(len(optimizer._distances), 12)
+        self.assertAlmostEqual(first[0, 3], second[3, 0])
+
+    def test_global_order_shortens_long_trips(self):
+        trip = make_trip(60)
+        unordered = make_route_finder(8)
+        unordered.waypoint_optimizer = None
+        ordered = make_route_finder(8)
+
+        _, _, unordered_mapping = unordered.build_route_segments(trip, verbose=False)
+        _, _, ordered_mapping = ordered.build_route_segments(trip, verbose=False)
+
+        self.assertLess(
+            trip_length_km(ordered_mapping), 0.5 * trip_length_km(unordered_mapping)
+        )
+        self.assertEqual(ordered_mapping["start"], unordered_mapping["start"])
+        self.assertEqual(ordered_mapping["end"], unordered_mapping["end"])
+
+
+if __name__ == "__main__":
+    unittest.main()
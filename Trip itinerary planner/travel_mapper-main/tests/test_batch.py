@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from travel_mapper import batch
+from tests.agent.fake_llm import INVALID, ITINERARY, TRIP
+from tests.test_tracing import make_travel_mapper
+
+
+def write_lines(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_records(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.dir.name, "queries.jsonl")
+        self.output_path = os.path.join(self.dir.name, "results.jsonl")
+        write_lines(
+            self.input_path,
+            [
+                json.dumps({"id": "a", "query": "LA to Vegas"}),
+                "",
+                json.dumps("LA to Vegas via Barstow"),
+                json.dumps({"id": "c", "query": "LA to Vegas by car"}),
+            ],
+        )
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_batch(self, travel_mapper, **kwargs):
+        return asyncio.run(
+            batch.arun_batch(travel_mapper, self.input_path, self.output_path, **kwargs)
+        )
+
+    def test_writes_a_result_per_query(self):
+        travel_mapper = make_travel_mapper()
+        stats = self.run_batch(travel_mapper, concurrency=2, route=True)
+
+        records = {record["id"]: record for record in read_records(self.output_path)}
+        self.assertEqual(set(records), {"a", 3, "c"})
+        for record in records.values():
+            self.assertEqual(record["itinerary"], ITINERARY)
+            self.assertEqual(record["list_of_places"], json.loads(TRIP))
+            self.assertGreater(record["route_points"], 0)
+            self.assertIn("route", record["stages"])
+
+        self.assertEqual(stats.counts["ok"], 3)
+        # the places are the same in every trip, the shared caches answer after the first
+        self.assertEqual(travel_mapper.maps.calls["geocode"], 3)
+        report = stats.to_dict()
+        self.assertEqual(report["counters"]["llm_calls"], 9)
+        self.assertEqual(
+            set(report["stages"]["total"]), {"p{}".format(q) for q in batch.PERCENTILES}
+        )
+        self.assertIn("validation", stats.report())
+
+    def test_resumes_after_interruption(self):
+        # "c" failed, and the run was killed half way through writing a result
+        with open(self.output_path, "w") as f:
+            f.write(json.dumps({"id": "a", "query": "LA to Vegas"}) + "\n")
+            f.write(json.dumps({"id": "c", "query": "x", "error": "Timeout()"}) + "\n")
+            # from another input file, not counted as skipped
+            f.write(json.dumps({"id": "z", "query": "x", "itinerary": None}) + "\n")
+            f.write('{"id": 3, "que')
+
+        stats = self.run_batch(make_travel_mapper())
+
+        self.assertEqual(stats.counts["skipped"], 1)
+        self.assertEqual(stats.counts["ok"], 2)
+        self.assertEqual(batch.completed_ids(self.output_path), {"a", 3, "c", "z"})
+
+    def test_malformed_lines_are_recorded_and_skipped(self):
+        write_lines(
+            self.input_path,
+            [
+                json.dumps({"id": "a", "query": "LA to Vegas"}),
+                '{"id": "b", "query": "LA to',
+                json.dumps({"id": "c"}),
+                "42",
+                json.dumps({"id": "d", "query": "LA to Vegas by car"}),
+            ],
+        )
+        stats = self.run_batch(make_travel_mapper())
+
+        self.assertEqual(stats.counts["ok"], 2)
+        self.assertEqual(stats.counts["failed"], 3)
+        records = read_records(self.output_path)
+        errors = {record["id"]: record for record in records if "error" in record}
+        self.assertEqual(set(errors), {2, 3, 4})
+        self.assertIn("line 2 is not a query", errors[2]["error"])
+        self.assertEqual(batch.completed_ids(self.output_path), {"a", "d"})
+
+    def test_failures_and_invalid_queries_are_recorded(self):
+        travel_mapper = make_travel_mapper(
+            responses={"validation": INVALID, "itinerary": ITINERARY, "mapping": "?"}
+        )
+        stats = self.run_batch(travel_mapper, route=True)
+        self.assertEqual(stats.counts["invalid"], 3)
+        self.assertTrue(
+            all(
+                record["itinerary"] is None for record in read_records(self.output_path)
+            )
+        )
+
+        os.remove(self.output_path)
+        travel_mapper = make_travel_mapper(
+            responses={"validation": "?", "itinerary": ITINERARY, "mapping": TRIP}
+        )
+        stats = self.run_batch(travel_mapper)
+        self.assertEqual(stats.counts["failed"], 3)
+        self.assertTrue(
+            all("error" in record for record in read_records(self.output_path))
+        )
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+from travel_mapper import http_pool
+
+
+class TestHttpPool(unittest.TestCase):
+    def tearDown(self):
+        http_pool._sessions.clear()
+
+    def test_one_session_per_loop(self):
+        async def get_twice():
+            return http_pool.get_session(), http_pool.get_session()
+
+        first, second = asyncio.run(get_twice())
+        self.assertIs(first, second)
+
+    def test_sessions_of_closed_loops_are_dropped(self):
+        async def get():
+            return http_pool.get_session()
+
+        for _ in range(3):
+            asyncio.run(get())
+        self.assertEqual(len(http_pool._sessions), 1)
+
+        async def get_and_count():
+            http_pool.get_session()
+            return len(http_pool._sessions)
+
+        self.assertEqual(asyncio.run(get_and_count()), 1)
+
+    def test_close_session(self):
+        async def get_and_close():
+            session = http_pool.get_session()
+            await http_pool.close_session()
+            return session
+
+        session = asyncio.run(get_and_close())
+        self.assertTrue(session.closed)
+        self.assertEqual(http_pool._sessions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
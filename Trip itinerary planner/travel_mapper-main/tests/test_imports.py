@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import unittest
+
+MAP_PACKAGES = ["folium", "branca", "leafmap", "geopandas", "gradio"]
+
+
+def loaded_after(code):
+    """map packages in sys.modules after running code in a fresh interpreter"""
+    script = (
+        "{}\nimport sys\nprint(' '.join(m for m in {!r} if m in sys.modules))".format(
+            code, MAP_PACKAGES
+        )
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=root,
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return output.strip().splitlines()[-1].split() if output.strip() else []
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_library_import_loads_no_map_packages(self):
+        self.assertEqual(
+            loaded_after("import travel_mapper.TravelMapper, travel_mapper.batch"), []
+        )
+
+    def test_parse_without_map_loads_no_map_packages(self):
+        code = "\n".join(
+            [
+                "from tests.test_tracing import make_travel_mapper",
+                "make_travel_mapper().parse('LA to Vegas', make_map=False)",
+            ]
+        )
+        self.assertEqual(loaded_after(code), [])
+
+    def test_drawing_a_map_loads_folium(self):
+        code = "\n".join(
+            [
+                "from tests.test_tracing import make_travel_mapper",
+                "make_travel_mapper().parse('LA to Vegas')",
+            ]
+        )
+        self.assertEqual(loaded_after(code), ["folium", "branca"])
+
+
+if __name__ == "__main__":
+    unittest.main()
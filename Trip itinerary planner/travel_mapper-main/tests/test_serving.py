@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+from travel_mapper.serving import ConcurrencyLimit
+from travel_mapper.TravelMapper import TravelMapperForUI
+from tests.agent.fake_llm import INVALID, ITINERARY, make_agent
+from tests.routing.test_route_finder import make_route_finder
+
+
+class TestConcurrencyLimit(unittest.TestCase):
+    def test_caps_coroutines(self):
+        limit = ConcurrencyLimit("llm", 2)
+        in_flight = []
+
+        async def work():
+            async with limit:
+                in_flight.append(limit.stats()["in_flight"])
+                await asyncio.sleep(0.05)
+
+        async def run():
+            await asyncio.gather(*[work() for _ in range(6)])
+
+        t0 = time.time()
+        asyncio.run(run())
+
+        self.assertGreaterEqual(time.time() - t0, 0.15)
+        self.assertLessEqual(max(in_flight), 2)
+        stats = limit.stats()
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["acquired"], 6)
+        self.assertEqual(stats["waited"], 4)
+        self.assertEqual(stats["max_queued"], 4)
+        self.assertGreater(stats["max_wait"], 0)
+
+    def test_shared_by_threads_and_event_loops(self):
+        limit = ConcurrencyLimit("maps", 1)
+        active = []
+        overlaps = []
+
+        def hold():
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.02)
+            active.pop()
+
+        def blocking():
+            with limit:
+                hold()
+
+        async def coroutine():
+            async with limit:
+                hold()
+
+        threads = [threading.Thread(target=blocking) for _ in range(3)]
+        threads += [
+            threading.Thread(target=lambda: asyncio.run(coroutine())) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(overlaps), 1)
+        self.assertEqual(limit.stats()["acquired"], 6)
+
+    def test_cancelled_waiter_gives_up_its_place(self):
+        limit = ConcurrencyLimit("llm", 1)
+
+        async def run():
+            await limit.aacquire()
+            waiter = asyncio.ensure_future(limit.aacquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            limit.release()
+            # the slot isn't lost to the cancelled waiter
+            await asyncio.wait_for(limit.aacquire(), 1)
+            limit.release()
+
+        asyncio.run(run())
+        self.assertEqual(limit.stats()["in_flight"], 0)
+        self.assertEqual(limit.stats()["queued"], 0)
+
+    def test_no_limit(self):
+        limit = ConcurrencyLimit("llm")
+        for _ in range(100):
+            limit.acquire()
+        self.assertEqual(limit.stats()["waited"], 0)
+
+
+class TestTravelMapperForUI(unittest.TestCase):
+    def test_handlers_wait_for_their_turn(self):
+        travel_mapper = TravelMapperForUI.__new__(TravelMapperForUI)
+        travel_mapper.travel_agent = make_agent(delay=0.05)
+        travel_mapper.route_finder = make_route_finder(1)
+        travel_mapper.llm_limit = ConcurrencyLimit("llm", 1)
+        travel_mapper.maps_limit = ConcurrencyLimit("maps", 1)
+
+        async def run():
+            # different queries, so the response cache doesn't coalesce them
+            return await asyncio.gather(
+                *[
+                    travel_mapper.agenerate_with_leafmap(
+                        "LA to Vegas, take {}".format(i), None
+                    )
+                    for i in range(3)
+                ]
+            )
+
+        for map_html, itinerary, _ in asyncio.run(run()):
+            self.assertEqual(itinerary, ITINERARY)
+            self.assertTrue(map_html)
+
+        stats = travel_mapper.serving_stats()
+        self.assertEqual(stats["llm"]["acquired"], 3)
+        self.assertEqual(stats["llm"]["waited"], 2)
+        self.assertEqual(stats["maps"]["acquired"], 3)
+        self.assertEqual(stats["llm"]["in_flight"] + stats["maps"]["in_flight"], 0)
+
+    def test_stream_closes_the_agent_stream_when_it_stops_early(self):
+        travel_mapper = TravelMapperForUI.__new__(TravelMapperForUI)
+        travel_mapper.travel_agent = make_agent(
+            responses={"validation": INVALID, "itinerary": ITINERARY}
+        )
+        travel_mapper.llm_limit = ConcurrencyLimit("llm", 1)
+        closed = []
+        astream_travel = travel_mapper.travel_agent.astream_travel
+
+        async def recording_astream_travel(*args):
+            try:
+                async for event in astream_travel(*args):
+                    yield event
+            finally:
+                closed.append(True)
+
+        travel_mapper.travel_agent.astream_travel = recording_astream_travel
+
+        async def run():
+            updates = [
+                update async for update in travel_mapper.astream_with_leafmap("x", None)
+            ]
+            # closed by the time the stream is done, not whenever it is collected
+            return updates, list(closed)
+
+        with mock.patch(
+            "travel_mapper.TravelMapper.generate_generic_leafmap",
+            return_value="<generic map>",
+        ):
+            updates, closed_when_done = asyncio.run(run())
+
+        self.assertEqual(updates[-1][0], "<generic map>")
+        self.assertEqual(closed_when_done, [True])
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import unittest
+from travel_mapper import tracing
+from travel_mapper.TravelMapper import TravelMapperBase
+from tests.agent.fake_llm import make_agent
+from tests.routing.fake_maps import FakeMapsClient
+from tests.routing.test_route_finder import make_route_finder
+
+STAGES = [
+    "validation",
+    "itinerary",
+    "mapping",
+    "route",
+    "geocode",
+    "directions",
+    "sampling",
+    "render_map",
+]
+
+
+def make_travel_mapper(**kwargs):
+    travel_mapper = TravelMapperBase.__new__(TravelMapperBase)
+    travel_mapper.travel_agent = make_agent(**kwargs)
+    travel_mapper.maps = FakeMapsClient()
+    travel_mapper.route_finder = make_route_finder(4, backend=travel_mapper.maps)
+    travel_mapper.route_finder.mapper.save_map = False
+    return travel_mapper
+
+
+class TestTracing(unittest.TestCase):
+    def assert_complete(self, trace, maps):
+        self.assertEqual(set(trace.stage_durations()), set(STAGES))
+        self.assertEqual(trace.counters["llm_calls"], 3)
+        self.assertEqual(trace.counters["llm_calls_estimated"], 3)
+        self.assertGreater(trace.counters["llm_prompt_tokens"], 0)
+        self.assertGreater(trace.counters["llm_completion_tokens"], 0)
+        self.assertEqual(trace.counters["maps_geocode_calls"], maps.calls["geocode"])
+        self.assertEqual(
+            trace.counters["maps_directions_calls"], maps.calls["directions"]
+        )
+        # stages are nested in the request, and counted where they happen
+        for stage, duration in trace.stage_durations().items():
+            self.assertLessEqual(duration, trace.duration * len(trace.spans(stage)))
+        self.assertEqual(trace.spans("validation")[0].counters["llm_calls"], 1)
+
+    def test_parse_result_carries_trace(self):
+        travel_mapper = make_travel_mapper()
+        result = travel_mapper.parse("LA to Vegas")
+
+        itinerary, directions, sampled_route, mapping_dict = result
+        self.assertIsInstance(result.trace, tracing.Trace)
+        self.assert_complete(result.trace, travel_mapper.maps)
+        self.assertEqual(
+            [span.attributes["address"] for span in result.trace.spans("geocode")][:1],
+            ["Los Angeles CA"],
+        )
+        self.assertIn("maps_directions_calls", result.trace.to_dict()["counters"])
+
+    def test_concurrent_aparse_traces_are_separate(self):
+        travel_mapper = make_travel_mapper(speculative=True)
+
+        async def run():
+            return await asyncio.gather(
+                travel_mapper.aparse("LA to Vegas", make_map=False),
+                travel_mapper.aparse("LA to Vegas via Barstow", make_map=False),
+            )
+
+        for result in asyncio.run(run()):
+            self.assertEqual(len(result), 3)
+            self.assertEqual(result.trace.counters["llm_calls"], 3)
+            self.assertEqual(
+                set(result.trace.stage_durations()),
+                {"validation", "itinerary", "mapping"},
+            )
+
+    def test_cached_response_counts_no_llm_calls(self):
+        travel_mapper = make_travel_mapper()
+        travel_mapper.parse("LA to Vegas", make_map=False)
+        result = travel_mapper.parse("LA to Vegas", make_map=False)
+
+        self.assertEqual(result.trace.counters["llm_calls"], 0)
+        self.assertEqual(result.trace.counters["llm_response_cache_hits"], 1)
+
+    def test_spans_outside_a_trace_are_ignored(self):
+        with tracing.span("geocode") as span:
+            tracing.count("maps_geocode_calls")
+        self.assertIsNone(span)
+        self.assertIsNone(tracing.current_trace())
+
+    def test_propagate_to_threads(self):
+        with tracing.trace("request") as trace:
+            with tracing.span("route"):
+                threads = [
+                    threading.Thread(
+                        target=tracing.propagate(lambda: tracing.count("calls"))
+                    )
+                    for _ in range(4)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        self.assertEqual(trace.counters["calls"], 4)
+        self.assertEqual(trace.spans("route")[0].counters["calls"], 4)
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from travel_mapper.user_interface import driver
+from travel_mapper.user_interface.capture_logs import (
+    BackgroundLogWriter,
+    LogRingBuffer,
+    PrintLogCapture,
+    log_session,
+)
+
+
+class TestLogRingBuffer(unittest.TestCase):
+    def test_incremental_reads(self):
+        buffer = LogRingBuffer(capacity=100)
+        buffer.append("a\n")
+        buffer.append("b\n")
+        text, offset = buffer.read()
+        self.assertEqual(text, "a\nb\n")
+
+        buffer.append("c\n")
+        self.assertEqual(buffer.read(offset), ("c\n", 3))
+        self.assertEqual(buffer.read(3), ("", 3))
+
+    def test_bounded(self):
+        buffer = LogRingBuffer(capacity=3)
+        for i in range(10):
+            buffer.append(str(i))
+        # a reader that fell behind gets what is left
+        self.assertEqual(buffer.read(2), ("789", 10))
+        self.assertEqual(buffer.read(8), ("89", 10))
+
+    def test_sessions(self):
+        buffer = LogRingBuffer()
+        buffer.append("a", session="alice")
+        buffer.append("b", session="bob")
+        buffer.append("a", session="alice")
+        buffer.append("-")
+        self.assertEqual(buffer.read(session="alice"), ("aa", 4))
+        self.assertEqual(buffer.read()[0], "aba-")
+
+
+class TestBackgroundLogWriter(unittest.TestCase):
+    def test_rotation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "output.log")
+            writer = BackgroundLogWriter(filename, max_bytes=10, backup_count=2)
+            for i in range(5):
+                writer.write("{}\n".format(i) * 3)
+            writer.close()
+
+            with open(filename) as f:
+                self.assertEqual(f.read(), "4\n4\n4\n")
+            with open(filename + ".1") as f:
+                self.assertEqual(f.read(), "3\n3\n3\n")
+            with open(filename + ".2") as f:
+                self.assertEqual(f.read(), "2\n2\n2\n")
+            self.assertFalse(os.path.exists(filename + ".3"))
+
+
+class TestPrintLogCapture(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "output.log")
+        self.stdout = sys.stdout
+        self.capture = sys.stdout = PrintLogCapture(self.filename)
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.capture.close()
+        self.directory.cleanup()
+
+    def test_concurrent_sessions_are_separate(self):
+        def user(name):
+            with log_session(name):
+                for i in range(50):
+                    print(name, i)
+
+        threads = [threading.Thread(target=user, args=(n,)) for n in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        text, offset = driver.read_logs(session="a")
+        self.assertEqual(text, "".join("a {}\n".format(i) for i in range(50)))
+        print("no session")
+        self.assertEqual(driver.read_logs(offset), ("no session\n", offset + 2))
+
+        self.capture.close()
+        with open(self.filename) as f:
+            self.assertEqual(len(f.read().splitlines()), 101)
+
+    def test_ui_handlers_tag_their_session(self):
+        async def stream(query):
+            print("streaming", query)
+            await asyncio.sleep(0)
+            yield (query, None)
+            print("done", query)
+            yield (query, "valid")
+
+        async def generate(query):
+            await asyncio.sleep(0)
+            print("generating", query)
+            return query
+
+        async def run():
+            request = SimpleNamespace(session_hash="alice")
+            updates = [u async for u in driver.streaming_handler(stream)(request, "x")]
+            result = await driver.session_handler(generate)(
+                SimpleNamespace(session_hash="bob"), "y"
+            )
+            return updates, result
+
+        updates, result = asyncio.run(run())
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(result, "y")
+
+        offset, logs = driver.show_new_logs(
+            SimpleNamespace(session_hash="alice"), 0, ""
+        )
+        self.assertEqual(logs, "streaming x\ndone x\n")
+        print("more")
+        _, logs = driver.show_new_logs(SimpleNamespace(session_hash="bob"), offset, "")
+        self.assertEqual(logs, "")
+        _, logs = driver.show_new_logs(SimpleNamespace(session_hash="bob"), 0, "")
+        self.assertEqual(logs, "generating y\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
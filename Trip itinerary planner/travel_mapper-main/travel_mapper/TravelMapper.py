@@ -2,9 +2,14 @@ from travel_mapper.agent.Agent import Agent
 from travel_mapper.routing.RouteFinder import RouteFinder
 from travel_mapper.user_interface.utils import (generate_leafmap, validation_message, generate_generic_leafmap)
 from travel_mapper.user_interface import utils
+from travel_mapper import tracing
+from travel_mapper.serving import ConcurrencyLimit
 from dotenv import load_dotenv
+from contextlib import aclosing
 from pathlib import Path
-from travel_mapper.user_interface.constants import VALID_MESSAGE
+from travel_mapper.user_interface.constants import VALID_MESSAGE, LLM_CONCURRENCY, MAPS_CONCURRENCY
+from travel_mapper.constants import MAP_SIMPLIFY_ZOOM, SPECULATIVE_MAX_WORKERS
+import asyncio
 import os
 # all import statements
 
@@ -16,6 +21,7 @@ def load_secrets():
     load_dotenv(dotenv_path=env_path)
 
     open_ai_key = os.getenv("OPENAI_API_KEY")
+    # may hold several comma separated keys, Maps requests are spread over them
     google_maps_key = os.getenv("GOOGLE_MAPS_API_KEY")
     google_palm_key = os.getenv("GOOGLE_PALM_API_KEY")
 
@@ -38,33 +44,51 @@ This is a safety measure to make sure the program has all the necessary API keys
 
 
 class TravelMapperBase(object):
-    def __init__(self, openai_api_key, google_maps_key, google_palm_api_key, verbose=False):
-        self.travel_agent = Agent(openai_api_key, google_palm_api_key, debug=verbose)
-        self.route_finder = RouteFinder(google_maps_key)
-        """ Constructor that sets the verbosity flag and provided API keys to initialize the Agent and RouteFinder."""
+    def __init__(self, openai_api_key, google_maps_key, google_palm_api_key, verbose=False, routing_backend=None,
+                 speculation_workers=SPECULATIVE_MAX_WORKERS):
+        self.travel_agent = Agent(openai_api_key, google_palm_api_key, debug=verbose,
+                                  speculation_workers=speculation_workers)
+        self.route_finder = RouteFinder(google_maps_key, backend=routing_backend)
+        """ Constructor that sets the verbosity flag and provided API keys to initialize the Agent and RouteFinder.
+        routing_backend replaces Google Maps for geocoding and directions, e.g. GraphBackend.from_file(path) to route offline.
+        speculation_workers caps the itinerary chains the Agent runs speculatively at once."""
 
     def parse(self, query, make_map=True):
-        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
-        if make_map:
-            directions, sampled_route, mapping_dict = self.route_finder.generate_route(list_of_places, itinerary)
-            return itinerary, directions, sampled_route, mapping_dict
-        return itinerary, list_of_places, validation
-        """ This method receives a trip query, processes it, and returns results pertaining to travel. """
+        with tracing.trace("parse") as trace:
+            itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
+            if make_map:
+                directions, sampled_route, mapping_dict = self.route_finder.generate_route(list_of_places, itinerary)
+                return tracing.TracedResult((itinerary, directions, sampled_route, mapping_dict), trace)
+        return tracing.TracedResult((itinerary, list_of_places, validation), trace)
+        """ This method receives a trip query, processes it, and returns results pertaining to travel.
+        The result unpacks as before and carries the request's Trace as result.trace : per stage spans
+        (validation, itinerary, mapping, route, geocode, directions, sampling, render_map), LLM token
+        and Maps API call counters. """
+
+    async def aparse(self, query, make_map=True):
+        with tracing.trace("parse") as trace:
+            itinerary, list_of_places, validation = await self.travel_agent.asuggest_travel(query)
+            if make_map:
+                directions, sampled_route, mapping_dict = await self.route_finder.agenerate_route(list_of_places, itinerary)
+                return tracing.TracedResult((itinerary, directions, sampled_route, mapping_dict), trace)
+        return tracing.TracedResult((itinerary, list_of_places, validation), trace)
+        """ asyncio counterpart of parse, many trips can be in flight on a single event loop. """
 
 
 
 class TravelMapperForUI(TravelMapperBase): # UI Operations
-    def _model_type_switch(self, new_model_name):
-        current_model_name = self.travel_agent.chat_model.model_name
-        if ("gpt" in current_model_name and "gpt" not in new_model_name) or (
-            "bison" in current_model_name and "bison" not in new_model_name
-        ):
-
-            self.travel_agent.update_model_family(new_model_name)
-        elif current_model_name != new_model_name:
-            self.travel_agent.chat_model.model_name = new_model_name
-
-
+    def __init__(self, *args, llm_concurrency=LLM_CONCURRENCY, maps_concurrency=MAPS_CONCURRENCY, **kwargs):
+        # a request only speculates while it holds one of the llm_concurrency slots
+        kwargs.setdefault("speculation_workers", llm_concurrency or SPECULATIVE_MAX_WORKERS)
+        super().__init__(*args, **kwargs)
+        self.llm_limit = ConcurrencyLimit("llm", llm_concurrency)
+        self.maps_limit = ConcurrencyLimit("maps", maps_concurrency)
+        """ Requests beyond llm_concurrency (resp. maps_concurrency) wait their turn before calling the LLM
+        (resp. Google Maps), so a burst of users queues up instead of overloading both backends at once. """
+
+    def serving_stats(self):
+        return {limit.name: limit.stats() for limit in (self.llm_limit, self.maps_limit)}
+        """ Requests in flight and queued per backend, and how long they waited for their turn. """
 
     def validate_and_respond(self, query):
         itinerary, validation = self.parse(query, make_map=False)
@@ -73,9 +97,8 @@ class TravelMapperForUI(TravelMapperBase): # UI Operations
 
 
     def generate_without_leafmap(self, query, model_name):
-        self._model_type_switch(model_name)
-
-        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
+        with self.llm_limit:
+            itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query, model_name)
             # message validation
         validation_string = validation_message(validation)
 
@@ -85,9 +108,8 @@ class TravelMapperForUI(TravelMapperBase): # UI Operations
         return itinerary, validation_string
 
     def generate_with_leafmap(self, query, model_name):
-        self._model_type_switch(model_name)
-
-        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
+        with self.llm_limit:
+            itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query, model_name)
 
         # message validation
         validation_string = validation_message(validation)
@@ -98,14 +120,117 @@ class TravelMapperForUI(TravelMapperBase): # UI Operations
             map_html = generate_generic_leafmap()
 
         else:
+            with self.maps_limit:
+                (
+                    directions_list,
+                    sampled_route,
+                    mapping_dict,
+                ) = self.route_finder.generate_route(
+                    list_of_places=list_of_places, itinerary=itinerary, include_map=False
+                )
+
+            map_html = generate_leafmap(
+                directions_list, sampled_route, simplify_zoom=MAP_SIMPLIFY_ZOOM
+            )
+
+        return map_html, itinerary, validation_string
+
+    async def agenerate_without_leafmap(self, query, model_name):
+        async with self.llm_limit:
+            itinerary, list_of_places, validation = await self.travel_agent.asuggest_travel(query, model_name)
+        validation_string = validation_message(validation)
+
+        if validation_string != VALID_MESSAGE:
+            itinerary = "Itinerary can not be generated, Please check the prompt that you have entered!"
+
+        return itinerary, validation_string
+    """ asyncio counterpart of generate_without_leafmap, meant to be used as a Gradio async event handler. """
+
+    async def agenerate_with_leafmap(self, query, model_name):
+        async with self.llm_limit:
+            itinerary, list_of_places, validation = await self.travel_agent.asuggest_travel(query, model_name)
+        validation_string = validation_message(validation)
+        loop = asyncio.get_running_loop()
+
+        if validation_string != VALID_MESSAGE:
+            itinerary = "Itinerary can not be generated, Please check the prompt that you have entered!!"
+            map_html = await loop.run_in_executor(None, generate_generic_leafmap)
+
+        else:
+            async with self.maps_limit:
+                (
+                    directions_list,
+                    sampled_route,
+                    mapping_dict,
+                ) = await self.route_finder.agenerate_route(
+                    list_of_places=list_of_places, itinerary=itinerary, include_map=False
+                )
+
+            # map rendering is CPU bound, keep it off the event loop
+            map_html = await loop.run_in_executor(
+                None,
+                lambda: generate_leafmap(
+                    directions_list, sampled_route, simplify_zoom=MAP_SIMPLIFY_ZOOM
+                ),
+            )
+
+        return map_html, itinerary, validation_string
+    """ asyncio counterpart of generate_with_leafmap, meant to be used as a Gradio async event handler. """
+
+    async def astream_without_leafmap(self, query, model_name):
+        itinerary = ""
+        validation_string = None
+        # closed straight away if we stop early, which cancels the agent's chains
+        async with self.llm_limit, aclosing(self.travel_agent.astream_travel(query, model_name)) as events:
+            async for kind, value in events:
+                if kind == "token":
+                    itinerary += value
+                    yield itinerary, validation_string
+                elif kind == "validation":
+                    validation_string = validation_message(value)
+                    if validation_string != VALID_MESSAGE:
+                        itinerary = "Itinerary can not be generated, Please check the prompt that you have entered!"
+                    yield itinerary, validation_string
+    """ Streaming counterpart of agenerate_without_leafmap, meant to be used as a Gradio generator handler.
+    Yields (itinerary, validation) as the itinerary tokens arrive, None for a part that is not known yet. """
+
+    async def astream_with_leafmap(self, query, model_name):
+        itinerary = ""
+        validation_string = None
+        loop = asyncio.get_running_loop()
+
+        # closed straight away on the early return, which cancels the agent's chains
+        async with self.llm_limit, aclosing(self.travel_agent.astream_travel(query, model_name)) as events:
+            async for kind, value in events:
+                if kind == "token":
+                    itinerary += value
+                    yield None, itinerary, validation_string
+                elif kind == "validation":
+                    validation_string = validation_message(value)
+                    if validation_string != VALID_MESSAGE:
+                        itinerary = "Itinerary can not be generated, Please check the prompt that you have entered!!"
+                        map_html = await loop.run_in_executor(None, generate_generic_leafmap)
+                        yield map_html, itinerary, validation_string
+                        return
+                    yield None, itinerary or None, validation_string
+                else:
+                    itinerary, list_of_places, validation = value
+
+        async with self.maps_limit:
             (
                 directions_list,
                 sampled_route,
                 mapping_dict,
-            ) = self.route_finder.generate_route(
+            ) = await self.route_finder.agenerate_route(
                 list_of_places=list_of_places, itinerary=itinerary, include_map=False
             )
-
-            map_html = generate_leafmap(directions_list, sampled_route)
-
-        return map_html, itinerary, validation_string
+        map_html = await loop.run_in_executor(
+            None,
+            lambda: generate_leafmap(
+                directions_list, sampled_route, simplify_zoom=MAP_SIMPLIFY_ZOOM
+            ),
+        )
+        yield map_html, itinerary, validation_string
+    """ Streaming counterpart of agenerate_with_leafmap, meant to be used as a Gradio generator handler.
+    Yields (map, itinerary, validation) : itinerary tokens as they arrive, then the validation and last the map.
+    None stands for a part that has not changed since the previous update. """
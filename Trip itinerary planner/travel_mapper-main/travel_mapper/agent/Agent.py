@@ -1,19 +1,56 @@
+from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.chains import LLMChain, SequentialChain
 from langchain.chat_models import ChatOpenAI
 from langchain.llms import GooglePalm
+from langchain.llms.base import LLM
 from travel_mapper.agent.templates import (
     ValidationTemplate,
     ItineraryTemplate,
     MappingTemplate,
+    Validation,
 )
-from travel_mapper.constants import MODEL_NAME, TEMPERATURE
+from travel_mapper.agent.LLMResponseCache import LLMResponseCache
+from travel_mapper.agent.TripExtractor import TripExtractor, TripExtractionChain
+from travel_mapper.agent.ChainRegistry import ChainRegistry, ModelChains
+from travel_mapper.agent.repair import ReaskChain
+from travel_mapper.agent.instrumentation import TracedChain, with_trace_callback
+from travel_mapper.constants import (
+    MODEL_NAME,
+    TEMPERATURE,
+    SPECULATIVE_AGENT,
+    SPECULATIVE_MAX_WORKERS,
+    LOCAL_TRIP_EXTRACTION,
+    SUPPORTED_MODELS,
+)
+from concurrent.futures import ThreadPoolExecutor
+from travel_mapper import http_pool, tracing
 import openai
+import asyncio
+import copy
 import logging
 import time
 
 logging.basicConfig(level=logging.INFO)
 
 
+# where langchain's models leave the async calls unimplemented, or run the
+# blocking ones in an executor
+_LANGCHAIN_BASE_MODULES = ("langchain.llms.base", "langchain.chat_models.base")
+
+
+def has_native_async(model):
+    """
+    True if the model implements its async calls itself (e.g. ChatOpenAI, a
+    ReplayChatModel) rather than inheriting langchain's defaults for them
+    """
+    # simple LLMs implement _acall, the others _agenerate
+    method = "_acall" if isinstance(model, LLM) else "_agenerate"
+    for cls in type(model).__mro__:
+        if method in vars(cls):
+            return cls.__module__ not in _LANGCHAIN_BASE_MODULES
+    return False
+
+
 class Agent(object):
     def __init__(
         self,
@@ -22,56 +59,160 @@ class Agent(object):
         model=MODEL_NAME,
         temperature=TEMPERATURE,
         debug=True,
+        response_cache=None,
+        speculative=SPECULATIVE_AGENT,
+        local_trip_extraction=LOCAL_TRIP_EXTRACTION,
+        chat_models=None,
+        speculation_workers=SPECULATIVE_MAX_WORKERS,
     ):
+        """
+
+        Parameters
+        ----------
+        open_ai_api_key
+        google_palm_api_key
+        model
+            default model, for requests that don't name one
+        temperature
+        debug
+        response_cache
+            LLMResponseCache, a default one (on disk) if None
+        speculative
+        local_trip_extraction
+        chat_models
+            dict of model name to a ready made chat model used instead of the
+            real one, e.g. a ReplayChatModel to run offline
+        speculation_workers
+            speculative itinerary chains suggest_travel runs at once, keep it
+            to the number of requests allowed to call the LLM at once
+        """
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
 
-        if "gpt" in model:
-            # model is open ai
-            self.logger.info("Base LLM is OpenAI chatGPT series")
-            openai.api_key = open_ai_api_key
-            self.chat_model = ChatOpenAI(model=model, temperature=temperature)
-        elif "bison-001" in model:
-            # model is google palm
-            self.logger.info("Base LLM is Google Palm")
-            self.chat_model = GooglePalm(
-                model_name=model,
-                temperature=temperature,
-                google_api_key=google_palm_api_key,
-            )
-
+        openai.api_key = open_ai_api_key
         self._palm_key = google_palm_api_key
         self._openai_key = open_ai_api_key
+        self.temperature = temperature
+        self.debug = debug
+        # used by requests that don't name a model
+        self.model_name = model
+        self.chat_models = dict(chat_models or {})
 
         self.validation_prompt = ValidationTemplate()
         self.itinerary_prompt = ItineraryTemplate()
         self.mapping_prompt = MappingTemplate()
+        # parse the trip out of the itinerary locally, the mapping LLM is the fallback
+        self.trip_extractor = TripExtractor() if local_trip_extraction else None
+
+        # the chains of every supported model are built once, each request picks
+        # its model from the registry instead of changing a shared one
+        self.chains = ChainRegistry(
+            self.build_chains,
+            model_names=[model] + [m for m in SUPPORTED_MODELS if m != model],
+        )
+
+        self.response_cache = (
+            response_cache if response_cache is not None else LLMResponseCache()
+        )
+        self.template_version = LLMResponseCache.template_version(
+            self.validation_prompt, self.itinerary_prompt, self.mapping_prompt
+        )
+        if self.trip_extractor is not None:
+            self.template_version += "-local" + TripExtractor.VERSION
 
-        self.validation_chain = self._set_up_validation_chain(debug)
-        self.agent_chain = self._set_up_agent_chain(debug)
+        # run the itinerary chain alongside validation instead of after it
+        self.speculative = speculative
+        self._speculation_executor = ThreadPoolExecutor(
+            max_workers=speculation_workers, thread_name_prefix="speculative-agent"
+        )
 
     def update_model_family(self, new_model):
-        if "gpt" in new_model:
-            # when Open AI Model is selected
-            self.logger.info("Base LLM is OpenAI chatGPT series")
-            self.chat_model = ChatOpenAI(model=new_model, temperature=TEMPERATURE)
-        elif "bison-001" in new_model:
-            # when PaLM Model is selected
-            self.logger.info("Base LLM is Google Palm")
-            self.chat_model = GooglePalm(
-                model_name=new_model,
-                temperature=TEMPERATURE,
+        """Make new_model the default for requests that don't name a model"""
+        self.chains.get(new_model)
+        self.model_name = new_model
+
+    @property
+    def chat_model(self):
+        return self.chains.get(self.model_name).chat_model
+
+    @property
+    def validation_chain(self):
+        return self.chains.get(self.model_name).validation_chain
+
+    @property
+    def agent_chain(self):
+        return self.chains.get(self.model_name).agent_chain
+
+    def make_chat_model(self, model_name):
+        if model_name in self.chat_models:
+            self.logger.info(
+                "{} : using {}".format(
+                    model_name, type(self.chat_models[model_name]).__name__
+                )
+            )
+            return self.chat_models[model_name]
+        elif "gpt" in model_name:
+            # model is open ai
+            self.logger.info(
+                "{} : base LLM is OpenAI chatGPT series".format(model_name)
+            )
+            return ChatOpenAI(model=model_name, temperature=self.temperature)
+        elif "bison-001" in model_name:
+            # model is google palm
+            self.logger.info("{} : base LLM is Google Palm".format(model_name))
+            return GooglePalm(
+                model_name=model_name,
+                temperature=self.temperature,
                 google_api_key=self._palm_key,
             )
+        raise ValueError("Unsupported model {}".format(model_name))
+
+    def build_chains(self, model_name):
+        return self.set_up_chains(self.make_chat_model(model_name))
+
+    def set_up_chains(self, chat_model, debug=None):
+        """
 
-    def _set_up_validation_chain(self, debug=True):
+        Parameters
+        ----------
+        chat_model
+            LLM the chains run on
+        debug
+            defaults to the debug flag the Agent was created with
+
+        Returns
+        -------
+        ModelChains
+        """
+        debug = self.debug if debug is None else debug
+        # LLM calls and their tokens are counted into the trace of the request
+        chat_model = with_trace_callback(chat_model)
+        return ModelChains(
+            chat_model=chat_model,
+            validation_chain=self._set_up_validation_chain(debug, chat_model),
+            agent_chain=self._set_up_agent_chain(debug, chat_model),
+            # only the itinerary is speculated, places are read once the query is valid
+            itinerary_chain=self._set_up_itinerary_chain(debug, chat_model=chat_model),
+            # used by astream_travel, which runs the two steps of agent_chain itself
+            streaming_itinerary_chain=self._set_up_itinerary_chain(
+                debug, streaming=True, chat_model=chat_model
+            ),
+            mapping_chain=self._set_up_mapping_chain(debug, chat_model),
+        )
+
+    def _set_up_validation_chain(self, debug=True, chat_model=None):
         validation_agent = LLMChain(
-            llm=self.chat_model,
+            llm=chat_model if chat_model is not None else self.chat_model,
             prompt=self.validation_prompt.chat_prompt,
             output_parser=self.validation_prompt.parser,
             output_key="validation_output",
             verbose=debug,
         )
+        # output the parser can't repair is sent back to the model, not the whole request
+        validation_agent = ReaskChain(llm_chain=validation_agent, verbose=debug)
+        validation_agent = TracedChain(
+            chain=validation_agent, span_name="validation", verbose=debug
+        )
 
         overall_chain = SequentialChain(
             chains=[validation_agent],
@@ -82,21 +223,43 @@ class Agent(object):
 
         return overall_chain
 
-    def _set_up_agent_chain(self, debug=True):
-        travel_agent = LLMChain(
-            llm=self.chat_model,
+    def _set_up_itinerary_chain(self, debug=True, streaming=False, chat_model=None):
+        llm = chat_model if chat_model is not None else self.chat_model
+        if streaming and "streaming" in llm.__fields__:
+            # emits on_llm_new_token callbacks as the itinerary is generated
+            # (copy drops the fields excluded from serialization, e.g. callbacks,
+            # so pass every field along)
+            llm = llm.copy(update=dict(llm.__dict__, streaming=True))
+
+        itinerary_chain = LLMChain(
+            llm=llm,
             prompt=self.itinerary_prompt.chat_prompt,
             verbose=debug,
             output_key="agent_suggestion",
         )
+        return TracedChain(chain=itinerary_chain, span_name="itinerary", verbose=debug)
 
-        parser = LLMChain(
-            llm=self.chat_model,
+    def _set_up_mapping_chain(self, debug=True, chat_model=None):
+        mapping_chain = LLMChain(
+            llm=chat_model if chat_model is not None else self.chat_model,
             prompt=self.mapping_prompt.chat_prompt,
             output_parser=self.mapping_prompt.parser,
             verbose=debug,
             output_key="mapping_list",
         )
+        mapping_chain = ReaskChain(llm_chain=mapping_chain, verbose=debug)
+        if self.trip_extractor is not None:
+            mapping_chain = TripExtractionChain(
+                mapping_chain=mapping_chain,
+                extractor=self.trip_extractor,
+                verbose=debug,
+            )
+
+        return TracedChain(chain=mapping_chain, span_name="mapping", verbose=debug)
+
+    def _set_up_agent_chain(self, debug=True, chat_model=None):
+        travel_agent = self._set_up_itinerary_chain(debug, chat_model=chat_model)
+        parser = self._set_up_mapping_chain(debug, chat_model)
 
         overall_chain = SequentialChain(
             chains=[travel_agent, parser],
@@ -107,53 +270,352 @@ class Agent(object):
 
         return overall_chain
 
-    def suggest_travel(self, query):
+    def suggest_travel(self, query, model_name=None):
+        """
+
+        Parameters
+        ----------
+        query
+        model_name
+            one of SUPPORTED_MODELS, defaults to the Agent's model
+
+        Returns
+        -------
+        itinerary, list of places and validation result
+        """
+        chains = self.chains.get(model_name or self.model_name)
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return self.suggestion_to_json(*self._suggest_travel(query, chains))
+
+        # identical queries in flight at the same time (the pre-filled example
+        # query in particular) share one run of the chains
+        cached = self.response_cache.get_or_compute(
+            self.response_cache_key(query, chains.model_name), compute
+        )
+        if not computed:
+            self.log_cache_hit(query, chains.model_name)
+        return self.suggestion_from_json(cached, query)
+
+    def _suggest_travel(self, query, chains):
+        speculation = None
+        if self.speculative:
+            # most queries are valid, so start on the itinerary straight away and
+            # throw it away if validation says no
+            self.logger.info(
+                "Speculatively calling itinerary chain (model is {})".format(
+                    chains.model_name
+                )
+            )
+            speculation = self._speculation_executor.submit(
+                tracing.propagate(chains.itinerary_chain), self._agent_inputs(query)
+            )
+
         self.logger.info("Validating query")
         t1 = time.time()
         self.logger.info(
-            "Calling validation (model is {}) on user input".format(
-                self.chat_model.model_name
-            )
-        )
-        validation_result = self.validation_chain(
-            {
-                "query": query,
-                "format_instructions": self.validation_prompt.parser.get_format_instructions(),
-            }
+            "Calling validation (model is {}) on user input".format(chains.model_name)
         )
+        try:
+            validation_result = chains.validation_chain(self._validation_inputs(query))
+        except BaseException:
+            if speculation is not None:
+                speculation.cancel()
+            raise
 
-        validation_test = validation_result["validation_output"].dict()
         t2 = time.time()
         self.logger.info("Time to validate request: {}".format(round(t2 - t1, 2)))
 
+        if not self._is_valid(validation_result):
+            if speculation is not None:
+                # a chain already running can't be interrupted, its result is dropped
+                speculation.cancel()
+                self.logger.info("Discarding speculative travel suggestions")
+            return None, None, validation_result
+
+        # plan is valid
+        self.logger.info("Query is valid")
+        self.logger.info("Getting travel suggestions")
+        t1 = time.time()
+
+        if speculation is not None:
+            trip_suggestion = speculation.result()["agent_suggestion"]
+            agent_result = chains.mapping_chain(
+                dict(self._agent_inputs(query), agent_suggestion=trip_suggestion)
+            )
+        else:
+            self.logger.info(
+                "User request is valid, calling agent (model is {})".format(
+                    chains.model_name
+                )
+            )
+            agent_result = chains.agent_chain(self._agent_inputs(query))
+            trip_suggestion = agent_result["agent_suggestion"]
+
+        list_of_places = agent_result["mapping_list"].dict()
+        t2 = time.time()
+        self.logger.info("Time to get suggestions: {}".format(round(t2 - t1, 2)))
+
+        return trip_suggestion, list_of_places, validation_result
+
+    def _validation_inputs(self, query):
+        return {
+            "query": query,
+            "format_instructions": self.validation_prompt.parser.get_format_instructions(),
+        }
+
+    def _agent_inputs(self, query):
+        return {
+            "query": query,
+            "format_instructions": self.mapping_prompt.parser.get_format_instructions(),
+        }
+
+    def _is_valid(self, validation_result):
+        validation_test = validation_result["validation_output"].dict()
         if validation_test["plan_is_valid"].lower() == "no":
             self.logger.warning("User request was not valid!")
             print("\n######\n Travel plan is not valid \n######\n")
             print(validation_test["updated_request"])
+            return False
+        return True
+
+    async def _acall_chain(self, chat_model, chain, inputs, callbacks=None):
+        if isinstance(chat_model, ChatOpenAI):
+            # let the openai client reuse the pooled keep-alive session
+            token = openai.aiosession.set(http_pool.get_session())
+            try:
+                return await chain.acall(inputs, callbacks=callbacks)
+            finally:
+                openai.aiosession.reset(token)
+
+        if has_native_async(chat_model):
+            return await chain.acall(inputs, callbacks=callbacks)
+
+        # models without a native async client (e.g. GooglePalm) run in the default executor
+        return await asyncio.get_running_loop().run_in_executor(
+            None, tracing.propagate(chain), inputs
+        )
+
+    async def asuggest_travel(self, query, model_name=None):
+        """asyncio counterpart of suggest_travel"""
+        chains = self.chains.get(model_name or self.model_name)
+        computed = []
+
+        async def compute():
+            computed.append(True)
+            return self.suggestion_to_json(*await self._asuggest_travel(query, chains))
+
+        cached = await self.response_cache.aget_or_compute(
+            self.response_cache_key(query, chains.model_name), compute
+        )
+        if not computed:
+            self.log_cache_hit(query, chains.model_name)
+        return self.suggestion_from_json(cached, query)
+
+    def response_cache_key(self, query, model_name=None):
+        return self.response_cache.key(
+            model_name or self.model_name, self.template_version, query
+        )
+
+    def log_cache_hit(self, query, model_name=None):
+        tracing.count("llm_response_cache_hits")
+        self.logger.info(
+            "Served from LLM response cache (model is {}) : {!r}, cache stats : {}".format(
+                model_name or self.model_name, query, self.response_cache.stats()
+            )
+        )
+
+    @staticmethod
+    def suggestion_to_json(trip_suggestion, list_of_places, validation_result):
+        return {
+            "itinerary": trip_suggestion,
+            "list_of_places": list_of_places,
+            "validation": validation_result["validation_output"].dict(),
+        }
+
+    def suggestion_from_json(self, cached, query):
+        """Rebuild what suggest_travel returns from its cached JSON"""
+        validation_result = {
+            "query": query,
+            "format_instructions": self.validation_prompt.parser.get_format_instructions(),
+            "validation_output": Validation(**cached["validation"]),
+        }
+        # the in-memory tier hands out the stored object, don't let callers mutate it
+        list_of_places = copy.deepcopy(cached["list_of_places"])
+        return cached["itinerary"], list_of_places, validation_result
+
+    async def _asuggest_travel(self, query, chains):
+        speculation = None
+        if self.speculative:
+            self.logger.info(
+                "Speculatively calling itinerary chain (model is {})".format(
+                    chains.model_name
+                )
+            )
+            speculation = asyncio.ensure_future(
+                self._acall_chain(
+                    chains.chat_model, chains.itinerary_chain, self._agent_inputs(query)
+                )
+            )
+
+        self.logger.info("Validating query")
+        t1 = time.time()
+        self.logger.info(
+            "Calling validation (model is {}) on user input".format(chains.model_name)
+        )
+        try:
+            validation_result = await self._acall_chain(
+                chains.chat_model,
+                chains.validation_chain,
+                self._validation_inputs(query),
+            )
+        except BaseException:
+            if speculation is not None:
+                speculation.cancel()
+            raise
+
+        t2 = time.time()
+        self.logger.info("Time to validate request: {}".format(round(t2 - t1, 2)))
+
+        if not self._is_valid(validation_result):
+            if speculation is not None:
+                speculation.cancel()
+                self.logger.info("Cancelled speculative travel suggestions")
             return None, None, validation_result
 
-        else:
-            # plan is valid
-            self.logger.info("Query is valid")
-            self.logger.info("Getting travel suggestions")
-            t1 = time.time()
+        self.logger.info("Query is valid")
+        self.logger.info("Getting travel suggestions")
+        t1 = time.time()
 
+        if speculation is not None:
+            trip_suggestion = (await speculation)["agent_suggestion"]
+            agent_result = await self._acall_chain(
+                chains.chat_model,
+                chains.mapping_chain,
+                dict(self._agent_inputs(query), agent_suggestion=trip_suggestion),
+            )
+        else:
             self.logger.info(
                 "User request is valid, calling agent (model is {})".format(
-                    self.chat_model.model_name
+                    chains.model_name
                 )
             )
+            agent_result = await self._acall_chain(
+                chains.chat_model, chains.agent_chain, self._agent_inputs(query)
+            )
+            trip_suggestion = agent_result["agent_suggestion"]
+
+        list_of_places = agent_result["mapping_list"].dict()
+        t2 = time.time()
+        self.logger.info("Time to get suggestions: {}".format(round(t2 - t1, 2)))
+
+        return trip_suggestion, list_of_places, validation_result
 
-            agent_result = self.agent_chain(
-                {
-                    "query": query,
-                    "format_instructions": self.mapping_prompt.parser.get_format_instructions(),
-                }
+    async def astream_travel(self, query, model_name=None):
+        """
+        Streaming counterpart of asuggest_travel. Validation and the itinerary
+        chain run concurrently, itinerary tokens are passed on as the model
+        produces them, then the list of places is extracted from the itinerary.
+
+        Parameters
+        ----------
+        query
+        model_name
+            one of SUPPORTED_MODELS, defaults to the Agent's model
+
+        Yields
+        -------
+        ("token", str) pieces of the itinerary, ("validation", validation result)
+        once the query is validated, and last ("result", (itinerary, list of
+        places, validation result)) as returned by asuggest_travel
+        """
+        chains = self.chains.get(model_name or self.model_name)
+        key = self.response_cache_key(query, chains.model_name)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            self.log_cache_hit(query, chains.model_name)
+            itinerary, list_of_places, validation_result = self.suggestion_from_json(
+                cached, query
             )
+            yield "validation", validation_result
+            if itinerary:
+                yield "token", itinerary
+            yield "result", (itinerary, list_of_places, validation_result)
+            return
 
-            trip_suggestion = agent_result["agent_suggestion"]
-            list_of_places = agent_result["mapping_list"].dict()
-            t2 = time.time()
-            self.logger.info("Time to get suggestions: {}".format(round(t2 - t1, 2)))
+        queue = asyncio.Queue()
+        validation_task = asyncio.ensure_future(
+            self._acall_chain(
+                chains.chat_model,
+                chains.validation_chain,
+                self._validation_inputs(query),
+            )
+        )
+        itinerary_task = asyncio.ensure_future(
+            self._acall_chain(
+                chains.chat_model,
+                chains.streaming_itinerary_chain,
+                self._agent_inputs(query),
+                callbacks=[TokenQueueHandler(queue)],
+            )
+        )
+        # finished tasks are put on the queue after the tokens they produced
+        validation_task.add_done_callback(queue.put_nowait)
+        itinerary_task.add_done_callback(queue.put_nowait)
+
+        try:
+            streamed = False
+            pending = {validation_task, itinerary_task}
+            while pending:
+                item = await queue.get()
+                if isinstance(item, str):
+                    streamed = True
+                    yield "token", item
+                    continue
+
+                pending.discard(item)
+                if item is validation_task:
+                    validation_result = validation_task.result()
+                    yield "validation", validation_result
+                    if not self._is_valid(validation_result):
+                        self.response_cache.set(
+                            key, self.suggestion_to_json(None, None, validation_result)
+                        )
+                        yield "result", (None, None, validation_result)
+                        return
+
+            itinerary = itinerary_task.result()["agent_suggestion"]
+            if not streamed:
+                # the model doesn't stream, hand over the itinerary in one piece
+                yield "token", itinerary
+        finally:
+            for task in (validation_task, itinerary_task):
+                task.cancel()
+
+        t1 = time.time()
+        mapping_result = await self._acall_chain(
+            chains.chat_model,
+            chains.mapping_chain,
+            dict(self._agent_inputs(query), agent_suggestion=itinerary),
+        )
+        list_of_places = mapping_result["mapping_list"].dict()
+        self.logger.info(
+            "Time to extract places: {}".format(round(time.time() - t1, 2))
+        )
+
+        self.response_cache.set(
+            key, self.suggestion_to_json(itinerary, list_of_places, validation_result)
+        )
+        yield "result", (itinerary, list_of_places, validation_result)
+
+
+class TokenQueueHandler(AsyncCallbackHandler):
+    """Puts the tokens of a streaming LLM on an asyncio queue"""
+
+    def __init__(self, queue):
+        self.queue = queue
 
-            return trip_suggestion, list_of_places, validation_result
+    async def on_llm_new_token(self, token, **kwargs):
+        await self.queue.put(token)
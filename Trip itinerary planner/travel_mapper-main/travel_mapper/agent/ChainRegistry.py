@@ -0,0 +1,95 @@
+from travel_mapper.constants import SUPPORTED_MODELS
+from collections import namedtuple
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+
+class ModelChains(
+    namedtuple(
+        "ModelChains",
+        [
+            "chat_model",
+            "validation_chain",
+            "agent_chain",
+            "itinerary_chain",
+            "streaming_itinerary_chain",
+            "mapping_chain",
+        ],
+    )
+):
+    """
+    The chat model of one LLM and the chains built on it. Built once and
+    shared by every request for that model, so it is never modified.
+    """
+
+    __slots__ = ()
+
+    @property
+    def model_name(self):
+        return self.chat_model.model_name
+
+
+class ChainRegistry(object):
+    """
+    ModelChains by model name. The supported models are built up front, so
+    requests pick their model without rebuilding or mutating anything shared.
+    Other models (or ones that failed to build, e.g. because of a missing API
+    key) are built on first use.
+    """
+
+    def __init__(self, build, model_names=SUPPORTED_MODELS):
+        """
+
+        Parameters
+        ----------
+        build
+            function taking a model name and returning its ModelChains
+        model_names
+            models to build straight away
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+        self._build = build
+        self._chains = {}
+        self._lock = threading.Lock()
+
+        for model_name in model_names:
+            try:
+                self._chains[model_name] = build(model_name)
+            except Exception as e:
+                self.logger.warning(
+                    "Could not set up chains for {} : {!r}".format(model_name, e)
+                )
+
+    def get(self, model_name):
+        """
+
+        Parameters
+        ----------
+        model_name
+
+        Returns
+        -------
+        ModelChains of the model
+        """
+        chains = self._chains.get(model_name)
+        if chains is not None:
+            return chains
+
+        with self._lock:
+            if model_name not in self._chains:
+                self.logger.info("Setting up chains for {}".format(model_name))
+                self._chains[model_name] = self._build(model_name)
+            return self._chains[model_name]
+
+    def register(self, chains):
+        """Add ready made chains, under their model's name"""
+        with self._lock:
+            self._chains[chains.model_name] = chains
+
+    @property
+    def model_names(self):
+        return list(self._chains)
@@ -0,0 +1,62 @@
+from travel_mapper.caching.TieredCache import TieredCache
+from travel_mapper.constants import LLM_CACHE_PATH, LLM_CACHE_SIZE, LLM_CACHE_TTL
+import hashlib
+import re
+
+
+class LLMResponseCache(TieredCache):
+    """
+    Caches the outcome of Agent.suggest_travel keyed by model name, prompt
+    template version and normalized query. With TEMPERATURE at 0 the chains
+    answer the same prompt the same way, so there is no point paying for it twice.
+    """
+
+    def __init__(
+        self,
+        db_path=LLM_CACHE_PATH,
+        max_size=LLM_CACHE_SIZE,
+        ttl=LLM_CACHE_TTL,
+    ):
+        super().__init__("llm_responses", db_path=db_path, max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def template_version(*templates):
+        """
+        Short hash of the prompt templates, editing a prompt invalidates the
+        entries made with the old one
+
+        Parameters
+        ----------
+        templates
+            ValidationTemplate, ItineraryTemplate, MappingTemplate ...
+
+        Returns
+        -------
+
+        """
+        digest = hashlib.sha1()
+        for template in templates:
+            digest.update(template.system_template.encode("utf-8"))
+            digest.update(template.human_template.encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    @staticmethod
+    def normalize_query(query):
+        """
+        "2 day trip  from LA to Vegas." and "2 day trip from la to vegas" should share an entry
+
+        Parameters
+        ----------
+        query
+
+        Returns
+        -------
+
+        """
+        query = query.lower().strip().rstrip(".!")
+        return re.sub(r"\s+", " ", query)
+
+    def key(self, model_name, template_version, query):
+        return "{}|{}|{}".format(
+            model_name, template_version, self.normalize_query(query)
+        )
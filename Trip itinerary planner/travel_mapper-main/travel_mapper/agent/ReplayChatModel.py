@@ -0,0 +1,173 @@
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+# recordings are written from whichever thread made the call
+_FIXTURE_LOCK = threading.Lock()
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Stand-in for ChatOpenAI / GooglePalm that answers from a fixture file of
+    recorded prompts and responses, so Agent can be tested and benchmarked
+    offline. Pass it to Agent through chat_models.
+
+    With a recorder (the real model), prompts missing from the fixture are
+    sent to it and the answer is added to the fixture file. Without one, a
+    missing prompt is an error. Replayed answers are delayed by latency
+    seconds, give or take a uniformly random jitter.
+    """
+
+    model_name: str = "replay"
+    fixture_path: Optional[str] = None
+    recordings: Dict[str, Dict[str, Any]] = {}
+    recorder: Any = None
+    latency: float = 0.0
+    jitter: float = 0.0
+    # token callbacks for astream_travel, the answer is replayed a word at a time
+    streaming: bool = False
+
+    @classmethod
+    def from_fixture(cls, fixture_path, latency=0.0, jitter=0.0, recorder=None):
+        """
+
+        Parameters
+        ----------
+        fixture_path
+            JSON file written by a recording ReplayChatModel, created if missing
+            when recording
+        latency
+            seconds each replayed answer takes
+        jitter
+            max random deviation from latency, in seconds
+        recorder
+            model answering prompts that aren't in the fixture yet
+
+        Returns
+        -------
+        ReplayChatModel
+        """
+        fixture = {"model_name": None, "recordings": {}}
+        if os.path.exists(fixture_path):
+            with open(fixture_path, "r") as f:
+                fixture = json.load(f)
+        elif recorder is None:
+            raise FileNotFoundError(fixture_path)
+
+        model_name = fixture["model_name"]
+        if recorder is not None:
+            model_name = recorder.model_name
+        return cls(
+            model_name=model_name or "replay",
+            fixture_path=fixture_path,
+            recordings=fixture["recordings"],
+            recorder=recorder,
+            latency=latency,
+            jitter=jitter,
+        )
+
+    @property
+    def _llm_type(self):
+        return "replay"
+
+    @staticmethod
+    def key(messages):
+        """Fixture key of a prompt, a hash of its message types and contents"""
+        digest = hashlib.sha1()
+        for message in messages:
+            digest.update(message.type.encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(message.content.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self.key(messages)
+        if key in self.recordings:
+            time.sleep(self._delay())
+            text = self.recordings[key]["response"]
+        else:
+            text = self._record(
+                key, messages, self._recorder().predict_messages(messages, stop=stop)
+            )
+
+        if self.streaming and run_manager is not None:
+            for token in self._tokens(text):
+                run_manager.on_llm_new_token(token)
+        return self._result(text)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self.key(messages)
+        if key in self.recordings:
+            await asyncio.sleep(self._delay())
+            text = self.recordings[key]["response"]
+        else:
+            answer = await self._recorder().apredict_messages(messages, stop=stop)
+            text = self._record(key, messages, answer)
+
+        if self.streaming and run_manager is not None:
+            for token in self._tokens(text):
+                await run_manager.on_llm_new_token(token)
+        return self._result(text)
+
+    def _recorder(self):
+        if self.recorder is None:
+            raise KeyError(
+                "Prompt not found in the replay fixture {}, record it first".format(
+                    self.fixture_path
+                )
+            )
+        return self.recorder
+
+    def _record(self, key, messages, answer):
+        with _FIXTURE_LOCK:
+            self.recordings[key] = {
+                "messages": [
+                    {"type": message.type, "content": message.content}
+                    for message in messages
+                ],
+                "response": answer.content,
+            }
+            if self.fixture_path is not None:
+                self.save()
+        logging.getLogger(__name__).info(
+            "Recorded response {} to {}".format(key[:12], self.fixture_path)
+        )
+        return answer.content
+
+    def save(self):
+        directory = os.path.dirname(self.fixture_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # written next to the fixture then moved, a crash never leaves half a file
+        tmp_path = self.fixture_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"model_name": self.model_name, "recordings": self.recordings},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, self.fixture_path)
+
+    def _delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    @staticmethod
+    def _tokens(text):
+        return re.findall(r"\s*\S+|\s+$", text) or [text]
+
+    @staticmethod
+    def _result(text):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
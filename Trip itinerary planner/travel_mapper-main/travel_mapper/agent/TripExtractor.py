@@ -0,0 +1,339 @@
+from langchain.chains.base import Chain
+from travel_mapper.agent.templates import Trip
+from travel_mapper.constants import LOCAL_TRIP_MIN_CONFIDENCE
+from pydantic import ValidationError
+from typing import List
+import logging
+import re
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+# same cap as the mapping prompt
+MAX_WAYPOINTS = 20
+
+LABEL = re.compile(
+    r"^[\s\-*#>•]*(?:\*\*)?"
+    r"(?P<label>start(?:ing)?(?: location| point)?|end(?:ing)?(?: location| point)?"
+    r"|(?:mode of )?transport(?:ation)?(?: mode)?|transit)"
+    r"(?:\*\*)?\s*:\s*(?:\*\*)?(?P<value>.+?)(?:\*\*)?\s*$",
+    re.IGNORECASE,
+)
+
+# a run of capitalised words, allowing a few lowercase joiners in between
+# ("Tower of London", "Rue de la Paix"), e.g. the name of a place. Full stops
+# end the name unless they close an abbreviation ("St. Louis")
+WORD = r"[A-Z0-9][\w'’&-]*(?:(?:(?<=St)|(?<=Mt)|(?<=Ft)|(?<=Ave)|(?<=Rd))\.)?"
+NAME = WORD + r"(?:\s+(?:(?:of|the|de|la|del|du|and)\s+)*" + WORD + r")*"
+
+# "Tower of London (Tower Hill, London EC3N 4AB)"
+NAME_WITH_ADDRESS = re.compile(
+    r"(?<![\w'’])(?P<name>" + NAME + r")\s*\((?P<address>[^()]+)\)"
+)
+
+# "drive from Los Angeles to Barstow, CA"
+PLACE_AFTER_PREPOSITION = re.compile(
+    r"\b(?:from|to|at|in|into|towards?|via)\s+(?:the\s+)?"
+    r"(?P<place>" + NAME + r"(?:,\s*(?:[A-Z]{2}\b|[A-Z][a-z]+(?:\s[A-Z][a-z]+)?))?)"
+)
+
+DURATION = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:hours?|hrs?|minutes?|mins?|miles?|mi|km|kilometers?|days?|nights?)\b",
+    re.IGNORECASE,
+)
+
+# capitalised words that are not places
+NOT_PLACES = {
+    "day",
+    "morning",
+    "afternoon",
+    "evening",
+    "night",
+    "noon",
+    "breakfast",
+    "brunch",
+    "lunch",
+    "dinner",
+    "note",
+    "then",
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+}
+
+# words sentences start with, dropped from the front of a name
+LEADING_VERBS = {
+    "start",
+    "begin",
+    "visit",
+    "explore",
+    "drive",
+    "fly",
+    "take",
+    "head",
+    "continue",
+    "arrive",
+    "end",
+    "stop",
+    "stay",
+    "enjoy",
+    "see",
+    "tour",
+    "return",
+    "depart",
+    "leave",
+    "check",
+    "spend",
+    "walk",
+    "hike",
+    "board",
+}
+
+TRANSIT_KEYWORDS = {
+    "driving": r"\b(?:driv(?:e|es|ing)|car|road ?trip|rental car)\b",
+    "flight": r"\b(?:fl(?:y|ies|ying|ight|ights)|airport|plane)\b",
+    "train": r"\b(?:trains?|rail(?:way)?|amtrak)\b",
+    "bus": r"\b(?:bus(?:es)?|coach)\b",
+}
+
+
+class TripExtractor(object):
+    """
+    Reads the start, end, waypoints and mode of transport of a trip straight
+    off the itinerary text, which follows the bulleted layout the itinerary
+    prompt asks for. Returns a confidence score alongside the Trip so callers
+    can fall back to the mapping LLM when the parse looks shaky.
+    """
+
+    # part of the LLM response cache key, bump when the parsing rules change
+    VERSION = "2"
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.counts = {"local": 0, "fallback": 0}
+        self._lock = threading.Lock()
+
+    def extract(self, itinerary):
+        """
+
+        Parameters
+        ----------
+        itinerary
+            text produced by the itinerary chain
+
+        Returns
+        -------
+        (Trip, confidence between 0 and 1), or (None, 0.0) if no trip could be read
+        """
+        labels = {}
+        places = []
+        for line in itinerary.splitlines():
+            label = LABEL.match(line)
+            if label is not None:
+                labels.setdefault(
+                    self._label_kind(label.group("label")), label.group("value")
+                )
+            else:
+                places.extend(self.places_in(line))
+
+        start = self._clean(labels["start"]) if "start" in labels else None
+        end = self._clean(labels["end"]) if "end" in labels else None
+        labelled_ends = start is not None and end is not None
+        start = start or (places[0] if places else None)
+        end = end or (places[-1] if places else None)
+        if not start or not end:
+            return None, 0.0
+
+        waypoints = []
+        seen = {self._place_key(start), self._place_key(end)}
+        for place in places:
+            if self._place_key(place) not in seen:
+                seen.add(self._place_key(place))
+                waypoints.append(place)
+
+        transit, transit_is_clear = self.transit_of(labels.get("transport"), itinerary)
+
+        try:
+            trip = Trip(
+                start=start,
+                end=end,
+                waypoints=waypoints[:MAX_WAYPOINTS],
+                transit=transit or "driving",
+            )
+        except ValidationError:
+            return None, 0.0
+
+        # without labels start and end are only the first and last places
+        # mentioned, which on their own never make the parse confident enough
+        # to skip the mapping LLM
+        confidence = 0.2
+        if labelled_ends:
+            confidence += 0.4
+        if transit_is_clear:
+            confidence += 0.3
+        if (waypoints or self._place_key(start) != self._place_key(end)) and len(
+            waypoints
+        ) <= MAX_WAYPOINTS:
+            confidence += 0.1
+        return trip, round(confidence, 2)
+
+    def places_in(self, line):
+        """Names of places in one line of the itinerary, in the order they appear"""
+        found = []
+        covered = []
+        for match in NAME_WITH_ADDRESS.finditer(line):
+            address = match.group("address")
+            name = self._clean(match.group("name"))
+            if not self._is_address(address) or not name:
+                continue
+            found.append((match.start(), "{}, {}".format(name, address.strip())))
+            covered.append(match.span())
+
+        for match in PLACE_AFTER_PREPOSITION.finditer(line):
+            start = match.start("place")
+            if any(a <= start < b for a, b in covered):
+                continue
+            place = self._clean(match.group("place"))
+            if place:
+                found.append((start, place))
+
+        return [place for _, place in sorted(found)]
+
+    def record(self, local):
+        """Count a trip as read locally or handed to the mapping LLM, returns the counts so far"""
+        with self._lock:
+            self.counts["local" if local else "fallback"] += 1
+            return dict(self.counts)
+
+    @staticmethod
+    def transit_of(label, itinerary):
+        """
+
+        Parameters
+        ----------
+        label
+            value of a "Mode of transportation:" line, if there is one
+        itinerary
+
+        Returns
+        -------
+        (one of "driving", "train", "bus" or "flight" or None, whether it is unambiguous)
+        """
+        if label:
+            for transit, pattern in TRANSIT_KEYWORDS.items():
+                if re.search(pattern, label, re.IGNORECASE):
+                    return transit, True
+
+        counts = {
+            transit: len(re.findall(pattern, itinerary, re.IGNORECASE))
+            for transit, pattern in TRANSIT_KEYWORDS.items()
+        }
+        ranked = sorted(counts, key=counts.get, reverse=True)
+        if counts[ranked[0]] == 0:
+            return None, False
+        return ranked[0], counts[ranked[0]] > counts[ranked[1]]
+
+    @staticmethod
+    def _label_kind(label):
+        label = label.lower()
+        if label.startswith("start"):
+            return "start"
+        if label.startswith("end"):
+            return "end"
+        return "transport"
+
+    @staticmethod
+    def _is_address(text):
+        return "," in text and bool(re.search(r"\d", DURATION.sub("", text)))
+
+    @staticmethod
+    def _clean(name):
+        name = name.strip().strip("*").strip(" .:;-")
+        words = name.split()
+        while words and words[0].lower() in LEADING_VERBS | {"at", "in", "the"}:
+            words = words[1:]
+        name = " ".join(words)
+
+        # "Barstow, Day 2" -> "Barstow"
+        head, _, tail = name.partition(",")
+        if tail and tail.split()[0].lower() in NOT_PLACES:
+            name = head
+        if not name or name.split()[0].lower() in NOT_PLACES:
+            return None
+        return name
+
+    @staticmethod
+    def _place_key(place):
+        return place.split(",")[0].strip().lower()
+
+
+class TripExtractionChain(Chain):
+    """
+    Turns agent_suggestion into a Trip with TripExtractor, only calling
+    mapping_chain (the mapping LLM) when the local parse fails or its
+    confidence is below min_confidence
+    """
+
+    mapping_chain: Chain
+    extractor: TripExtractor
+    min_confidence: float = LOCAL_TRIP_MIN_CONFIDENCE
+    output_key: str = "mapping_list"
+
+    @property
+    def input_keys(self) -> List[str]:
+        return self.mapping_chain.input_keys
+
+    @property
+    def output_keys(self) -> List[str]:
+        return [self.output_key]
+
+    def _call(self, inputs, run_manager=None):
+        trip = self._extract(inputs["agent_suggestion"])
+        if trip is None:
+            callbacks = run_manager.get_child() if run_manager else None
+            trip = self.mapping_chain(inputs, callbacks=callbacks)[
+                self.mapping_chain.output_keys[0]
+            ]
+        return {self.output_key: trip}
+
+    async def _acall(self, inputs, run_manager=None):
+        trip = self._extract(inputs["agent_suggestion"])
+        if trip is None:
+            callbacks = run_manager.get_child() if run_manager else None
+            result = await self.mapping_chain.acall(inputs, callbacks=callbacks)
+            trip = result[self.mapping_chain.output_keys[0]]
+        return {self.output_key: trip}
+
+    def _extract(self, itinerary):
+        trip, confidence = self.extractor.extract(itinerary)
+        local = trip is not None and confidence >= self.min_confidence
+        counts = self.extractor.record(local)
+        self.extractor.logger.info(
+            "Local trip extraction confidence {} : {}, counts : {}".format(
+                confidence,
+                "using it" if local else "falling back to the mapping LLM",
+                counts,
+            )
+        )
+        return trip if local else None
+
+    @property
+    def _chain_type(self):
+        return "trip_extraction_chain"
@@ -0,0 +1,109 @@
+"""LangChain side of travel_mapper.tracing: LLM token counts and chain spans"""
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.chains.base import Chain
+from travel_mapper.tracing import count, span
+from typing import List
+import threading
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Counts LLM calls and their prompt and completion tokens into the current
+    trace. Models that don't report token usage (PaLM, streaming OpenAI
+    calls) are counted at about 4 characters per token, see
+    llm_calls_estimated.
+    """
+
+    # called straight from the chain, in its context, even from async chains
+    run_inline = True
+
+    def __init__(self):
+        self._prompt_chars = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        with self._lock:
+            self._prompt_chars[run_id] = sum(len(prompt) for prompt in prompts)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        with self._lock:
+            self._prompt_chars[run_id] = sum(
+                len(message.content) for batch in messages for message in batch
+            )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            prompt_chars = self._prompt_chars.pop(run_id, 0)
+
+        count("llm_calls")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            count("llm_prompt_tokens", usage.get("prompt_tokens", 0))
+            count("llm_completion_tokens", usage.get("completion_tokens", 0))
+            return
+
+        completion_chars = sum(
+            len(generation.text)
+            for generations in response.generations
+            for generation in generations
+        )
+        count("llm_calls_estimated")
+        count("llm_prompt_tokens", prompt_chars // 4)
+        count("llm_completion_tokens", completion_chars // 4)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._prompt_chars.pop(run_id, None)
+        count("llm_errors")
+
+
+# stateless apart from in-flight prompt sizes, shared by all chat models
+TRACE_CALLBACK = TraceCallbackHandler()
+
+
+def with_trace_callback(llm):
+    """
+    Copy of llm reporting to TRACE_CALLBACK as well as its own callbacks, or
+    llm itself if it already does or its callbacks are a manager
+    """
+    callbacks = llm.callbacks
+    if callbacks is not None and not isinstance(callbacks, list):
+        return llm
+    callbacks = list(callbacks or [])
+    if TRACE_CALLBACK in callbacks:
+        return llm
+    # copy drops the fields excluded from serialization (callbacks among them),
+    # so pass every field along
+    return llm.copy(update=dict(llm.__dict__, callbacks=callbacks + [TRACE_CALLBACK]))
+
+
+class TracedChain(Chain):
+    """Runs chain in a span named span_name"""
+
+    chain: Chain
+    span_name: str
+
+    @property
+    def input_keys(self) -> List[str]:
+        return self.chain.input_keys
+
+    @property
+    def output_keys(self) -> List[str]:
+        return self.chain.output_keys
+
+    def _call(self, inputs, run_manager=None):
+        callbacks = run_manager.get_child() if run_manager else None
+        with span(self.span_name):
+            return self.chain(inputs, callbacks=callbacks, return_only_outputs=True)
+
+    async def _acall(self, inputs, run_manager=None):
+        callbacks = run_manager.get_child() if run_manager else None
+        with span(self.span_name):
+            return await self.chain.acall(
+                inputs, callbacks=callbacks, return_only_outputs=True
+            )
+
+    @property
+    def _chain_type(self):
+        return "traced_chain"
@@ -0,0 +1,248 @@
+"""
+Local repair of LLM output that is almost, but not quite, the JSON the
+output parsers ask for, so a stray code fence or trailing comma doesn't cost
+a whole new request. ReaskChain asks the model to fix its answer as a last resort.
+"""
+
+from langchain.chains import LLMChain
+from langchain.chains.base import Chain
+from langchain.output_parsers import PydanticOutputParser
+from langchain.output_parsers.prompts import NAIVE_FIX_PROMPT
+from langchain.schema import OutputParserException
+from travel_mapper.constants import OUTPUT_PARSER_REASKS
+from pydantic import ValidationError
+from typing import Any, Callable, Dict, List
+import ast
+import json
+import logging
+import re
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+UNQUOTED_KEY = re.compile(r"([{,]\s*)([A-Za-z_]\w*)\s*:")
+KEY_VALUE_LINE = re.compile(r"^\s*[-*]?\s*([A-Za-z][\w ]*?)\s*:\s*(.+?)\s*$")
+
+YES = {"yes", "y", "1", "true", "valid", "feasible"}
+NO = {"no", "n", "0", "false", "invalid", "not feasible", "infeasible"}
+
+
+def json_block(text):
+    """The JSON object in text: inside a code fence if there is one, from the first { to the last }"""
+    fenced = CODE_FENCE.search(text)
+    if fenced is not None:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    return text[start : end + 1]
+
+
+def repair_json(text):
+    """
+
+    Parameters
+    ----------
+    text
+        LLM output meant to hold a JSON object
+
+    Returns
+    -------
+    dict parsed from text
+
+    Raises
+    ------
+    ValueError
+        if no object could be recovered
+    """
+    block = json_block(text)
+    if block is None:
+        obj = key_value_lines(text)
+        if obj:
+            return obj
+        raise ValueError("No JSON object found")
+
+    block = block.replace("“", '"').replace("”", '"')
+    without_trailing_commas = TRAILING_COMMA.sub(r"\1", block)
+    candidates = [
+        block,
+        without_trailing_commas,
+        UNQUOTED_KEY.sub(r'\1"\2":', without_trailing_commas),
+    ]
+    for candidate in candidates:
+        try:
+            obj = json.loads(candidate, strict=False)
+        except ValueError:
+            # single quoted strings, True / False ... are fine as a Python literal
+            try:
+                obj = ast.literal_eval(candidate)
+            except (ValueError, SyntaxError):
+                continue
+        if isinstance(obj, dict):
+            return obj
+    raise ValueError("Could not repair JSON object")
+
+
+def key_value_lines(text):
+    """{"start": ..., "waypoints": [...]} from "Start: ...\\nWaypoints: [...]" lines, like the mapping prompt's example"""
+    obj = {}
+    for line in text.splitlines():
+        match = KEY_VALUE_LINE.match(line)
+        if match is None:
+            continue
+        key = match.group(1).strip().lower().replace(" ", "_")
+        value = match.group(2)
+        if value.startswith("["):
+            try:
+                value = repair_json('{"v": ' + value + "}")["v"]
+            except ValueError:
+                pass
+        obj[key] = value
+    return obj
+
+
+def coerce_yes_no(value):
+    """plan_is_valid as "yes" or "no", the model sometimes answers 1 / 0 or true / false"""
+    normalized = str(value).strip().strip(".").lower()
+    if normalized in YES:
+        return "yes"
+    if normalized in NO:
+        return "no"
+    return value
+
+
+def coerce_list(value):
+    """A single waypoint, or waypoints separated by semicolons, as a list"""
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(";") if item.strip()]
+    return value
+
+
+class RepairingOutputParser(PydanticOutputParser):
+    """
+    PydanticOutputParser that repairs malformed JSON locally before giving up,
+    and passes fields through coercions (field name -> function) before
+    validation
+    """
+
+    coercions: Dict[str, Callable[[Any], Any]] = {}
+
+    def parse(self, text):
+        try:
+            obj = json.loads(json_block(text) or "", strict=False)
+            if not isinstance(obj, dict):
+                raise ValueError("not a JSON object")
+        except ValueError:
+            try:
+                obj = repair_json(text)
+            except ValueError as e:
+                raise OutputParserException(
+                    "Failed to parse {} from completion {}. Got: {}".format(
+                        self.pydantic_object.__name__, text, e
+                    ),
+                    llm_output=text,
+                )
+            logger.info(
+                "Repaired malformed {} output".format(self.pydantic_object.__name__)
+            )
+
+        for field, coerce in self.coercions.items():
+            if field in obj:
+                obj[field] = coerce(obj[field])
+
+        try:
+            return self.pydantic_object.parse_obj(obj)
+        except ValidationError as e:
+            raise OutputParserException(
+                "Failed to parse {} from completion {}. Got: {}".format(
+                    self.pydantic_object.__name__, text, e
+                ),
+                llm_output=text,
+            )
+
+    @property
+    def _type(self):
+        return "repairing_pydantic"
+
+
+class ReaskChain(Chain):
+    """
+    Runs llm_chain, and when its output can't be parsed even after local repair,
+    sends the bad output back to the same model with the format instructions
+    and parses its corrected answer. Only this chain's LLM call is repeated.
+    """
+
+    llm_chain: LLMChain
+    max_reasks: int = OUTPUT_PARSER_REASKS
+
+    @property
+    def input_keys(self) -> List[str]:
+        return self.llm_chain.input_keys
+
+    @property
+    def output_keys(self) -> List[str]:
+        return self.llm_chain.output_keys
+
+    def _call(self, inputs, run_manager=None):
+        callbacks = run_manager.get_child() if run_manager else None
+        try:
+            return self.llm_chain(inputs, callbacks=callbacks, return_only_outputs=True)
+        except OutputParserException as e:
+            error = e
+
+        fix_chain = self._fix_chain()
+        for attempt in range(self.max_reasks):
+            self._log_reask(error, attempt)
+            completion = fix_chain.run(callbacks=callbacks, **self._fix_inputs(error))
+            try:
+                return {self.llm_chain.output_key: self._parse(completion)}
+            except OutputParserException as e:
+                error = e
+        raise error
+
+    async def _acall(self, inputs, run_manager=None):
+        callbacks = run_manager.get_child() if run_manager else None
+        try:
+            return await self.llm_chain.acall(
+                inputs, callbacks=callbacks, return_only_outputs=True
+            )
+        except OutputParserException as e:
+            error = e
+
+        fix_chain = self._fix_chain()
+        for attempt in range(self.max_reasks):
+            self._log_reask(error, attempt)
+            completion = await fix_chain.arun(
+                callbacks=callbacks, **self._fix_inputs(error)
+            )
+            try:
+                return {self.llm_chain.output_key: self._parse(completion)}
+            except OutputParserException as e:
+                error = e
+        raise error
+
+    def _fix_chain(self):
+        return LLMChain(llm=self.llm_chain.llm, prompt=NAIVE_FIX_PROMPT)
+
+    def _fix_inputs(self, error):
+        return {
+            "instructions": self.llm_chain.output_parser.get_format_instructions(),
+            "completion": error.llm_output,
+            "error": repr(error),
+        }
+
+    def _parse(self, completion):
+        return self.llm_chain.output_parser.parse(completion)
+
+    def _log_reask(self, error, attempt):
+        logger.warning(
+            "Output of {} could not be parsed ({}), re-asking the model ({} of {})".format(
+                self.llm_chain.output_key, error, attempt + 1, self.max_reasks
+            )
+        )
+
+    @property
+    def _chain_type(self):
+        return "reask_chain"
@@ -3,7 +3,11 @@ from langchain.prompts.chat import (
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
-from langchain.output_parsers import PydanticOutputParser
+from travel_mapper.agent.repair import (
+    RepairingOutputParser,
+    coerce_yes_no,
+    coerce_list,
+)
 from pydantic import BaseModel, Field
 from typing import List
 
@@ -46,7 +50,9 @@ class ValidationTemplate(object):
       ####{query}####
     """
 
-        self.parser = PydanticOutputParser(pydantic_object=Validation)
+        self.parser = RepairingOutputParser(
+            pydantic_object=Validation, coercions={"plan_is_valid": coerce_yes_no}
+        )
 
         self.system_message_prompt = SystemMessagePromptTemplate.from_template(
             self.system_template,
@@ -139,7 +145,9 @@ class MappingTemplate(object):
       ####{agent_suggestion}####
     """
 
-        self.parser = PydanticOutputParser(pydantic_object=Trip)
+        self.parser = RepairingOutputParser(
+            pydantic_object=Trip, coercions={"waypoints": coerce_list}
+        )
 
         self.system_message_prompt = SystemMessagePromptTemplate.from_template(
             self.system_template,
@@ -0,0 +1,362 @@
+"""
+Plans trips for a JSONL file of queries, one {"id": ..., "query": ...} object
+(or a bare JSON string) per line, through TravelMapperBase.aparse with a
+bounded number of queries in flight. All queries share the Agent's LLM
+response cache and the RouteFinder's geocode and directions caches.
+
+Results are appended to the output JSONL as each query finishes, so a run
+that is interrupted picks up where it stopped when started again: ids that
+already have a result are skipped, ids that failed are retried. Lines that
+aren't queries are recorded as failed, the rest of the file still runs.
+
+Run from the top level directory of the travel mapper project:
+    python -m travel_mapper.batch queries.jsonl results.jsonl --concurrency 8
+"""
+
+from travel_mapper.TravelMapper import (
+    TravelMapperBase,
+    load_secrets,
+    assert_secrets,
+)
+from travel_mapper.constants import BATCH_CONCURRENCY, SUPPORTED_MODELS
+from travel_mapper import http_pool, tracing
+from collections import defaultdict
+import argparse
+import asyncio
+import json
+import logging
+import numpy as np
+import os
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+
+
+def read_queries(input_path):
+    """
+    Yields (id, query) from input_path a line at a time, queries without an id
+    are numbered by their line. Blank lines are skipped. A line that isn't a
+    query is logged and yielded as (line number, ValueError) rather than
+    ending the run.
+    """
+    with open(input_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {"query": record}
+                query_id = record.get("id", line_number)
+                query = record["query"]
+            except (ValueError, AttributeError, KeyError) as e:
+                error = ValueError(
+                    "line {} is not a query : {!r}".format(line_number, e)
+                )
+                logger.warning("Skipping {}".format(error))
+                yield line_number, error
+                continue
+            yield query_id, query
+
+
+def completed_ids(output_path):
+    """
+    Ids with a result in output_path, nothing if it doesn't exist. A run that
+    was killed may have left half a line at the end, it is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" in record:
+                done.discard(record["id"])
+            else:
+                done.add(record["id"])
+    return done
+
+
+def end_with_newline(output_path):
+    """Make sure appended results start on a line of their own"""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def percentiles(values, qs=PERCENTILES):
+    return {"p{}".format(q): float(np.percentile(values, q)) for q in qs}
+
+
+class BatchStats(object):
+    """Counts, throughput and per stage latencies of a batch run"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.counts = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.durations = defaultdict(list)
+
+    def add(self, status, traces=()):
+        """
+        Parameters
+        ----------
+        status
+            "ok", "invalid" or "failed"
+        traces
+            Traces of the query, stage latencies and counters are summed over them
+        """
+        self.counts[status] += 1
+        if not traces:
+            return
+
+        stages = defaultdict(float)
+        for trace in traces:
+            stages["total"] += trace.duration
+            for stage, duration in trace.stage_durations().items():
+                stages[stage] += duration
+            for name, n in trace.counters.items():
+                self.counters[name] += n
+        for stage, duration in stages.items():
+            self.durations[stage].append(duration)
+
+    @property
+    def elapsed(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def completed(self):
+        return self.counts["ok"] + self.counts["invalid"]
+
+    def to_dict(self):
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "counts": dict(self.counts),
+            "queries_per_second": round(self.completed / self.elapsed, 3)
+            if self.elapsed
+            else 0.0,
+            "counters": dict(self.counters),
+            "stages": {
+                stage: {k: round(v, 3) for k, v in percentiles(values).items()}
+                for stage, values in self.durations.items()
+            },
+        }
+
+    def report(self):
+        stats = self.to_dict()
+        lines = [
+            "queries : {} ok, {} invalid, {} failed, {} skipped".format(
+                self.counts["ok"],
+                self.counts["invalid"],
+                self.counts["failed"],
+                self.counts["skipped"],
+            ),
+            "elapsed : {:.1f}s, throughput : {:.2f} queries/s".format(
+                stats["elapsed"], stats["queries_per_second"]
+            ),
+            "{:<12}".format("stage (s)")
+            + "".join("{:>10}".format("p{}".format(q)) for q in PERCENTILES),
+        ]
+        for stage in sorted(stats["stages"], key=lambda s: (s != "total", s)):
+            lines.append(
+                "{:<12}".format(stage)
+                + "".join(
+                    "{:>10.3f}".format(stats["stages"][stage]["p{}".format(q)])
+                    for q in PERCENTILES
+                )
+            )
+        for name in sorted(stats["counters"]):
+            lines.append("{} : {}".format(name, stats["counters"][name]))
+        return "\n".join(lines)
+
+
+async def aplan_trip(travel_mapper, query_id, query, route=False):
+    """
+
+    Parameters
+    ----------
+    travel_mapper
+        TravelMapperBase
+    query_id
+    query
+    route
+        also geocode the places and fetch directions between them
+
+    Returns
+    -------
+    output record of the query, and the Traces of its requests
+    """
+    result = await travel_mapper.aparse(query, make_map=False)
+    traces = [result.trace]
+    itinerary, list_of_places, validation = result
+    record = {
+        "id": query_id,
+        "query": query,
+        "itinerary": itinerary,
+        "list_of_places": list_of_places,
+        "validation": validation["validation_output"].dict(),
+    }
+
+    if route and list_of_places is not None:
+        with tracing.trace("route") as route_trace:
+            route_result = await travel_mapper.route_finder.agenerate_route(
+                list_of_places, itinerary, include_map=False
+            )
+        _, sampled_route, mapping_dict = route_result
+        traces.append(route_trace)
+        record["mapping_dict"] = mapping_dict
+        record["route_points"] = sum(
+            len(leg["route"]) for leg in sampled_route.values()
+        )
+
+    record["stages"] = {
+        stage: round(duration, 3)
+        for trace in traces
+        for stage, duration in trace.stage_durations().items()
+    }
+    return record, traces
+
+
+async def arun_batch(
+    travel_mapper, input_path, output_path, concurrency=BATCH_CONCURRENCY, route=False
+):
+    """
+
+    Parameters
+    ----------
+    travel_mapper
+        TravelMapperBase
+    input_path
+        JSONL of queries
+    output_path
+        JSONL results are appended to
+    concurrency
+        queries in flight at once
+    route
+        also compute the route of every valid trip
+
+    Returns
+    -------
+    BatchStats
+    """
+    stats = BatchStats()
+    done = completed_ids(output_path)
+    if done:
+        logger.info("Resuming, {} queries already have results".format(len(done)))
+    # ids of this input that already have a result, done may hold others
+    skipped = set()
+    end_with_newline(output_path)
+
+    # bounded, so a huge input file is read as fast as it is processed and no faster
+    queue = asyncio.Queue(maxsize=2 * concurrency)
+
+    with open(output_path, "a") as out:
+
+        def write(record):
+            out.write(json.dumps(record) + "\n")
+            # every finished query survives the run being killed
+            out.flush()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                query_id, query = item
+                try:
+                    record, traces = await aplan_trip(
+                        travel_mapper, query_id, query, route=route
+                    )
+                except Exception as e:
+                    logger.warning("Query {} failed : {!r}".format(query_id, e))
+                    record, traces = {
+                        "id": query_id,
+                        "query": query,
+                        "error": repr(e),
+                    }, []
+                    stats.add("failed")
+                else:
+                    stats.add(
+                        "invalid" if record["itinerary"] is None else "ok", traces
+                    )
+                write(record)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            for query_id, query in read_queries(input_path):
+                if query_id in done:
+                    skipped.add(query_id)
+                elif isinstance(query, Exception):
+                    # recorded as failed, so the line is read again once fixed
+                    write({"id": query_id, "error": repr(query)})
+                    stats.add("failed")
+                else:
+                    await queue.put((query_id, query))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await http_pool.close_session()
+
+    stats.counts["skipped"] = len(skipped)
+    stats.end = time.perf_counter()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input_path", help="JSONL file of queries")
+    parser.add_argument("output_path", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--model", choices=SUPPORTED_MODELS, default=None)
+    parser.add_argument(
+        "--route",
+        action="store_true",
+        help="also geocode the places of every trip and fetch its directions",
+    )
+    parser.add_argument(
+        "--stats-path", default=None, help="write the run's statistics as JSON"
+    )
+    args = parser.parse_args()
+
+    secrets = load_secrets()
+    assert_secrets(secrets)
+    travel_mapper = TravelMapperBase(
+        openai_api_key=secrets["OPENAI_API_KEY"],
+        google_maps_key=secrets["GOOGLE_MAPS_API_KEY"],
+        google_palm_api_key=secrets["GOOGLE_PALM_API_KEY"],
+    )
+    if args.model is not None:
+        travel_mapper.travel_agent.update_model_family(args.model)
+
+    stats = asyncio.run(
+        arun_batch(
+            travel_mapper,
+            args.input_path,
+            args.output_path,
+            concurrency=args.concurrency,
+            route=args.route,
+        )
+    )
+    print(stats.report())
+    if args.stats_path is not None:
+        with open(args.stats_path, "w") as f:
+            json.dump(stats.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
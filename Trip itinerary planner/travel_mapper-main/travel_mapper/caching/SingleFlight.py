@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, callers arriving while it is in flight wait for it and get the
+    same result (or exception). Nothing is kept once the call completes, pair
+    with a cache for that.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        """
+
+        Parameters
+        ----------
+        key
+            hashable key identifying the work
+        fn
+            function computing the result, called without arguments
+
+        Returns
+        -------
+        what fn returns, for this call or the one already in flight
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._stats["executed" if leader else "coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, coro_fn):
+        """asyncio counterpart of do, coro_fn returns an awaitable. Calls are coalesced per event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._async_calls.get((loop, key))
+            leader = task is None
+            if leader:
+                # the work runs in a task no caller owns, so cancelling any of
+                # them (the first one included) only stops it waiting
+                task = self._async_calls[(loop, key)] = loop.create_task(
+                    self._arun(loop, key, coro_fn)
+                )
+                # don't warn about exceptions nobody was left waiting for
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._stats["executed" if leader else "coalesced"] += 1
+
+        return await asyncio.shield(task)
+
+    async def _arun(self, loop, key, coro_fn):
+        try:
+            return await coro_fn()
+        finally:
+            with self._lock:
+                del self._async_calls[(loop, key)]
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats, in_flight=len(self._calls) + len(self._async_calls)
+            )
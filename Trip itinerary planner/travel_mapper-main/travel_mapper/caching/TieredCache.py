@@ -0,0 +1,238 @@
+from travel_mapper.caching.SingleFlight import SingleFlight
+from collections import OrderedDict
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class TieredCache(object):
+    """
+    Two level key/value cache : an in-process LRU in front of an (optional)
+    SQLite table. The SQLite file can be shared by several worker processes,
+    the LRU is private to the process. Values must be JSON serializable.
+    """
+
+    def __init__(self, name, db_path=None, max_size=1024, ttl=None):
+        """
+
+        Parameters
+        ----------
+        name
+            name of the SQLite table holding the entries
+        db_path
+            path to the SQLite file, if None only the in-memory tier is used
+        max_size
+            max number of entries kept in the in-memory tier
+        ttl
+            time to live of an entry in seconds, if None entries never expire
+
+        """
+        if not _TABLE_NAME.match(name):
+            raise ValueError("Invalid cache name {}".format(name))
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.name = name
+        self.db_path = db_path
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+        self._in_flight = SingleFlight()
+
+    def normalize_key(self, key):
+        """Hook for subclasses, maps a raw key to the key the entry is stored under"""
+        return key
+
+    def get(self, key, default=None):
+        """
+
+        Parameters
+        ----------
+        key
+        default
+
+        Returns
+        -------
+        the cached value, or default if the key is missing or expired
+        """
+        key = self.normalize_key(key)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+        entry = self._disk_get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > now:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._memory_set(key, expires_at, value)
+                return value
+            self._disk_delete(key)
+            with self._lock:
+                self._stats["expired"] += 1
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        """
+
+        Parameters
+        ----------
+        key
+        value
+        ttl
+            overrides the cache wide ttl for this entry
+
+        Returns
+        -------
+
+        """
+        key = self.normalize_key(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._memory_set(key, expires_at, value)
+        self._disk_set(key, expires_at, value)
+
+    def get_or_compute(self, key, compute_fn):
+        """
+        Return the cached value for key, calling compute_fn() and caching its
+        result on a miss. Concurrent misses on the same key share one compute_fn() call
+        """
+        value = self.get(key)
+        if value is None:
+            value = self._in_flight.do(
+                self.normalize_key(key), lambda: self._store(key, compute_fn())
+            )
+        return value
+
+    async def aget_or_compute(self, key, compute_fn):
+        """asyncio counterpart of get_or_compute, compute_fn() returns an awaitable"""
+        value = self.get(key)
+        if value is None:
+
+            async def compute():
+                return self._store(key, await compute_fn())
+
+            value = await self._in_flight.ado(self.normalize_key(key), compute)
+        return value
+
+    def _store(self, key, value):
+        # empty results (e.g. nothing found) are not cached
+        if value:
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = self._connection()
+        if conn is not None:
+            with conn:
+                conn.execute("DELETE FROM {}".format(self.name))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        stats["coalesced"] = self._in_flight.stats()["coalesced"]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3)
+            if lookups
+            else 0.0
+        )
+        return stats
+
+    def _memory_set(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads, so keep one per thread
+        if not self.db_path:
+            return None
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.isdir(db_dir):
+                self.logger.info("Generating cache dir {}".format(db_dir))
+                os.makedirs(db_dir, exist_ok=True)
+
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            # WAL lets readers in other processes proceed while one process writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS {} "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)".format(
+                        self.name
+                    )
+                )
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key):
+        conn = self._connection()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT expires_at, value FROM {} WHERE key = ?".format(self.name), (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _disk_set(self, key, expires_at, value):
+        conn = self._connection()
+        if conn is None:
+            return
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO {} (key, value, expires_at) VALUES (?, ?, ?)".format(
+                    self.name
+                ),
+                (key, json.dumps(value), expires_at),
+            )
+
+    def _disk_delete(self, key):
+        conn = self._connection()
+        if conn is None:
+            return
+        with conn:
+            conn.execute("DELETE FROM {} WHERE key = ?".format(self.name), (key,))
@@ -3,5 +3,50 @@ import os
 MODEL_NAME = "gpt-3.5-turbo"
 # MODEL_NAME = "gpt-4"
 # MODEL_NAME = "models/text-bison-001"  # palm
+# chains for these are built at startup, requests pick one of them
+SUPPORTED_MODELS = ["gpt-3.5-turbo", "gpt-4", "models/text-bison-001"]
 TEMPERATURE = 0
 MAPS_DUMP_DIR = os.path.join(os.getcwd(), "maps")
+CACHE_DIR = os.path.join(os.getcwd(), "cache")
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode_cache.sqlite")
+GEOCODE_CACHE_SIZE = 2048
+GEOCODE_CACHE_TTL = 30 * 24 * 3600  # seconds
+MAPS_MAX_WORKERS = 8
+HTTP_POOL_SIZE = 100
+HTTP_KEEPALIVE_TIMEOUT = 30  # seconds
+DIRECTIONS_CACHE_PATH = os.path.join(CACHE_DIR, "directions_cache.sqlite")
+DIRECTIONS_CACHE_SIZE = 4096
+DIRECTIONS_CACHE_TTL = 7 * 24 * 3600  # seconds
+DEPARTURE_BUCKET_SECONDS = 3600
+# a trip with cached legs is stitched together when its missing legs take at most this many
+# directions calls (one per run of consecutive missing legs), otherwise it is requested whole
+MAX_STITCHED_DIRECTIONS_CALLS = 2
+ROUTE_QUANTIZE_E7 = False
+# the route drawn on maps is simplified to what can be seen at this zoom level, None to disable
+MAP_SIMPLIFY_ZOOM = 13
+# decimals kept in the coordinates of the map's GeoJSON, 5 is about a metre
+MAP_COORDINATE_PRECISION = 5
+# order the stops of trips too long for a single directions call before splitting them
+OPTIMIZE_WAYPOINT_ORDER = True
+WAYPOINT_OPTIMIZER_TIME_LIMIT = 1.0  # seconds
+MAPS_QUERIES_PER_SECOND = 50  # per API key
+MAPS_BURST = 10
+MAPS_MAX_RETRIES = 5
+MAPS_RETRY_BASE_DELAY = 0.5  # seconds, doubled on every retry
+MAPS_RETRY_MAX_DELAY = 16  # seconds
+# how long googlemaps.Client keeps retrying server errors on its own before raising Timeout
+MAPS_CLIENT_RETRY_TIMEOUT = 1  # seconds
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_cache.sqlite")
+LLM_CACHE_SIZE = 512
+LLM_CACHE_TTL = 7 * 24 * 3600  # seconds
+# start the itinerary chain while the query is still being validated
+SPECULATIVE_AGENT = True
+# speculative itinerary chains a (sync) Agent runs at once, the UI passes its LLM_CONCURRENCY
+SPECULATIVE_MAX_WORKERS = 8
+# times a chain's output is sent back to the model for fixing when local repair fails
+OUTPUT_PARSER_REASKS = 1
+# read the trip off the itinerary text instead of asking the LLM, unless the parse looks unreliable
+LOCAL_TRIP_EXTRACTION = True
+LOCAL_TRIP_MIN_CONFIDENCE = 0.7
+# queries of a batch run (python -m travel_mapper.batch) in flight at once
+BATCH_CONCURRENCY = 8
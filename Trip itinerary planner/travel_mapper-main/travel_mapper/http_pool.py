@@ -0,0 +1,59 @@
+from travel_mapper.constants import HTTP_POOL_SIZE, HTTP_KEEPALIVE_TIMEOUT
+import aiohttp
+import asyncio
+
+# one keep-alive session per event loop, aiohttp sessions can't be shared across loops
+_sessions = {}
+
+
+def get_session():
+    """
+    Returns the pooled aiohttp session for the running event loop, creating it
+    on first use. Connections are kept alive between requests so repeated calls
+    to the OpenAI and Google Maps APIs skip the TCP and TLS handshakes.
+
+    Returns
+    -------
+    aiohttp.ClientSession
+    """
+    loop = asyncio.get_running_loop()
+    _forget_closed_loops()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = session
+    return session
+
+
+def _forget_closed_loops():
+    # every asyncio.run makes a new loop, drop the sessions of the finished ones
+    for loop in [loop for loop in _sessions if loop.is_closed()]:
+        del _sessions[loop]
+
+
+async def close_session():
+    """Close the pooled session of the running event loop, if any"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def close_all_sessions(timeout=5):
+    """
+    Close the pooled sessions of every event loop still running, from outside
+    them, e.g. once the UI server has stopped. Sessions of loops that have
+    already been closed are just dropped.
+    """
+    _forget_closed_loops()
+    for loop, session in list(_sessions.items()):
+        _sessions.pop(loop, None)
+        if session.closed or not loop.is_running():
+            continue
+        try:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout)
+        except Exception:
+            # the loop is going away, its connections go with it
+            pass
@@ -1,21 +1,34 @@
 from datetime import datetime
-import folium
-from branca.element import Figure
 from travel_mapper.constants import MAPS_DUMP_DIR
+from travel_mapper.mapping.geojson import add_route_layer, map_start
 import logging
 import os
 
 logging.basicConfig(level=logging.INFO)
 
+# folium (and branca, pandas under it) is imported when a map is first drawn,
+# code that never draws one doesn't pay for it at start up
+
 
 class RouteMapper:
     def __init__(self, h=500, w=1000):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        self.figure = Figure(height=h, width=w)
+        self.height = h
+        self.width = w
+        self._figure = None
         self.map_name = "route_map.html"
         self.save_map = True
         self.map = None
+        self.simplification_report = None
+
+    @property
+    def figure(self):
+        if self._figure is None:
+            from branca.element import Figure
+
+            self._figure = Figure(height=self.height, width=self.width)
+        return self._figure
 
     def add_list_of_places(self, list_of_places):
         self.map_name = self.auto_generate_map_name(list_of_places)
@@ -31,61 +44,25 @@ class RouteMapper:
         map = self.generate_route_map(self, directions_list, route_dict)
         self.figure.add_child(map)
 
-    def generate_route_map(self, directions_list, route_dict):
-        map_start_loc_lat = directions_list[0]["legs"][0]["start_location"]["lat"]
-        map_start_loc_lon = directions_list[0]["legs"][0]["start_location"]["lng"]
-        map_start_loc = [map_start_loc_lat, map_start_loc_lon]
-
-        marker_points = []
-
-        # extract the location points from the previous directions function
-        self.logger.info("Generating marker_points for map")
-        for segment in directions_list:
-            for leg in segment["legs"]:
-                leg_start_loc = leg["start_location"]
-                marker_points.append(
-                    ([leg_start_loc["lat"], leg_start_loc["lng"]], leg["start_address"])
-                )
-
-        last_stop = directions_list[-1]["legs"][-1]
-        last_stop_coords = last_stop["end_location"]
-        marker_points.append(
-            (
-                [last_stop_coords["lat"], last_stop_coords["lng"]],
-                last_stop["end_address"],
-            )
-        )
+    def generate_route_map(self, directions_list, route_dict, simplify_zoom=None):
+        import folium
 
         self.logger.info("Setting up the map")
+        map = folium.Map(
+            location=map_start(directions_list), tiles="cartodbpositron", zoom_start=10
+        )
 
-        map = folium.Map(location=map_start_loc, tiles="cartodbpositron", zoom_start=10)
-
-        # Add waypoint markers to the map
-        for location, address in marker_points:
-            folium.Marker(
-                location=location,
-                popup=address,
-                tooltip="<strong>Click for address</strong>",
-                icon=folium.Icon(color="red", icon="info-sign"),
-            ).add_to(map)
-
-        # Add lines to the map
-
-        self.logger.info("Adding route segments to the map")
-
-        for leg_id, route_points in route_dict.items():
-            leg_distance = route_points["distance"]
-            leg_duration = route_points["duration"]
-
-            f_group = folium.FeatureGroup("Leg {}".format(leg_id))
-            folium.vector_layers.PolyLine(
-                route_points["route"],
-                popup="<b>Route segment {}</b>".format(leg_id),
-                tooltip="Distance: {}, Duration: {}".format(leg_distance, leg_duration),
-                color="blue",
-                weight=2,
-            ).add_to(f_group)
-            f_group.add_to(map)
+        # stops and legs go on the map as a single GeoJSON layer
+        self.logger.info("Adding the route to the map")
+        self.simplification_report = add_route_layer(
+            map, directions_list, route_dict, simplify_zoom=simplify_zoom
+        )
+        if self.simplification_report is not None:
+            # points that can't be told apart at this zoom level were dropped, this
+            # keeps the saved html small for long trips
+            self.logger.info(
+                "Simplified route for map : {}".format(self.simplification_report)
+            )
 
         if self.save_map:
             self.logger.info("Saving map to {}/{}".format(MAPS_DUMP_DIR, self.map_name))
@@ -0,0 +1,132 @@
+"""
+Renders a trip onto a folium (or leafmap) map as a single GeoJSON layer: one
+LineString per leg and one Point per stop, with compact coordinates, instead
+of a FeatureGroup, PolyLine and Marker each. Used for the saved maps
+(RouteMapper) and the UI (generate_leafmap).
+"""
+
+from travel_mapper.constants import MAP_COORDINATE_PRECISION
+from travel_mapper.mapping.simplify import simplify_route
+import numpy as np
+
+ROUTE_STYLE = {"color": "blue", "weight": 2}
+
+
+def stops_of(directions_list):
+    """
+
+    Parameters
+    ----------
+    directions_list
+        directions results of the route's segments
+
+    Returns
+    -------
+    list of ((lat, lng), address) of the start of every leg and the end of the last one
+    """
+    stops = []
+    for segment in directions_list:
+        for leg in segment["legs"]:
+            location = leg["start_location"]
+            stops.append(((location["lat"], location["lng"]), leg["start_address"]))
+
+    last_leg = directions_list[-1]["legs"][-1]
+    location = last_leg["end_location"]
+    stops.append(((location["lat"], location["lng"]), last_leg["end_address"]))
+    return stops
+
+
+def map_start(directions_list):
+    location = directions_list[0]["legs"][0]["start_location"]
+    return [location["lat"], location["lng"]]
+
+
+def compact_coordinates(points, precision=MAP_COORDINATE_PRECISION):
+    """GeoJSON [lng, lat] pairs of (lat, lng) points, rounded to precision decimals"""
+    points = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2), precision)
+    return points[:, ::-1].tolist()
+
+
+def route_geojson(directions_list, route_dict, precision=MAP_COORDINATE_PRECISION):
+    """
+
+    Parameters
+    ----------
+    directions_list
+        directions results of the route's segments, for the stops
+    route_dict
+        sampled route, as returned by RouteFinder.sample_route_with_legs
+    precision
+        decimals kept in the coordinates
+
+    Returns
+    -------
+    GeoJSON FeatureCollection dict, every feature has a "label" property
+    """
+    features = []
+    for leg_id, leg in route_dict.items():
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "LineString",
+                    "coordinates": compact_coordinates(leg["route"], precision),
+                },
+                "properties": {
+                    "leg": leg_id,
+                    "distance": leg["distance"],
+                    "duration": leg["duration"],
+                    "label": "Leg {} : {}, {}".format(
+                        leg_id, leg["distance"], leg["duration"]
+                    ),
+                },
+            }
+        )
+
+    for stop_id, (location, address) in enumerate(stops_of(directions_list)):
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": compact_coordinates([location], precision)[0],
+                },
+                "properties": {"stop": stop_id, "label": address},
+            }
+        )
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def add_route_layer(map, directions_list, route_dict, simplify_zoom=None):
+    """
+
+    Parameters
+    ----------
+    map
+        folium.Map or leafmap.Map the route is added to
+    directions_list
+    route_dict
+    simplify_zoom
+        when given, the route is first simplified to what can be seen at this zoom level
+
+    Returns
+    -------
+    simplification report, None if the route wasn't simplified
+    """
+    # only drawing the map needs folium, see RouteMapper
+    import folium
+
+    report = None
+    if simplify_zoom is not None:
+        route_dict, report = simplify_route(route_dict, zoom=simplify_zoom)
+
+    folium.GeoJson(
+        route_geojson(directions_list, route_dict),
+        name="Route",
+        style_function=lambda feature: ROUTE_STYLE,
+        tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False),
+        popup=folium.GeoJsonPopup(fields=["label"], labels=False),
+        marker=folium.Marker(icon=folium.Icon(color="red", icon="info-sign")),
+    ).add_to(map)
+    return report
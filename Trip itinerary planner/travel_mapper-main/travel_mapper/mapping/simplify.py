@@ -0,0 +1,136 @@
+import json
+import numpy as np
+
+# metres per pixel at zoom level 0 on the equator for 256 px web mercator tiles
+EQUATOR_METRES_PER_PIXEL = 156543.03392
+METRES_PER_DEGREE_LAT = 110540.0
+METRES_PER_DEGREE_LNG = 111320.0
+
+
+def zoom_tolerance_m(zoom, latitude=0.0, pixels=1.0):
+    """
+    Tolerance matching the given number of screen pixels at a web map zoom level,
+    details smaller than this can't be seen on the map anyway
+
+    Parameters
+    ----------
+    zoom
+    latitude
+    pixels
+
+    Returns
+    -------
+    tolerance in metres
+    """
+    return (
+        pixels * EQUATOR_METRES_PER_PIXEL * np.cos(np.radians(latitude)) / (2**zoom)
+    )
+
+
+def douglas_peucker(points, tolerance_m):
+    """
+    Douglas-Peucker simplification of a single polyline. The first and last
+    point are always kept.
+
+    Parameters
+    ----------
+    points
+        (n, 2) array of lat, lng
+    tolerance_m
+        max distance in metres between the polyline and its simplification
+
+    Returns
+    -------
+    sorted array of the indices of the points to keep
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+
+    # equirectangular projection around the polyline is accurate enough at this scale
+    cos_lat = np.cos(np.radians(points[:, 0].mean()))
+    xy = np.column_stack(
+        [
+            points[:, 1] * METRES_PER_DEGREE_LNG * cos_lat,
+            points[:, 0] * METRES_PER_DEGREE_LAT,
+        ]
+    )
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        segment = xy[last] - xy[first]
+        offsets = xy[first + 1 : last] - xy[first]
+        length = np.hypot(*segment)
+        if length > 0:
+            cross = segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]
+            distances = np.abs(cross) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return np.flatnonzero(keep)
+
+
+def simplify_route(route_dict, tolerance_m=None, zoom=None):
+    """
+    Simplify every leg of a sampled route before it is drawn on a map. Leg
+    endpoints are always preserved.
+
+    Parameters
+    ----------
+    route_dict
+        sampled route, as returned by RouteFinder.sample_route_with_legs
+    tolerance_m
+        simplification tolerance in metres
+    zoom
+        derive the tolerance from this zoom level instead, one pixel at the route's latitude
+
+    Returns
+    -------
+    simplified route dict, and a report of the point and byte reduction
+    """
+    legs = {
+        k: np.asarray(v["route"], dtype=np.float64).reshape(-1, 2)
+        for k, v in route_dict.items()
+    }
+
+    if tolerance_m is None:
+        if zoom is None:
+            raise ValueError("Either tolerance_m or zoom must be given")
+        all_points = np.concatenate(list(legs.values())) if legs else np.zeros((1, 2))
+        latitude = all_points[:, 0].mean() if len(all_points) else 0.0
+        tolerance_m = zoom_tolerance_m(zoom, latitude)
+
+    simplified = {}
+    for leg_id, route_points in route_dict.items():
+        kept = legs[leg_id][douglas_peucker(legs[leg_id], tolerance_m)]
+        simplified[leg_id] = dict(route_points, route=list(zip(*kept.T.tolist())))
+
+    report = {
+        "tolerance_m": round(float(tolerance_m), 2),
+        "points_before": sum(len(v["route"]) for v in route_dict.values()),
+        "points_after": sum(len(v["route"]) for v in simplified.values()),
+        "bytes_before": _route_size_in_bytes(route_dict),
+        "bytes_after": _route_size_in_bytes(simplified),
+    }
+    return simplified, report
+
+
+def _route_size_in_bytes(route_dict):
+    # folium embeds the coordinates as JSON, so that is what ends up in the page
+    return sum(
+        len(json.dumps([list(p) for p in v["route"]])) for v in route_dict.values()
+    )
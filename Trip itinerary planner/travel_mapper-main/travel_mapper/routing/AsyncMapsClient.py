@@ -0,0 +1,128 @@
+from googlemaps import convert
+from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+from travel_mapper.constants import MAPS_MAX_WORKERS
+from travel_mapper.routing.KeyPool import KeyPool
+from travel_mapper import http_pool
+import aiohttp
+import asyncio
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+
+class AsyncMapsClient(object):
+    """
+    asyncio counterpart of the two googlemaps.Client calls RouteFinder makes.
+    Responses have the same shape as googlemaps.Client.geocode and
+    googlemaps.Client.directions, so get_route and RouteMapper consume them as is.
+    """
+
+    BASE_URL = "https://maps.googleapis.com"
+
+    def __init__(
+        self, google_maps_api_key, max_concurrency=MAPS_MAX_WORKERS, key_pool=None
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        # requests are rate limited and retried by the key pool, pass the
+        # GoogleMapsBackend's pool so sync and async calls share the quota
+        self.key_pool = (
+            key_pool if key_pool is not None else KeyPool(google_maps_api_key)
+        )
+        self.max_concurrency = max_concurrency
+        self._semaphores = {}
+
+    def _semaphore(self):
+        # semaphores are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(max(self.max_concurrency, 1))
+        return self._semaphores[loop]
+
+    async def _request(self, path, params):
+        return await self.key_pool.acall(
+            lambda key: self._request_with_key(path, params, key)
+        )
+
+    async def _request_with_key(self, path, params, key):
+        params = dict(params, key=key)
+        async with self._semaphore():
+            try:
+                async with http_pool.get_session().get(
+                    self.BASE_URL + path, params=params
+                ) as response:
+                    if response.status != 200:
+                        raise HTTPError(response.status)
+                    body = await response.json()
+            except asyncio.TimeoutError:
+                raise Timeout()
+            except aiohttp.ClientError as e:
+                raise TransportError(e)
+
+        api_status = body["status"]
+        if api_status == "OK" or api_status == "ZERO_RESULTS":
+            return body
+        raise ApiError(api_status, body.get("error_message"))
+
+    async def geocode(self, address):
+        """
+
+        Parameters
+        ----------
+        address
+
+        Returns
+        -------
+        list of geocoding results
+        """
+        body = await self._request("/maps/api/geocode/json", {"address": address})
+        return body.get("results", [])
+
+    async def directions(
+        self,
+        origin,
+        destination,
+        waypoints=None,
+        mode=None,
+        units=None,
+        optimize_waypoints=False,
+        traffic_model=None,
+        departure_time=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        origin
+        destination
+        waypoints
+        mode
+        units
+        optimize_waypoints
+        traffic_model
+        departure_time
+
+        Returns
+        -------
+        list of routes
+        """
+        params = {
+            "origin": convert.latlng(origin),
+            "destination": convert.latlng(destination),
+        }
+        if mode:
+            params["mode"] = mode
+        if waypoints:
+            waypoints = convert.location_list(waypoints)
+            if optimize_waypoints:
+                waypoints = "optimize:true|" + waypoints
+            params["waypoints"] = waypoints
+        if units:
+            params["units"] = units
+        if departure_time:
+            params["departure_time"] = convert.time(departure_time)
+        if traffic_model:
+            params["traffic_model"] = traffic_model
+
+        body = await self._request("/maps/api/directions/json", params)
+        return body.get("routes", [])
@@ -0,0 +1,103 @@
+from travel_mapper.caching.TieredCache import TieredCache
+from travel_mapper.constants import (
+    DEPARTURE_BUCKET_SECONDS,
+    DIRECTIONS_CACHE_PATH,
+    DIRECTIONS_CACHE_SIZE,
+    DIRECTIONS_CACHE_TTL,
+)
+
+
+class DirectionsCache(TieredCache):
+    """
+    Caches single legs of Google Maps directions results, keyed by
+    (origin place_id, destination place_id, mode, departure time bucket).
+    Trips that share legs can then be stitched together from cached legs.
+    The visiting order the API chose for an optimized request is kept too, so
+    its legs can be looked up in the order they were stored. Legs of different
+    routing backends are kept apart by namespace.
+    """
+
+    def __init__(
+        self,
+        db_path=DIRECTIONS_CACHE_PATH,
+        max_size=DIRECTIONS_CACHE_SIZE,
+        ttl=DIRECTIONS_CACHE_TTL,
+        bucket_seconds=DEPARTURE_BUCKET_SECONDS,
+        namespace=None,
+    ):
+        super().__init__(
+            "directions_legs" if namespace is None else "directions_legs_" + namespace,
+            db_path=db_path,
+            max_size=max_size,
+            ttl=ttl,
+        )
+        self.bucket_seconds = bucket_seconds
+
+    def departure_bucket(self, departure_time):
+        """Departure times within the same bucket share cached legs"""
+        return int(departure_time.timestamp() // self.bucket_seconds)
+
+    @staticmethod
+    def leg_key(origin, destination, mode, bucket):
+        return "{}|{}|{}|{}".format(origin, destination, mode, bucket)
+
+    @staticmethod
+    def waypoint_order_key(start, end, waypoints, mode, bucket):
+        return "order|{}|{}|{}|{}|{}".format(
+            start, end, ",".join(waypoints), mode, bucket
+        )
+
+    def get_waypoint_order(self, start, end, waypoints, mode, bucket):
+        """Order the API visited waypoints in for this request, None if unknown"""
+        return self.get(self.waypoint_order_key(start, end, waypoints, mode, bucket))
+
+    def get_legs(self, points, mode, bucket):
+        """
+
+        Parameters
+        ----------
+        points
+            place_id strings of the stops, in travel order
+        mode
+        bucket
+
+        Returns
+        -------
+        list with the cached leg between each pair of consecutive points, None where missing
+        """
+        return [
+            self.get(self.leg_key(points[i - 1], points[i], mode, bucket))
+            for i in range(1, len(points))
+        ]
+
+    def set_legs(self, points, legs, mode, bucket):
+        for i, leg in enumerate(legs):
+            self.set(self.leg_key(points[i], points[i + 1], mode, bucket), leg)
+
+    def set_route_legs(self, start, end, waypoints, route, mode, bucket):
+        """
+        Store the legs of a directions route. With optimize_waypoints the legs
+        follow route["waypoint_order"] rather than the requested order.
+
+        Parameters
+        ----------
+        start
+        end
+        waypoints
+        route
+            a single route of a directions result
+        mode
+        bucket
+
+        Returns
+        -------
+
+        """
+        waypoint_order = route.get("waypoint_order", list(range(len(waypoints))))
+        points = [start] + [waypoints[i] for i in waypoint_order] + [end]
+        if len(points) - 1 == len(route["legs"]):
+            self.set_legs(points, route["legs"], mode, bucket)
+            self.set(
+                self.waypoint_order_key(start, end, waypoints, mode, bucket),
+                list(waypoint_order),
+            )
@@ -0,0 +1,48 @@
+from travel_mapper.caching.TieredCache import TieredCache
+from travel_mapper.constants import (
+    GEOCODE_CACHE_PATH,
+    GEOCODE_CACHE_SIZE,
+    GEOCODE_CACHE_TTL,
+)
+import re
+
+
+class GeocodeCache(TieredCache):
+    """
+    Caches geocode results keyed by normalized address. Results of different
+    routing backends are kept apart by namespace.
+    """
+
+    def __init__(
+        self,
+        db_path=GEOCODE_CACHE_PATH,
+        max_size=GEOCODE_CACHE_SIZE,
+        ttl=GEOCODE_CACHE_TTL,
+        namespace=None,
+    ):
+        super().__init__(
+            "geocode" if namespace is None else "geocode_" + namespace,
+            db_path=db_path,
+            max_size=max_size,
+            ttl=ttl,
+        )
+
+    def normalize_key(self, key):
+        return self.normalize_address(key)
+
+    @staticmethod
+    def normalize_address(address):
+        """
+        "  Los Angeles,CA. " and "los angeles, ca" should share an entry
+
+        Parameters
+        ----------
+        address
+
+        Returns
+        -------
+
+        """
+        address = address.lower().strip().rstrip(".,;")
+        address = re.sub(r"\s*,\s*", ", ", address)
+        return re.sub(r"\s+", " ", address)
@@ -0,0 +1,221 @@
+from travel_mapper.routing.RoutingBackend import RoutingBackend
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.resampling import haversine_km
+from googlemaps.convert import encode_polyline
+import heapq
+import json
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+PLACE_ID_PREFIX = "place_id:"
+NODE_PREFIX = "node:"
+
+
+class GraphBackend(RoutingBackend):
+    """
+    Offline routing backend answering geocode and directions queries from a
+    local road graph, with no external calls. The graph file is JSON:
+
+        {
+            "nodes": {"<node id>": [lat, lng], ...},
+            "edges": [["<from id>", "<to id>", length_m, duration_s], ...],
+            "places": {"<address>": "<node id>", ...},
+            "oneway": false
+        }
+
+    Edges are two way unless "oneway" is true. Shortest paths (by length) are
+    found with A*, using the great circle distance as heuristic. Its answers
+    are only cached in memory, the graph file may change between runs.
+    """
+
+    def __init__(self, nodes, edges, places=None, oneway=False):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+        self.node_ids = list(nodes)
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.coords = np.array([nodes[n] for n in self.node_ids], dtype=np.float64)
+
+        self.adjacency = [[] for _ in self.node_ids]
+        for u, v, length_m, duration_s in edges:
+            u, v = self.node_index[str(u)], self.node_index[str(v)]
+            self.adjacency[u].append((v, float(length_m), float(duration_s)))
+            if not oneway:
+                self.adjacency[v].append((u, float(length_m), float(duration_s)))
+
+        self.places = {}
+        self.place_names = {}
+        for address, node_id in (places or {}).items():
+            self.places[GeocodeCache.normalize_address(address)] = str(node_id)
+            self.place_names.setdefault(str(node_id), address)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r") as f:
+            graph = json.load(f)
+        backend = cls(
+            graph["nodes"],
+            graph["edges"],
+            places=graph.get("places"),
+            oneway=graph.get("oneway", False),
+        )
+        backend.logger.info(
+            "Loaded road graph {} ({} nodes)".format(path, len(backend.node_ids))
+        )
+        return backend
+
+    def geocode(self, address):
+        node_id = self.places.get(GeocodeCache.normalize_address(address))
+        if node_id is None:
+            node_id = self._nearest_node_to_latlng(address)
+        if node_id is None:
+            return []
+
+        lat, lng = self.coords[self.node_index[node_id]].tolist()
+        return [
+            {
+                "place_id": NODE_PREFIX + node_id,
+                "formatted_address": self.place_names.get(node_id, address),
+                "geometry": {"location": {"lat": lat, "lng": lng}},
+            }
+        ]
+
+    def directions(
+        self,
+        origin,
+        destination,
+        waypoints=None,
+        mode=None,
+        units=None,
+        optimize_waypoints=False,
+        traffic_model=None,
+        departure_time=None,
+    ):
+        # waypoints are visited in the given order, optimize_waypoints is not supported
+        stops = [origin] + list(waypoints or []) + [destination]
+        nodes = [self._resolve(stop) for stop in stops]
+        if any(node is None for node in nodes):
+            return []
+
+        legs = []
+        for i in range(1, len(nodes)):
+            path = self.shortest_path(nodes[i - 1], nodes[i])
+            if path is None:
+                return []
+            legs.append(self._build_leg(*path))
+
+        return [
+            {
+                "legs": legs,
+                "waypoint_order": list(range(len(stops) - 2)),
+                "summary": "local road graph",
+            }
+        ]
+
+    async def ageocode(self, address):
+        # graph queries take milliseconds, no need for a thread
+        return self.geocode(address)
+
+    async def adirections(self, origin, destination, **kwargs):
+        return self.directions(origin, destination, **kwargs)
+
+    def shortest_path(self, source, target):
+        """
+        A* search between two node indices
+
+        Parameters
+        ----------
+        source
+        target
+
+        Returns
+        -------
+        (list of node indices, length in metres, duration in seconds), or None if unreachable
+        """
+        target_lat, target_lng = self.coords[target]
+        # straight line distance never overestimates the road distance
+        heuristic = (
+            haversine_km(self.coords[:, 0], self.coords[:, 1], target_lat, target_lng)
+            * 1000
+        )
+
+        best = {source: 0.0}
+        durations = {source: 0.0}
+        previous = {}
+        queue = [(heuristic[source], 0.0, source)]
+        done = set()
+
+        while queue:
+            _, length, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while path[-1] != source:
+                    path.append(previous[path[-1]])
+                return path[::-1], length, durations[node]
+            if node in done:
+                continue
+            done.add(node)
+
+            for neighbour, edge_length, edge_duration in self.adjacency[node]:
+                candidate = length + edge_length
+                if candidate < best.get(neighbour, np.inf):
+                    best[neighbour] = candidate
+                    durations[neighbour] = durations[node] + edge_duration
+                    previous[neighbour] = node
+                    heapq.heappush(
+                        queue, (candidate + heuristic[neighbour], candidate, neighbour)
+                    )
+
+        return None
+
+    def _resolve(self, stop):
+        if stop.startswith(PLACE_ID_PREFIX):
+            stop = stop[len(PLACE_ID_PREFIX) :]
+        if stop.startswith(NODE_PREFIX):
+            return self.node_index.get(stop[len(NODE_PREFIX) :])
+
+        results = self.geocode(stop)
+        if not results:
+            return None
+        return self.node_index[results[0]["place_id"][len(NODE_PREFIX) :]]
+
+    def _nearest_node_to_latlng(self, address):
+        try:
+            lat, lng = [float(x) for x in address.split(",")]
+        except ValueError:
+            return None
+        distances = haversine_km(self.coords[:, 0], self.coords[:, 1], lat, lng)
+        return self.node_ids[int(np.argmin(distances))]
+
+    def _address(self, node):
+        node_id = self.node_ids[node]
+        if node_id in self.place_names:
+            return self.place_names[node_id]
+        return "{},{}".format(*self.coords[node].tolist())
+
+    def _build_leg(self, path, length_m, duration_s):
+        points = [{"lat": lat, "lng": lng} for lat, lng in self.coords[path].tolist()]
+        return {
+            "start_address": self._address(path[0]),
+            "end_address": self._address(path[-1]),
+            "start_location": points[0],
+            "end_location": points[-1],
+            "distance": {
+                "text": "{:,.0f} km".format(length_m / 1000),
+                "value": int(round(length_m)),
+            },
+            "duration": {
+                "text": self._duration_text(duration_s),
+                "value": int(round(duration_s)),
+            },
+            "steps": [{"polyline": {"points": encode_polyline(points)}}],
+        }
+
+    @staticmethod
+    def _duration_text(duration_s):
+        hours, minutes = divmod(int(round(duration_s / 60)), 60)
+        if hours:
+            return "{} hours {} mins".format(hours, minutes)
+        return "{} mins".format(minutes)
@@ -0,0 +1,196 @@
+from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+from travel_mapper.constants import (
+    MAPS_QUERIES_PER_SECOND,
+    MAPS_BURST,
+    MAPS_MAX_RETRIES,
+    MAPS_RETRY_BASE_DELAY,
+    MAPS_RETRY_MAX_DELAY,
+)
+import asyncio
+import itertools
+import logging
+import random
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+
+class TokenBucket(object):
+    """Thread safe token bucket, shared by sync and asyncio callers"""
+
+    def __init__(self, rate, burst=1):
+        """
+
+        Parameters
+        ----------
+        rate
+            tokens added per second
+        burst
+            max number of tokens, i.e. requests that can go out at once
+        """
+        self.rate = float(rate)
+        self.burst = float(max(burst, 1))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returns how many seconds to wait before it may be used"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class KeyPool(object):
+    """
+    Pool of Google Maps API keys used round robin, each with its own rate
+    limit. Calls going through call or acall are retried with exponential
+    backoff and full jitter on quota errors, 5xx responses and transport
+    errors; other errors are raised straight away.
+    """
+
+    RETRIABLE_API_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+    RETRIABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        keys,
+        queries_per_second=MAPS_QUERIES_PER_SECOND,
+        burst=MAPS_BURST,
+        max_retries=MAPS_MAX_RETRIES,
+        base_delay=MAPS_RETRY_BASE_DELAY,
+        max_delay=MAPS_RETRY_MAX_DELAY,
+    ):
+        """
+
+        Parameters
+        ----------
+        keys
+            list of API keys, or a comma separated string of them
+        queries_per_second
+            rate limit of each key
+        burst
+        max_retries
+        base_delay
+            backoff before the first retry, in seconds, doubled on every retry
+        max_delay
+            cap on the backoff, in seconds
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+        self.keys = self.parse_keys(keys)
+        if not self.keys:
+            raise ValueError("At least one Google Maps API key is needed")
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {
+            key: TokenBucket(queries_per_second, burst) for key in self.keys
+        }
+        self.counters = {
+            key: {"requests": 0, "retried": 0, "over_query_limit": 0, "failed": 0}
+            for key in self.keys
+        }
+        self._cycle = itertools.cycle(self.keys)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_keys(keys):
+        if not keys:
+            return []
+        if isinstance(keys, str):
+            keys = keys.split(",")
+        return [key.strip() for key in keys if key and key.strip()]
+
+    def next_key(self):
+        with self._lock:
+            return next(self._cycle)
+
+    def call(self, fn):
+        """
+
+        Parameters
+        ----------
+        fn
+            function taking an API key and making the request with it
+
+        Returns
+        -------
+        what fn returns
+        """
+        for attempt in itertools.count():
+            key = self.next_key()
+            self.buckets[key].acquire()
+            self._count(key, "requests")
+            try:
+                return fn(key)
+            except Exception as e:
+                time.sleep(self._backoff(key, e, attempt))
+
+    async def acall(self, fn):
+        """asyncio counterpart of call, fn takes an API key and returns an awaitable"""
+        for attempt in itertools.count():
+            key = self.next_key()
+            await self.buckets[key].aacquire()
+            self._count(key, "requests")
+            try:
+                return await fn(key)
+            except Exception as e:
+                await asyncio.sleep(self._backoff(key, e, attempt))
+
+    def is_retriable(self, error):
+        if isinstance(error, ApiError):
+            return error.status in self.RETRIABLE_API_STATUSES
+        if isinstance(error, HTTPError):
+            return error.status_code in self.RETRIABLE_HTTP_STATUSES
+        return isinstance(error, (Timeout, TransportError))
+
+    def _backoff(self, key, error, attempt):
+        # re-raises the error when it shouldn't be retried, otherwise returns the delay
+        if not self.is_retriable(error) or attempt >= self.max_retries:
+            self._count(key, "failed")
+            raise error
+
+        if isinstance(error, ApiError) and error.status == "OVER_QUERY_LIMIT":
+            self._count(key, "over_query_limit")
+        self._count(key, "retried")
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        self.logger.warning(
+            "Google Maps request failed ({!r}), retry {} of {} in {:.2f}s".format(
+                error, attempt + 1, self.max_retries, delay
+            )
+        )
+        return delay
+
+    def _count(self, key, counter):
+        with self._lock:
+            self.counters[key][counter] += 1
+
+    def usage(self):
+        """Per key usage counters, keys are masked to their last 4 characters"""
+        with self._lock:
+            return {
+                "key_{} (...{})".format(i, key[-4:]): dict(self.counters[key])
+                for i, key in enumerate(self.keys)
+            }
@@ -0,0 +1,196 @@
+from collections.abc import Mapping
+import numpy as np
+
+E7 = 1e7
+
+
+def decode_polyline_array(polyline):
+    """
+    Vectorized version of googlemaps.convert.decode_polyline, see
+    https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+
+    Parameters
+    ----------
+    polyline
+        encoded polyline string
+
+    Returns
+    -------
+    (n, 2) float64 array of lat, lng, with the same values decode_polyline gives
+    """
+    if not polyline:
+        return np.empty((0, 2), dtype=np.float64)
+
+    chunks = np.frombuffer(polyline.encode("ascii"), dtype=np.uint8).astype(np.int64)
+    chunks -= 63
+
+    # every value is a little endian run of 5 bit chunks, the last chunk of a
+    # value has the 0x20 continuation bit unset
+    is_last = (chunks & 0x20) == 0
+    starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    value_id = np.cumsum(np.concatenate(([0], is_last[:-1])))
+    position = np.arange(len(chunks)) - starts[value_id]
+
+    values = np.add.reduceat((chunks & 0x1F) << (5 * position), starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # multiply rather than divide so the floats match decode_polyline exactly
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) * 1e-5
+
+
+class RouteLeg(object):
+    """Route points of one leg as a contiguous (n, 2) array, plus its distance and duration"""
+
+    __slots__ = (
+        "coords",
+        "distance_m",
+        "duration_s",
+        "distance_text",
+        "duration_text",
+    )
+
+    def __init__(
+        self,
+        coords,
+        distance_m,
+        duration_s,
+        distance_text,
+        duration_text,
+        quantize=False,
+    ):
+        """
+
+        Parameters
+        ----------
+        coords
+            (n, 2) array of lat, lng
+        distance_m
+        duration_s
+        distance_text
+            human readable distance, as shown in the map tooltips
+        duration_text
+            human readable duration, as shown in the map tooltips
+        quantize
+            store the points as int32 degrees * 1e7 (~1 cm), halving memory use
+        """
+        coords = np.asarray(coords)
+        if quantize and coords.dtype != np.int32:
+            coords = np.round(coords * E7).astype(np.int32)
+        self.coords = np.ascontiguousarray(coords)
+        self.distance_m = distance_m
+        self.duration_s = duration_s
+        self.distance_text = distance_text
+        self.duration_text = duration_text
+
+    @classmethod
+    def from_directions_leg(cls, leg, quantize=False):
+        steps = [decode_polyline_array(s["polyline"]["points"]) for s in leg["steps"]]
+        coords = np.concatenate(steps) if steps else np.empty((0, 2))
+        return cls(
+            coords,
+            leg["distance"]["value"],
+            leg["duration"]["value"],
+            leg["distance"]["text"],
+            leg["duration"]["text"],
+            quantize=quantize,
+        )
+
+    @property
+    def quantized(self):
+        return self.coords.dtype == np.int32
+
+    @property
+    def latlng(self):
+        """(n, 2) float64 array of lat, lng"""
+        if self.quantized:
+            return self.coords / E7
+        return self.coords
+
+    def __len__(self):
+        return len(self.coords)
+
+    def to_dict(self):
+        """Legacy representation, as returned by get_route before routes were array backed"""
+        return {
+            "distance": self.distance_text,
+            "duration": self.duration_text,
+            "route": ["{},{}".format(lat, lng) for lat, lng in self.latlng.tolist()],
+        }
+
+
+class Route(Mapping):
+    """
+    Array backed route, keyed by leg number. Indexing returns the legacy
+    {"distance", "duration", "route"} dict of a leg, so code written against
+    the old get_route output keeps working; use leg() for the RouteLeg itself.
+    """
+
+    def __init__(self, legs=None, stops=None, transit_type=None, departure_bucket=None):
+        """
+
+        Parameters
+        ----------
+        legs
+            dict of leg number to RouteLeg
+        stops
+            place_id strings of the stops in visiting order, leg number k goes
+            from stops[k] to stops[k + 1]. None when unknown, e.g. for legacy dicts
+        transit_type
+            travel mode the legs were requested with, None when unknown
+        departure_bucket
+            departure bucket of the directions cache the legs were requested
+            for, None when unknown
+        """
+        self.legs = dict(legs) if legs else {}
+        self.stops = list(stops) if stops is not None else None
+        self.transit_type = transit_type
+        self.departure_bucket = departure_bucket
+
+    @classmethod
+    def from_directions(cls, directions_result, quantize=False):
+        return cls(
+            {
+                leg_number: RouteLeg.from_directions_leg(leg, quantize=quantize)
+                for leg_number, leg in enumerate(directions_result[0]["legs"])
+            }
+        )
+
+    @classmethod
+    def from_dict(cls, route_dict):
+        """Build a Route from the legacy {leg: {"distance", "duration", "route"}} dict"""
+        legs = {}
+        for leg_id, leg in route_dict.items():
+            coords = [[float(x) for x in point.split(",")] for point in leg["route"]]
+            # the legacy dict only has the human readable distance, e.g. "1,234 km"
+            distance_km = float(leg["distance"].split(" ")[0].replace(",", ""))
+            legs[leg_id] = RouteLeg(
+                np.array(coords, dtype=np.float64).reshape(-1, 2),
+                distance_km * 1000,
+                None,
+                leg["distance"],
+                leg["duration"],
+            )
+        return cls(legs)
+
+    def leg(self, leg_id):
+        return self.legs[leg_id]
+
+    def __getitem__(self, leg_id):
+        return self.legs[leg_id].to_dict()
+
+    def __iter__(self):
+        return iter(self.legs)
+
+    def __len__(self):
+        return len(self.legs)
+
+    @property
+    def total_distance_m(self):
+        return sum(leg.distance_m for leg in self.legs.values())
+
+    @property
+    def total_duration_s(self):
+        return sum(leg.duration_s or 0 for leg in self.legs.values())
+
+    def to_dict(self):
+        return {leg_id: leg.to_dict() for leg_id, leg in self.legs.items()}
@@ -1,22 +1,89 @@
 from travel_mapper.mapping.RouteMapper import RouteMapper
-from googlemaps.convert import decode_polyline
-import googlemaps
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.Route import Route, RouteLeg
+from travel_mapper.routing.resampling import resample_legs
+from travel_mapper.routing.RoutingBackend import GoogleMapsBackend
+from travel_mapper.routing.WaypointOptimizer import WaypointOptimizer
+from travel_mapper.caching.SingleFlight import SingleFlight
+from travel_mapper import tracing
+from travel_mapper.constants import (
+    MAPS_MAX_WORKERS,
+    MAP_SIMPLIFY_ZOOM,
+    MAX_STITCHED_DIRECTIONS_CALLS,
+    OPTIMIZE_WAYPOINT_ORDER,
+    ROUTE_QUANTIZE_E7,
+)
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from datetime import datetime
-import numpy as np
+import difflib
 import logging
+import threading
 import time
 
 logging.basicConfig(level=logging.INFO)
 
+# set in the threads running map_concurrently work, nested calls run inline there
+_worker_state = threading.local()
+
 
 class RouteFinder:
     MAX_WAYPOINTS_API_CALL = 23
 
-    def __init__(self, google_maps_api_key):
+    def __init__(
+        self,
+        google_maps_api_key=None,
+        geocode_cache=None,
+        directions_cache=None,
+        max_workers=MAPS_MAX_WORKERS,
+        backend=None,
+        optimize_waypoint_order=OPTIMIZE_WAYPOINT_ORDER,
+    ):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
         self.mapper = RouteMapper()
-        self.gmaps = googlemaps.Client(key=google_maps_api_key)
+        # any RoutingBackend works here, e.g. a GraphBackend for offline routing
+        self.backend = (
+            backend
+            if backend is not None
+            else GoogleMapsBackend(google_maps_api_key, max_concurrency=max_workers)
+        )
+        # each backend gets its own tables in the default caches, those without a
+        # cache_namespace (e.g. GraphBackend, whose graph can change between runs)
+        # are only cached in memory
+        namespace = self.backend.cache_namespace
+        if geocode_cache is None:
+            geocode_cache = (
+                GeocodeCache(namespace=namespace)
+                if namespace is not None
+                else GeocodeCache(db_path=None)
+            )
+        if directions_cache is None:
+            directions_cache = (
+                DirectionsCache(namespace=namespace)
+                if namespace is not None
+                else DirectionsCache(db_path=None)
+            )
+        self.geocode_cache = geocode_cache
+        self.directions_cache = directions_cache
+        # max number of concurrent routing requests, 1 means run them serially
+        self.max_workers = max_workers
+        # one pool for every map_concurrently call, so concurrent requests share
+        # max_workers threads instead of getting max_workers each
+        self.executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="route")
+            if max_workers > 1
+            else None
+        )
+        # trips split over several directions calls are ordered globally up
+        # front, otherwise each segment is only optimized on its own
+        self.waypoint_optimizer = (
+            WaypointOptimizer() if optimize_waypoint_order else None
+        )
+        # identical directions requests made concurrently (e.g. several users
+        # sending the example query) share one API call
+        self.in_flight_directions = SingleFlight()
 
     def generate_route(self, list_of_places, itinerary, include_map=True):
         """
@@ -37,23 +104,98 @@ class RouteFinder:
         self.logger.info(itinerary)
 
         t1 = time.time()
-        directions, sampled_route, mapping_dict = self.build_route_segments(
-            list_of_places
+        with tracing.span("route"):
+            directions, sampled_route, mapping_dict = self.build_route_segments(
+                list_of_places
+            )
+        t2 = time.time()
+        self.logger.info("Time to build route : {}".format((round(t2 - t1, 2))))
+        self.logger.info("Geocode cache stats : {}".format(self.geocode_cache.stats()))
+        self.logger.info(
+            "Directions cache stats : {}".format(self.directions_cache.stats())
+        )
+        self.logger.info("Routing backend stats : {}".format(self.backend.stats()))
+        self.logger.info(
+            "Coalesced directions requests : {}".format(
+                self.in_flight_directions.stats()
+            )
         )
+
+        if include_map:
+            t1 = time.time()
+            self._render_map(list_of_places, directions, sampled_route)
+            t2 = time.time()
+            self.logger.info("Time to generate map : {}".format((round(t2 - t1, 2))))
+
+        return directions, sampled_route, mapping_dict
+
+    async def agenerate_route(self, list_of_places, itinerary, include_map=True):
+        """
+        asyncio counterpart of generate_route, Google Maps requests are made on
+        the pooled keep-alive session instead of blocking a thread each
+
+        Parameters
+        ----------
+        list_of_places
+        itinerary
+        include_map
+
+        Returns
+        -------
+
+        """
+        self.logger.info("# " * 20)
+        self.logger.info("PROPOSED ITINERARY")
+        self.logger.info("# " * 20)
+        self.logger.info(itinerary)
+
+        t1 = time.time()
+        with tracing.span("route"):
+            directions, sampled_route, mapping_dict = await self.abuild_route_segments(
+                list_of_places
+            )
         t2 = time.time()
         self.logger.info("Time to build route : {}".format((round(t2 - t1, 2))))
+        self.logger.info("Geocode cache stats : {}".format(self.geocode_cache.stats()))
+        self.logger.info(
+            "Directions cache stats : {}".format(self.directions_cache.stats())
+        )
+        self.logger.info("Routing backend stats : {}".format(self.backend.stats()))
+        self.logger.info(
+            "Coalesced directions requests : {}".format(
+                self.in_flight_directions.stats()
+            )
+        )
 
         if include_map:
             t1 = time.time()
-            self.mapper.add_list_of_places(list_of_places)
-            self.mapper.generate_route_map(directions, sampled_route)
+            # map rendering is CPU bound, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                tracing.propagate(self._render_map),
+                list_of_places,
+                directions,
+                sampled_route,
+            )
             t2 = time.time()
             self.logger.info("Time to generate map : {}".format((round(t2 - t1, 2))))
 
         return directions, sampled_route, mapping_dict
 
+    @tracing.traced("render_map")
+    def _render_map(self, list_of_places, directions, sampled_route):
+        self.mapper.add_list_of_places(list_of_places)
+        self.mapper.generate_route_map(
+            directions, sampled_route, simplify_zoom=MAP_SIMPLIFY_ZOOM
+        )
+
     def build_route_segments(
-        self, list_of_places, verbose=True, distance_per_point_in_km=0.25
+        self,
+        list_of_places,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        start_time=None,
+        transit_type=None,
     ):
         """
 
@@ -62,6 +204,8 @@ class RouteFinder:
         list_of_places
         verbose
         sample_route_points
+        start_time
+        transit_type
 
         Returns
         -------
@@ -69,11 +213,6 @@ class RouteFinder:
         """
         number_of_stops = len(list_of_places["waypoints"])
 
-        segment_mapping_dicts = []
-        directions_list = []
-        routes_list = []
-        sampled_routes = []
-
         # if this is true, we need to make several API calls to collect the entire route
         if number_of_stops > self.MAX_WAYPOINTS_API_CALL:
             self.logger.info(
@@ -81,49 +220,47 @@ class RouteFinder:
                     number_of_stops, self.MAX_WAYPOINTS_API_CALL
                 )
             )
-            starting_point = list_of_places["start"]
-            segment_id = 0
-            for segment_start in range(0, number_of_stops, self.MAX_WAYPOINTS_API_CALL):
-                segment_end = segment_start + self.MAX_WAYPOINTS_API_CALL
-
-                segment_waypoints = list_of_places["waypoints"][
-                    segment_start:segment_end
-                ]
-
-                if segment_end >= number_of_stops:
-                    # this is the final segment
-                    end_point = list_of_places["end"]
-                else:
-                    end_point = segment_waypoints[-1]
-
-                start_point = starting_point
-
-                mapping_dict = self.build_mapping_dict(
-                    start_point, end_point, waypoints=segment_waypoints[:-1]
-                )
+            # geocode every distinct place once up front, the segment mapping
+            # dicts are then assembled from the geocode cache
+            geocoded = self.geocode_all(
+                [list_of_places["start"], list_of_places["end"]]
+                + list_of_places["waypoints"]
+            )
+            list_of_places = self.order_waypoints(list_of_places, geocoded)
+            segments = self.plan_segments(list_of_places)
+            segment_mapping_dicts = self.map_concurrently(
+                lambda segment: self.build_mapping_dict(*segment), segments
+            )
 
+            def fetch_segment(segment_id):
                 if verbose:
                     self.logger.info("# " * 10)
                     self.logger.info(
                         "Getting directions for segment {}".format(segment_id)
                     )
-
                 directions, route = self.build_directions_and_route(
-                    mapping_dict, verbose=verbose
+                    segment_mapping_dicts[segment_id],
+                    start_time=start_time,
+                    transit_type=transit_type,
+                    verbose=verbose,
+                    optimize_waypoints=self.waypoint_optimizer is None,
                 )
                 sampled_route = self.sample_route_with_legs(
                     route, distance_per_point_in_km
                 )
+                return directions, sampled_route
 
+            # segments are independent of each other, results come back in segment order
+            segment_results = self.map_concurrently(
+                fetch_segment, list(range(len(segments)))
+            )
+
+            directions_list = []
+            sampled_routes = []
+            for directions, sampled_route in segment_results:
                 directions_list += directions
-                routes_list += route
                 sampled_routes.append(sampled_route)
 
-                segment_mapping_dicts.append(mapping_dict)
-
-                starting_point = end_point
-                segment_id += 1
-
             # combine and assemble as single mapping dict and route list from the segments
             mapping_dict, sampled_route = self.assemble_final_route_from_segments(
                 segment_mapping_dicts, sampled_routes
@@ -140,11 +277,584 @@ class RouteFinder:
             )
 
             self.logger.info("Calling Google Maps API to get directions")
-            directions, route = self.build_directions_and_route(mapping_dict)
+            directions, route = self.build_directions_and_route(
+                mapping_dict, start_time=start_time, transit_type=transit_type
+            )
             sampled_route = self.sample_route_with_legs(route, distance_per_point_in_km)
 
         return directions, sampled_route, mapping_dict
 
+    async def abuild_route_segments(
+        self,
+        list_of_places,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        start_time=None,
+        transit_type=None,
+    ):
+        """asyncio counterpart of build_route_segments"""
+        number_of_stops = len(list_of_places["waypoints"])
+
+        if number_of_stops > self.MAX_WAYPOINTS_API_CALL:
+            self.logger.info(
+                "Number of stops ({}) > MAX_WAYPOINTS_PER_CALL ({}), going to make several calls to Google Maps API".format(
+                    number_of_stops, self.MAX_WAYPOINTS_API_CALL
+                )
+            )
+            geocoded = await self.ageocode_all(
+                [list_of_places["start"], list_of_places["end"]]
+                + list_of_places["waypoints"]
+            )
+            list_of_places = self.order_waypoints(list_of_places, geocoded)
+            segments = self.plan_segments(list_of_places)
+            segment_mapping_dicts = await asyncio.gather(
+                *[self.abuild_mapping_dict(*segment) for segment in segments]
+            )
+            segment_results = await asyncio.gather(
+                *[
+                    self.abuild_directions_and_route(
+                        mapping_dict,
+                        start_time=start_time,
+                        transit_type=transit_type,
+                        verbose=verbose,
+                        optimize_waypoints=self.waypoint_optimizer is None,
+                    )
+                    for mapping_dict in segment_mapping_dicts
+                ]
+            )
+
+            directions = []
+            sampled_routes = []
+            for segment_directions, route in segment_results:
+                directions += segment_directions
+                sampled_routes.append(
+                    self.sample_route_with_legs(route, distance_per_point_in_km)
+                )
+
+            mapping_dict, sampled_route = self.assemble_final_route_from_segments(
+                list(segment_mapping_dicts), sampled_routes
+            )
+
+        else:
+            self.logger.info("Assembling mapping dictionary")
+            mapping_dict = await self.abuild_mapping_dict(
+                list_of_places["start"],
+                list_of_places["end"],
+                waypoints=list_of_places["waypoints"],
+            )
+
+            self.logger.info("Calling Google Maps API to get directions")
+            directions, route = await self.abuild_directions_and_route(
+                mapping_dict, start_time=start_time, transit_type=transit_type
+            )
+            sampled_route = self.sample_route_with_legs(route, distance_per_point_in_km)
+
+        return directions, sampled_route, mapping_dict
+
+    def update_route(
+        self,
+        old_list_of_places,
+        new_list_of_places,
+        directions,
+        sampled_route,
+        start_time=None,
+        transit_type=None,
+        distance_per_point_in_km=0.25,
+    ):
+        """
+        Update a route after its list of places was edited. Legs between stops
+        that didn't change are kept as they are, only the legs touching added,
+        removed or replaced stops are fetched and sampled. A route built for
+        another transit type or departure time is rebuilt from scratch.
+
+        Parameters
+        ----------
+        old_list_of_places
+            list of places directions and sampled_route were built for
+        new_list_of_places
+        directions
+        sampled_route
+            as returned by build_route_segments for old_list_of_places
+        start_time
+            defaults to now
+        transit_type
+            defaults to "driving"
+        distance_per_point_in_km
+
+        Returns
+        -------
+        directions, sampled_route and mapping_dict for new_list_of_places
+        """
+        start_time = start_time if start_time else datetime.now()
+        transit_type = transit_type if transit_type else "driving"
+        geocoded = self.geocode_all(
+            self.places_of(old_list_of_places) + self.places_of(new_list_of_places)
+        )
+        update = self.plan_route_update(
+            old_list_of_places,
+            new_list_of_places,
+            directions,
+            sampled_route,
+            geocoded,
+            transit_type,
+            self.directions_cache.departure_bucket(start_time),
+        )
+        if update is None:
+            return self.build_route_segments(
+                new_list_of_places,
+                verbose=False,
+                distance_per_point_in_km=distance_per_point_in_km,
+                start_time=start_time,
+                transit_type=transit_type,
+            )
+
+        stops, reused = update
+        missing_edges = [
+            i for i in range(len(stops) - 1) if (stops[i], stops[i + 1]) not in reused
+        ]
+        fetched_legs = self.map_concurrently(
+            lambda i: self.get_or_fetch_leg(
+                stops[i], stops[i + 1], transit_type, start_time
+            ),
+            missing_edges,
+        )
+        return self.splice_route_update(
+            stops,
+            reused,
+            dict(zip(missing_edges, fetched_legs)),
+            geocoded,
+            new_list_of_places,
+            distance_per_point_in_km,
+            transit_type,
+            self.directions_cache.departure_bucket(start_time),
+        )
+
+    async def aupdate_route(
+        self,
+        old_list_of_places,
+        new_list_of_places,
+        directions,
+        sampled_route,
+        start_time=None,
+        transit_type=None,
+        distance_per_point_in_km=0.25,
+    ):
+        """asyncio counterpart of update_route"""
+        start_time = start_time if start_time else datetime.now()
+        transit_type = transit_type if transit_type else "driving"
+        geocoded = await self.ageocode_all(
+            self.places_of(old_list_of_places) + self.places_of(new_list_of_places)
+        )
+        update = self.plan_route_update(
+            old_list_of_places,
+            new_list_of_places,
+            directions,
+            sampled_route,
+            geocoded,
+            transit_type,
+            self.directions_cache.departure_bucket(start_time),
+        )
+        if update is None:
+            return await self.abuild_route_segments(
+                new_list_of_places,
+                verbose=False,
+                distance_per_point_in_km=distance_per_point_in_km,
+                start_time=start_time,
+                transit_type=transit_type,
+            )
+
+        stops, reused = update
+        missing_edges = [
+            i for i in range(len(stops) - 1) if (stops[i], stops[i + 1]) not in reused
+        ]
+        fetched_legs = await asyncio.gather(
+            *[
+                self.aget_or_fetch_leg(stops[i], stops[i + 1], transit_type, start_time)
+                for i in missing_edges
+            ]
+        )
+        return self.splice_route_update(
+            stops,
+            reused,
+            dict(zip(missing_edges, fetched_legs)),
+            geocoded,
+            new_list_of_places,
+            distance_per_point_in_km,
+            transit_type,
+            self.directions_cache.departure_bucket(start_time),
+        )
+
+    @staticmethod
+    def places_of(list_of_places):
+        return [list_of_places["start"], list_of_places["end"]] + list(
+            list_of_places["waypoints"]
+        )
+
+    def plan_route_update(
+        self,
+        old_list_of_places,
+        new_list_of_places,
+        directions,
+        sampled_route,
+        geocoded,
+        transit_type,
+        departure_bucket,
+    ):
+        """
+
+        Parameters
+        ----------
+        old_list_of_places
+        new_list_of_places
+        directions
+        sampled_route
+        geocoded
+            dict of address to geocode result, for the places of both trips
+        transit_type
+        departure_bucket
+            of the updated route, legs requested for another mode or departure
+            can't be kept
+
+        Returns
+        -------
+        the new stops as place_id strings in visiting order, and a dict of
+        (origin, destination) to the (directions leg, sampled leg) of the old
+        route that can be kept. None if the route has to be built from scratch
+        """
+        if not all(geocoded.values()):
+            self.logger.warning("Not all places could be geocoded, rebuilding route")
+            return None
+
+        sampled_legs = [sampled_route[k] for k in sorted(sampled_route)]
+        if not sampled_legs or "origin" not in sampled_legs[0]:
+            self.logger.info("Route has no stop information, rebuilding it")
+            return None
+
+        if any(
+            leg.get("transit_type") != transit_type
+            or leg.get("departure_bucket") != departure_bucket
+            for leg in sampled_legs
+        ):
+            self.logger.info(
+                "Route was built for another transit type or departure, rebuilding it"
+            )
+            return None
+
+        def place_id(address):
+            return "place_id:" + geocoded[address][0]["place_id"]
+
+        # stops of the old route in visiting order, as taken from its legs
+        old_stops = [place_id(old_list_of_places["start"])]
+        for leg in sampled_legs:
+            if leg["origin"] != old_stops[-1]:
+                old_stops.append(leg["origin"])
+            old_stops.append(leg["destination"])
+        if old_stops[-1] != place_id(old_list_of_places["end"]):
+            old_stops.append(place_id(old_list_of_places["end"]))
+
+        visited = self.edit_visiting_order(
+            [place_id(w) for w in old_list_of_places["waypoints"]],
+            [place_id(w) for w in new_list_of_places["waypoints"]],
+            old_stops[1:-1],
+        )
+        stops = (
+            [place_id(new_list_of_places["start"])]
+            + visited
+            + [place_id(new_list_of_places["end"])]
+        )
+
+        directions_legs = [leg for route in directions for leg in route["legs"]]
+        if len(directions_legs) != len(sampled_legs):
+            self.logger.warning("Directions don't match the sampled route, rebuilding")
+            return None
+
+        reused = {
+            (sampled["origin"], sampled["destination"]): (leg, sampled)
+            for leg, sampled in zip(directions_legs, sampled_legs)
+        }
+        self.logger.info(
+            "Updating route, keeping {} of {} legs".format(
+                sum((a, b) in reused for a, b in zip(stops[:-1], stops[1:])),
+                len(stops) - 1,
+            )
+        )
+        return stops, reused
+
+    @staticmethod
+    def edit_visiting_order(old_waypoints, new_waypoints, visited):
+        """
+        Apply the edits that turn old_waypoints into new_waypoints to the order
+        the old waypoints were visited in. A stop replacing another one takes
+        its place, an added stop is visited right after the one listed before it.
+
+        Parameters
+        ----------
+        old_waypoints
+            old waypoints in list order
+        new_waypoints
+            new waypoints in list order
+        visited
+            old waypoints in visiting order
+
+        Returns
+        -------
+        new waypoints in visiting order
+        """
+        visited = list(visited)
+        matcher = difflib.SequenceMatcher(
+            None, old_waypoints, new_waypoints, autojunk=False
+        )
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+
+            removed = old_waypoints[i1:i2]
+            added = new_waypoints[j1:j2]
+            for k, stop in enumerate(added):
+                if k < len(removed) and removed[k] in visited:
+                    visited[visited.index(removed[k])] = stop
+                else:
+                    anchor = new_waypoints[j1 + k - 1] if j1 + k > 0 else None
+                    position = visited.index(anchor) + 1 if anchor in visited else 0
+                    visited.insert(position, stop)
+
+            for stop in removed[len(added) :]:
+                if stop in visited:
+                    visited.remove(stop)
+
+        return visited
+
+    def get_or_fetch_leg(self, origin, destination, transit_type, start_time):
+        """
+
+        Parameters
+        ----------
+        origin
+        destination
+        transit_type
+        start_time
+
+        Returns
+        -------
+        directions leg from origin to destination, None if no route was found
+        """
+        bucket = self.directions_cache.departure_bucket(start_time)
+        leg = self.directions_cache.get_legs(
+            [origin, destination], transit_type, bucket
+        )[0]
+        if leg is None:
+            directions_result = self.fetch_leg_directions(
+                origin, destination, transit_type, start_time
+            )
+            leg = directions_result[0]["legs"][0] if directions_result else None
+        return leg
+
+    async def aget_or_fetch_leg(self, origin, destination, transit_type, start_time):
+        """asyncio counterpart of get_or_fetch_leg"""
+        bucket = self.directions_cache.departure_bucket(start_time)
+        leg = self.directions_cache.get_legs(
+            [origin, destination], transit_type, bucket
+        )[0]
+        if leg is None:
+            directions_result = await self.afetch_leg_directions(
+                origin, destination, transit_type, start_time
+            )
+            leg = directions_result[0]["legs"][0] if directions_result else None
+        return leg
+
+    def splice_route_update(
+        self,
+        stops,
+        reused,
+        fetched_legs,
+        geocoded,
+        list_of_places,
+        distance_per_point_in_km,
+        transit_type,
+        departure_bucket,
+    ):
+        """
+        Assemble the updated route from the kept legs and the fetched ones, only
+        the fetched legs are sampled
+
+        Parameters
+        ----------
+        stops
+        reused
+        fetched_legs
+            dict of edge index to the directions leg fetched for it, None if not found
+        geocoded
+        list_of_places
+        distance_per_point_in_km
+        transit_type
+        departure_bucket
+            the fetched legs were requested with
+
+        Returns
+        -------
+        directions, sampled_route and mapping_dict
+        """
+        new_route = Route(
+            {
+                i: RouteLeg.from_directions_leg(leg, quantize=ROUTE_QUANTIZE_E7)
+                for i, leg in fetched_legs.items()
+                if leg is not None
+            },
+            stops=stops,
+            transit_type=transit_type,
+            departure_bucket=departure_bucket,
+        )
+        new_sampled_legs = self.sample_route_with_legs(
+            new_route, distance_per_point_in_km
+        )
+
+        legs = []
+        sampled_route = {}
+        for i in range(len(stops) - 1):
+            if i in fetched_legs:
+                leg, sampled = fetched_legs[i], new_sampled_legs.get(i)
+            else:
+                leg, sampled = reused[(stops[i], stops[i + 1])]
+            if leg is None:
+                self.logger.warning(
+                    "No route found from {} to {}".format(stops[i], stops[i + 1])
+                )
+                continue
+            legs.append(leg)
+            sampled_route[i] = sampled
+
+        # same shape as a single directions call with the waypoints in request order
+        directions = [{"legs": legs, "waypoint_order": list(range(len(stops) - 2))}]
+
+        by_place_id = {
+            "place_id:" + results[0]["place_id"]: results[0]
+            for results in geocoded.values()
+        }
+        mapping_dict = {"start": geocoded[list_of_places["start"]][0]}
+        for i, stop in enumerate(stops[1:-1]):
+            mapping_dict["waypoint_{}".format(i)] = by_place_id[stop]
+        mapping_dict["end"] = geocoded[list_of_places["end"]][0]
+
+        return directions, sampled_route, mapping_dict
+
+    def order_waypoints(self, list_of_places, geocoded):
+        """
+        Reorder the waypoints of the whole trip before it is split into segments,
+        so stops are not stuck in the segment the itinerary happened to list them in
+
+        Parameters
+        ----------
+        list_of_places
+        geocoded
+            dict of address to geocode result, as returned by geocode_all
+
+        Returns
+        -------
+        list_of_places with the waypoints in visiting order
+        """
+        if self.waypoint_optimizer is None:
+            return list_of_places
+
+        places = [list_of_places["start"], list_of_places["end"]]
+        places += list_of_places["waypoints"]
+        if not all(geocoded.get(place) for place in places):
+            self.logger.warning("Not all places could be geocoded, keeping stop order")
+            return list_of_places
+
+        waypoints = list_of_places["waypoints"]
+        order = self.waypoint_optimizer.order(
+            geocoded[list_of_places["start"]][0],
+            [geocoded[waypoint][0] for waypoint in waypoints],
+            geocoded[list_of_places["end"]][0],
+        )
+        return dict(list_of_places, waypoints=[waypoints[i] for i in order])
+
+    def plan_segments(self, list_of_places):
+        """
+        Split a trip with more than MAX_WAYPOINTS_API_CALL stops into segments
+        that can each be fetched with a single directions call
+
+        Parameters
+        ----------
+        list_of_places
+
+        Returns
+        -------
+        list of (start, end, waypoints) tuples, in travel order
+        """
+        number_of_stops = len(list_of_places["waypoints"])
+        segments = []
+
+        starting_point = list_of_places["start"]
+        for segment_start in range(0, number_of_stops, self.MAX_WAYPOINTS_API_CALL):
+            segment_end = segment_start + self.MAX_WAYPOINTS_API_CALL
+
+            segment_waypoints = list_of_places["waypoints"][segment_start:segment_end]
+
+            if segment_end >= number_of_stops:
+                # this is the final segment
+                end_point = list_of_places["end"]
+            else:
+                end_point = segment_waypoints[-1]
+
+            segments.append((starting_point, end_point, segment_waypoints[:-1]))
+            starting_point = end_point
+
+        return segments
+
+    def map_concurrently(self, fn, items):
+        """
+        Apply fn to every item using up to max_workers threads. The output is
+        in the same order as items, so callers can't tell this apart from a
+        plain loop.
+
+        Parameters
+        ----------
+        fn
+        items
+
+        Returns
+        -------
+
+        """
+        items = list(items)
+        # nested calls (e.g. the per-edge fallback inside a segment request) run
+        # inline in the worker they come from: concurrency stays at max_workers
+        # and a worker never waits on work queued behind it
+        if (
+            self.executor is None
+            or len(items) <= 1
+            or getattr(_worker_state, "active", False)
+        ):
+            return [fn(item) for item in items]
+
+        # the worker threads add their spans to the caller's trace
+        fn = tracing.propagate(fn)
+
+        def run_in_worker(item):
+            _worker_state.active = True
+            try:
+                return fn(item)
+            finally:
+                _worker_state.active = False
+
+        return list(self.executor.map(run_in_worker, items))
+
+    def geocode_all(self, addresses):
+        """
+
+        Parameters
+        ----------
+        addresses
+
+        Returns
+        -------
+        dict of address to geocode result
+        """
+        unique_addresses = list(dict.fromkeys(addresses))
+        results = self.map_concurrently(self.convert_to_coords, unique_addresses)
+        return dict(zip(unique_addresses, results))
+
     def convert_to_coords(self, input_address):
         """
 
@@ -156,7 +866,32 @@ class RouteFinder:
         -------
 
         """
-        return self.gmaps.geocode(input_address)
+
+        def geocode():
+            tracing.count("maps_geocode_calls")
+            return self.backend.geocode(input_address)
+
+        # the same cities come up again and again, so only go to the API on a cache miss
+        with tracing.span("geocode", address=input_address):
+            return self.geocode_cache.get_or_compute(input_address, geocode)
+
+    async def ageocode_all(self, addresses):
+        """asyncio counterpart of geocode_all"""
+        unique_addresses = list(dict.fromkeys(addresses))
+        results = await asyncio.gather(
+            *[self.aconvert_to_coords(address) for address in unique_addresses]
+        )
+        return dict(zip(unique_addresses, results))
+
+    async def aconvert_to_coords(self, input_address):
+        """asyncio counterpart of convert_to_coords"""
+
+        def ageocode():
+            tracing.count("maps_geocode_calls")
+            return self.backend.ageocode(input_address)
+
+        with tracing.span("geocode", address=input_address):
+            return await self.geocode_cache.aget_or_compute(input_address, ageocode)
 
     def build_mapping_dict(self, start, end, waypoints):
         """
@@ -171,52 +906,88 @@ class RouteFinder:
         -------
 
         """
+        waypoints = waypoints if waypoints else []
+        geocoded = self.geocode_all([start, end] + waypoints)
+
+        mapping_dict = {}
+        mapping_dict["start"] = geocoded[start][0]
+        mapping_dict["end"] = geocoded[end][0]
+
+        for i, waypoint in enumerate(waypoints):
+            mapping_dict["waypoint_{}".format(i)] = geocoded[waypoint][0]
+
+        return mapping_dict
+
+    async def abuild_mapping_dict(self, start, end, waypoints):
+        """asyncio counterpart of build_mapping_dict"""
+        waypoints = waypoints if waypoints else []
+        geocoded = await self.ageocode_all([start, end] + waypoints)
+
         mapping_dict = {}
-        mapping_dict["start"] = self.convert_to_coords(start)[0]
-        mapping_dict["end"] = self.convert_to_coords(end)[0]
+        mapping_dict["start"] = geocoded[start][0]
+        mapping_dict["end"] = geocoded[end][0]
 
-        if waypoints:
-            for i, waypoint in enumerate(waypoints):
-                mapping_dict["waypoint_{}".format(i)] = self.convert_to_coords(
-                    waypoint
-                )[0]
+        for i, waypoint in enumerate(waypoints):
+            mapping_dict["waypoint_{}".format(i)] = geocoded[waypoint][0]
 
         return mapping_dict
 
     @staticmethod
-    def get_route(directions_result):
+    def get_route(directions_result, quantize=ROUTE_QUANTIZE_E7):
         """
 
         Parameters
         ----------
         directions_result
+        quantize
+            store route points as int32 E7 instead of float64
 
         Returns
         -------
-
+        Route, indexing it by leg number gives the {"distance", "duration", "route"}
+        dict this method used to return
         """
-        waypoints = {}
+        return Route.from_directions(directions_result, quantize=quantize)
 
-        for leg_number, leg in enumerate(directions_result[0]["legs"]):
-            leg_route = {}
+    @staticmethod
+    def directions_endpoints(mapping_dict):
+        """
 
-            distance, duration = leg["distance"]["text"], leg["duration"]["text"]
-            leg_route["distance"] = distance
-            leg_route["duration"] = duration
-            leg_route_points = []
+        Parameters
+        ----------
+        mapping_dict
 
-            for step in leg["steps"]:
-                decoded_points = decode_polyline(step["polyline"]["points"])
-                for p in decoded_points:
-                    leg_route_points.append(f'{p["lat"]},{p["lng"]}')
+        Returns
+        -------
+        start, end and list of waypoints, as place_id strings for the directions API
+        """
+        # use of place_id makes the calls more efficient
+        # see https://developers.google.com/maps/documentation/directions/get-directions#Waypoints
+        waypoints = [
+            "place_id:" + mapping_dict[x]["place_id"]
+            for x in mapping_dict.keys()
+            if "waypoint" in x
+        ]
+        start = "place_id:" + mapping_dict["start"]["place_id"]
+        end = "place_id:" + mapping_dict["end"]["place_id"]
 
-            leg_route["route"] = leg_route_points
-            waypoints[leg_number] = leg_route
+        # waypoints = [
+        #     mapping_dict[x]["place_id"]
+        #     for x in mapping_dict.keys()
+        #     if "waypoint" in x
+        # ]
+        # start = mapping_dict["start"]["formatted_address"]
+        # end = mapping_dict["end"]["formatted_address"]
 
-        return waypoints
+        return start, end, waypoints
 
     def build_directions_and_route(
-        self, mapping_dict, start_time=None, transit_type=None, verbose=True
+        self,
+        mapping_dict,
+        start_time=None,
+        transit_type=None,
+        verbose=True,
+        optimize_waypoints=True,
     ):
         """
 
@@ -226,6 +997,8 @@ class RouteFinder:
         start_time
         transit_type
         verbose
+        optimize_waypoints
+            let the directions API reorder the waypoints, off when they are already ordered
 
         Returns
         -------
@@ -237,120 +1010,534 @@ class RouteFinder:
         if not transit_type:
             transit_type = "driving"
 
-        # use of place_id makes the calls more efficient
-        # see https://developers.google.com/maps/documentation/directions/get-directions#Waypoints
-        waypoints = [
-            "place_id:" + mapping_dict[x]["place_id"]
-            for x in mapping_dict.keys()
-            if "waypoint" in x
-        ]
-        start = "place_id:" + mapping_dict["start"]["place_id"]
-        end = "place_id:" + mapping_dict["end"]["place_id"]
+        start, end, waypoints = self.directions_endpoints(mapping_dict)
+        all_points = [start] + waypoints + [end]
 
-        # waypoints = [
-        #     mapping_dict[x]["place_id"]
-        #     for x in mapping_dict.keys()
-        #     if "waypoint" in x
-        # ]
-        # start = mapping_dict["start"]["formatted_address"]
-        # end = mapping_dict["end"]["formatted_address"]
+        departure_bucket = self.directions_cache.departure_bucket(start_time)
+        plan = self.plan_cached_directions(
+            start, end, waypoints, transit_type, departure_bucket, optimize_waypoints
+        )
+        # stops in the order they are visited, the API may reorder the waypoints
+        stops = all_points
+
+        if plan is not None:
+            # legs shared with earlier trips are stitched from the cache and
+            # only the missing ones are requested
+            stops, waypoint_order, cached_legs, missing_runs = plan
+            run_results = self.map_concurrently(
+                lambda run: self.fetch_run_directions(
+                    stops[run[0] : run[1] + 1], transit_type, start_time
+                ),
+                missing_runs,
+            )
+            directions_result, full_route = self.stitch_legs(
+                cached_legs,
+                self.edges_of_runs(missing_runs, run_results),
+                waypoint_order,
+            )
+
+        else:
+            directions_result = self.request_directions(
+                start,
+                end,
+                waypoints=waypoints,
+                mode=transit_type,
+                units="metric",
+                optimize_waypoints=optimize_waypoints,
+                traffic_model="best_guess",
+                departure_time=start_time,
+            )
+
+            # test
+            # directions_result = []
+
+            if directions_result:
+                self.directions_cache.set_route_legs(
+                    start,
+                    end,
+                    waypoints,
+                    directions_result[0],
+                    transit_type,
+                    departure_bucket,
+                )
+                full_route = self.get_route(directions_result)
+                stops = self.visiting_order(
+                    start, end, waypoints, directions_result[0]["waypoint_order"]
+                )
+
+            else:
+                self.warn_directions_failed(waypoints)
+
+                start_time = datetime.now()
+
+                # get the directions between two consecutive points. For some reason
+                # this seems better able to deal with remote waypoints than if we
+                # enter "waypoints" into the directions call. The edges don't depend
+                # on each other, so fetch them all at once
+                edge_results = self.map_concurrently(
+                    lambda i: self.fetch_leg_directions(
+                        all_points[i], all_points[i + 1], transit_type, start_time
+                    ),
+                    list(range(len(all_points) - 1)),
+                )
+                directions_result, full_route = self.assemble_edge_directions(
+                    edge_results
+                )
+
+        full_route.stops = stops
+        full_route.transit_type = transit_type
+        full_route.departure_bucket = self.directions_cache.departure_bucket(start_time)
+
+        if verbose:
+            self.print_directions(directions_result)
+
+        return directions_result, full_route
+
+    def directions_request_key(self, origin, destination, **kwargs):
+        # requests in the same departure bucket are interchangeable, as in the leg cache
+        departure_time = kwargs.pop("departure_time", None)
+        waypoints = tuple(kwargs.pop("waypoints", None) or ())
+        return (
+            origin,
+            destination,
+            waypoints,
+            self.directions_cache.departure_bucket(departure_time)
+            if departure_time
+            else None,
+            tuple(sorted(kwargs.items())),
+        )
+
+    def request_directions(self, origin, destination, **kwargs):
+        """backend.directions, coalesced with identical requests already in flight"""
+
+        def directions():
+            tracing.count("maps_directions_calls")
+            return self.backend.directions(origin, destination, **kwargs)
+
+        with tracing.span("directions", origin=origin, destination=destination):
+            return self.in_flight_directions.do(
+                self.directions_request_key(origin, destination, **kwargs), directions
+            )
+
+    async def arequest_directions(self, origin, destination, **kwargs):
+        """asyncio counterpart of request_directions"""
+
+        def adirections():
+            tracing.count("maps_directions_calls")
+            return self.backend.adirections(origin, destination, **kwargs)
+
+        with tracing.span("directions", origin=origin, destination=destination):
+            return await self.in_flight_directions.ado(
+                self.directions_request_key(origin, destination, **kwargs), adirections
+            )
+
+    @staticmethod
+    def visiting_order(start, end, waypoints, waypoint_order):
+        return [start] + [waypoints[i] for i in waypoint_order] + [end]
 
-        directions_result = self.gmaps.directions(
-            start,
-            end,
-            waypoints=waypoints,
+    def plan_cached_directions(
+        self, start, end, waypoints, transit_type, departure_bucket, optimize_waypoints
+    ):
+        """
+        Look the legs of a trip up in the directions cache
+
+        Parameters
+        ----------
+        start
+        end
+        waypoints
+        transit_type
+        departure_bucket
+        optimize_waypoints
+
+        Returns
+        -------
+        stops in visiting order, waypoint_order, the cached leg of each edge (None
+        where missing) and the runs of consecutive missing edges as (first, last + 1).
+        None when the trip is better requested in a single directions call.
+        """
+        if optimize_waypoints and len(waypoints) > 1:
+            # legs are stored in the order the API chose, which is only known
+            # if the same request was made before
+            waypoint_order = self.directions_cache.get_waypoint_order(
+                start, end, waypoints, transit_type, departure_bucket
+            )
+            if waypoint_order is None:
+                return None
+        else:
+            waypoint_order = list(range(len(waypoints)))
+
+        stops = self.visiting_order(start, end, waypoints, waypoint_order)
+        cached_legs = self.directions_cache.get_legs(
+            stops, transit_type, departure_bucket
+        )
+        missing_runs = self.missing_runs(cached_legs)
+        if missing_runs == [(0, len(cached_legs))] or (
+            len(missing_runs) > MAX_STITCHED_DIRECTIONS_CALLS
+        ):
+            return None
+
+        self.log_cached_legs(cached_legs, missing_runs)
+        return stops, waypoint_order, cached_legs, missing_runs
+
+    @staticmethod
+    def missing_runs(cached_legs):
+        """Runs of consecutive edges without a cached leg, as (first, last + 1)"""
+        runs = []
+        for i, leg in enumerate(cached_legs):
+            if leg is not None:
+                continue
+            if runs and runs[-1][1] == i:
+                runs[-1] = (runs[-1][0], i + 1)
+            else:
+                runs.append((i, i + 1))
+        return runs
+
+    @staticmethod
+    def edges_of_runs(missing_runs, run_results):
+        """dict of edge index to its directions result, from the results of each run"""
+        return {
+            first + i: edge_result
+            for (first, _), edge_results in zip(missing_runs, run_results)
+            for i, edge_result in enumerate(edge_results)
+        }
+
+    def fetch_run_directions(self, points, transit_type, start_time):
+        """
+
+        Parameters
+        ----------
+        points
+            stops of consecutive missing edges, visited in this order
+        transit_type
+        start_time
+
+        Returns
+        -------
+        list with a directions result for each edge, in the layout of fetch_leg_directions
+        """
+        if len(points) == 2:
+            return [
+                self.fetch_leg_directions(
+                    points[0], points[1], transit_type, start_time
+                )
+            ]
+
+        directions_result = self.request_directions(
+            points[0],
+            points[-1],
+            waypoints=points[1:-1],
             mode=transit_type,
             units="metric",
-            optimize_waypoints=True,
             traffic_model="best_guess",
             departure_time=start_time,
         )
+        if directions_result:
+            return self._cache_run(points, directions_result, transit_type, start_time)
 
-        # test
-        # directions_result = []
+        # as in the fallback of build_directions_and_route, edge by edge
+        return [
+            self.fetch_leg_directions(
+                points[i], points[i + 1], transit_type, start_time
+            )
+            for i in range(len(points) - 1)
+        ]
 
+    async def afetch_run_directions(self, points, transit_type, start_time):
+        """asyncio counterpart of fetch_run_directions"""
+        if len(points) == 2:
+            return [
+                await self.afetch_leg_directions(
+                    points[0], points[1], transit_type, start_time
+                )
+            ]
+
+        directions_result = await self.arequest_directions(
+            points[0],
+            points[-1],
+            waypoints=points[1:-1],
+            mode=transit_type,
+            units="metric",
+            traffic_model="best_guess",
+            departure_time=start_time,
+        )
         if directions_result:
-            full_route = self.get_route(directions_result)
+            return self._cache_run(points, directions_result, transit_type, start_time)
 
-        else:
-            # if we get here, the google maps call has failed. This is probably because
-            # the waypoints were not found. We can still make a map by just using the
-            # start and end locations but we need to warn the user that the map won't contain
-            # the waypoints
+        return await asyncio.gather(
+            *[
+                self.afetch_leg_directions(
+                    points[i], points[i + 1], transit_type, start_time
+                )
+                for i in range(len(points) - 1)
+            ]
+        )
 
-            self.logger.warning(
-                "WARNING, some of the waypoints {} seem to"
-                "have caused issues with the google maps api".format(waypoints)
+    def _cache_run(self, points, directions_result, transit_type, start_time):
+        legs = directions_result[0]["legs"]
+        self.directions_cache.set_legs(
+            points,
+            legs,
+            transit_type,
+            self.directions_cache.departure_bucket(start_time),
+        )
+        return [[{"legs": [leg]}] for leg in legs]
+
+    def fetch_leg_directions(self, origin, destination, transit_type, start_time):
+        """
+
+        Parameters
+        ----------
+        origin
+        destination
+        transit_type
+        start_time
+
+        Returns
+        -------
+        directions result for the single leg from origin to destination
+        """
+        directions_result = self.request_directions(
+            origin,
+            destination,
+            units="metric",
+            mode=transit_type,
+            departure_time=start_time,
+        )
+        self._cache_leg(
+            origin, destination, directions_result, transit_type, start_time
+        )
+        return directions_result
+
+    async def abuild_directions_and_route(
+        self,
+        mapping_dict,
+        start_time=None,
+        transit_type=None,
+        verbose=True,
+        optimize_waypoints=True,
+    ):
+        """asyncio counterpart of build_directions_and_route"""
+        if not start_time:
+            start_time = datetime.now()
+
+        if not transit_type:
+            transit_type = "driving"
+
+        start, end, waypoints = self.directions_endpoints(mapping_dict)
+        all_points = [start] + waypoints + [end]
+
+        departure_bucket = self.directions_cache.departure_bucket(start_time)
+        plan = self.plan_cached_directions(
+            start, end, waypoints, transit_type, departure_bucket, optimize_waypoints
+        )
+        # stops in the order they are visited, the API may reorder the waypoints
+        stops = all_points
+
+        if plan is not None:
+            stops, waypoint_order, cached_legs, missing_runs = plan
+            run_results = await asyncio.gather(
+                *[
+                    self.afetch_run_directions(
+                        stops[first : last + 1], transit_type, start_time
+                    )
+                    for first, last in missing_runs
+                ]
+            )
+            directions_result, full_route = self.stitch_legs(
+                cached_legs,
+                self.edges_of_runs(missing_runs, run_results),
+                waypoint_order,
             )
 
-            self.logger.warning(
-                "Will attempt to step through the directions point by point".format(
-                    start, end
-                )
+        else:
+            directions_result = await self.arequest_directions(
+                start,
+                end,
+                waypoints=waypoints,
+                mode=transit_type,
+                units="metric",
+                optimize_waypoints=optimize_waypoints,
+                traffic_model="best_guess",
+                departure_time=start_time,
             )
 
-            all_points = [start] + waypoints + [end]
-            start_time = datetime.now()
-            final_route_dict = {}
-            directions_list = []
-            for i in range(1, len(all_points)):
-                # iterate edge by edge and get the directions between
-                # the points. For some reason this seems better able to
-                # deal with remote waypoints than if we enter "waypoints"
-                # into the directions call
-                p1 = all_points[i]
-                p0 = all_points[i - 1]
-
-                directions_result = self.gmaps.directions(
-                    p0,
-                    p1,
-                    units="metric",
-                    mode=transit_type,
-                    departure_time=start_time,
+            if directions_result:
+                self.directions_cache.set_route_legs(
+                    start,
+                    end,
+                    waypoints,
+                    directions_result[0],
+                    transit_type,
+                    departure_bucket,
+                )
+                full_route = self.get_route(directions_result)
+                stops = self.visiting_order(
+                    start, end, waypoints, directions_result[0]["waypoint_order"]
                 )
-                if directions_result:
-                    route_dict = self.get_route(directions_result)
-                    final_route_dict[i - 1] = route_dict[0]
-                directions_list += directions_result
 
-            directions_result = directions_list
-            full_route = final_route_dict
+            else:
+                self.warn_directions_failed(waypoints)
+
+                start_time = datetime.now()
+                edge_results = await asyncio.gather(
+                    *[
+                        self.afetch_leg_directions(
+                            all_points[i], all_points[i + 1], transit_type, start_time
+                        )
+                        for i in range(len(all_points) - 1)
+                    ]
+                )
+                directions_result, full_route = self.assemble_edge_directions(
+                    edge_results
+                )
+
+        full_route.stops = stops
+        full_route.transit_type = transit_type
+        full_route.departure_bucket = self.directions_cache.departure_bucket(start_time)
 
         if verbose:
-            print("# " * 10)
-            print("Fetched directions")
-            print("# " * 10)
-
-            if len(directions_result) == 1:
-                # print out some stats for the legs of the proposed trip
-                for i, leg in enumerate(directions_result[0]["legs"]):
-                    print(
-                        "Stop:" + str(i),
-                        leg["start_address"],
-                        "==> ",
-                        leg["end_address"],
-                        "distance (km): ",
-                        leg["distance"]["value"] / 1000,
-                        "traveling Time (hrs): ",
-                        leg["duration"]["value"] / 3600,
-                    )
-            else:
-                # if the directions result has been built from multiple calls
-                for i, leg in enumerate(directions_result):
-                    leg = leg["legs"][0]
-                    print(
-                        "Stop:" + str(i),
-                        leg["start_address"],
-                        "==> ",
-                        leg["end_address"],
-                        "distance (km): ",
-                        leg["distance"]["value"] / 1000,
-                        "traveling Time (hrs): ",
-                        leg["duration"]["value"] / 3600,
-                    )
+            self.print_directions(directions_result)
 
         return directions_result, full_route
 
+    async def afetch_leg_directions(
+        self, origin, destination, transit_type, start_time
+    ):
+        """asyncio counterpart of fetch_leg_directions"""
+        directions_result = await self.arequest_directions(
+            origin,
+            destination,
+            units="metric",
+            mode=transit_type,
+            departure_time=start_time,
+        )
+        self._cache_leg(
+            origin, destination, directions_result, transit_type, start_time
+        )
+        return directions_result
+
+    def _cache_leg(
+        self, origin, destination, directions_result, transit_type, start_time
+    ):
+        if directions_result:
+            self.directions_cache.set_legs(
+                [origin, destination],
+                directions_result[0]["legs"][:1],
+                transit_type,
+                self.directions_cache.departure_bucket(start_time),
+            )
+
+    def log_cached_legs(self, cached_legs, missing_runs):
+        missing = sum(last - first for first, last in missing_runs)
+        self.logger.info(
+            "{} of {} legs found in the directions cache, fetching {} in {} calls".format(
+                len(cached_legs) - missing,
+                len(cached_legs),
+                missing,
+                len(missing_runs),
+            )
+        )
+
+    def stitch_legs(self, cached_legs, fetched_edges, waypoint_order=None):
+        """
+        Combine cached legs and freshly fetched ones into a single directions result
+
+        Parameters
+        ----------
+        cached_legs
+            cached leg for each edge of the trip, None for the ones that were fetched
+        fetched_edges
+            dict of edge index to the directions result fetched for it
+        waypoint_order
+            order the waypoints are visited in, the request order if None
+
+        Returns
+        -------
+
+        """
+        if not all(fetched_edges.values()):
+            # some edge couldn't be found, use the per-edge layout of the fallback
+            # path which knows how to leave the gap out
+            edge_results = [
+                [{"legs": [leg]}] if leg is not None else fetched_edges[i]
+                for i, leg in enumerate(cached_legs)
+            ]
+            return self.assemble_edge_directions(edge_results)
+
+        legs = [
+            leg if leg is not None else fetched_edges[i][0]["legs"][0]
+            for i, leg in enumerate(cached_legs)
+        ]
+        # same shape as a single directions call
+        if waypoint_order is None:
+            waypoint_order = list(range(len(legs) - 1))
+        directions_result = [{"legs": legs, "waypoint_order": list(waypoint_order)}]
+        return directions_result, self.get_route(directions_result)
+
+    def warn_directions_failed(self, waypoints):
+        # if we get here, the google maps call has failed. This is probably because
+        # the waypoints were not found. We can still make a map by just using the
+        # start and end locations but we need to warn the user that the map won't contain
+        # the waypoints
+        self.logger.warning(
+            "WARNING, some of the waypoints {} seem to"
+            "have caused issues with the google maps api".format(waypoints)
+        )
+
+        self.logger.warning(
+            "Will attempt to step through the directions point by point"
+        )
+
+    def assemble_edge_directions(self, edge_results):
+        """
+        Combine the per-edge directions of the fallback path into a single
+        directions list and route dict
+
+        Parameters
+        ----------
+        edge_results
+            directions results, one per consecutive pair of points, in travel order
+
+        Returns
+        -------
+
+        """
+        final_route_dict = {}
+        directions_list = []
+        for i, directions_result in enumerate(edge_results, start=1):
+            if directions_result:
+                route_dict = self.get_route(directions_result)
+                final_route_dict[i - 1] = route_dict.leg(0)
+            directions_list += directions_result
+
+        return directions_list, Route(final_route_dict)
+
+    @staticmethod
+    def print_directions(directions_result):
+        print("# " * 10)
+        print("Fetched directions")
+        print("# " * 10)
+
+        if len(directions_result) == 1:
+            # print out some stats for the legs of the proposed trip
+            legs = directions_result[0]["legs"]
+        else:
+            # if the directions result has been built from multiple calls
+            legs = [leg["legs"][0] for leg in directions_result]
+
+        for i, leg in enumerate(legs):
+            print(
+                "Stop:" + str(i),
+                leg["start_address"],
+                "==> ",
+                leg["end_address"],
+                "distance (km): ",
+                leg["distance"]["value"] / 1000,
+                "traveling Time (hrs): ",
+                leg["duration"]["value"] / 3600,
+            )
+
     @staticmethod
     def assemble_final_route_from_segments(segment_mapping_dicts, sampled_routes):
         """
@@ -395,52 +1582,43 @@ class RouteFinder:
         return final_mapping_dict, final_sampled_route
 
     @staticmethod
+    @tracing.traced("sampling")
     def sample_route_with_legs(route, distance_per_point_in_km=0.25):
         """
+        Resample every leg of the route to one point per distance_per_point_in_km,
+        measured along the path
 
         Parameters
         ----------
         route
-        npoints
+            Route as returned by get_route, or the legacy dict of legs
+        distance_per_point_in_km
 
         Returns
         -------
 
         """
-        # get total distance
-        all_distances = sum([float(route[i]["distance"].split(" ")[0].replace(",","")) for i in route])
+        if not isinstance(route, Route):
+            route = Route.from_dict(route)
 
-        # find distance per point
-        npoints = int(np.ceil(all_distances / distance_per_point_in_km))
-
-        # get actual points per leg
-        points_per_leg = [len(v["route"]) for k, v in route.items()]
-        total_points = sum(points_per_leg)
-
-        # get fraction of total points that need to be represented on each leg
-        n_sampled_per_leg = [
-            max(1, np.round(npoints * (x / total_points), 0)) for x in points_per_leg
-        ]
+        leg_ids = list(route)
+        resampled_legs = resample_legs(
+            [route.leg(leg_id).latlng for leg_id in leg_ids], distance_per_point_in_km
+        )
 
         sampled_points = {}
-        for leg_id, route_info in route.items():
-            total_points = int(points_per_leg[leg_id])
-            total_sampled_points = int(n_sampled_per_leg[leg_id])
-            step_size = int(max(total_points // total_sampled_points, 1.0))
-            route_sampled = [
-                route_info["route"][idx] for idx in range(0, total_points, step_size)
-            ]
-
-            distance = route_info["distance"]
-            duration = route_info["duration"]
-
+        for leg_id, points in zip(leg_ids, resampled_legs):
+            leg = route.leg(leg_id)
             sampled_points[leg_id] = {
-                "route": [
-                    (float(x.split(",")[0]), float(x.split(",")[1]))
-                    for x in route_sampled
-                ],
-                "duration": duration,
-                "distance": distance,
+                "route": list(zip(*points.T.tolist())),
+                "duration": leg.duration_text,
+                "distance": leg.distance_text,
             }
+            if route.stops is not None:
+                # lets update_route tell which legs an edit leaves untouched
+                sampled_points[leg_id]["origin"] = route.stops[leg_id]
+                sampled_points[leg_id]["destination"] = route.stops[leg_id + 1]
+                sampled_points[leg_id]["transit_type"] = route.transit_type
+                sampled_points[leg_id]["departure_bucket"] = route.departure_bucket
 
         return sampled_points
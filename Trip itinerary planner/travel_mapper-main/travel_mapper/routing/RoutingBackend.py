@@ -0,0 +1,131 @@
+from travel_mapper.routing.AsyncMapsClient import AsyncMapsClient
+from travel_mapper.routing.KeyPool import KeyPool
+from travel_mapper.constants import (
+    MAPS_CLIENT_RETRY_TIMEOUT,
+    MAPS_MAX_WORKERS,
+    MAPS_QUERIES_PER_SECOND,
+)
+import googlemaps
+import asyncio
+
+
+class RoutingBackend(object):
+    """
+    Interface RouteFinder uses for geocoding and directions. Implementations
+    return the same response shapes as googlemaps.Client.geocode and
+    googlemaps.Client.directions, which is what get_route and RouteMapper consume.
+    """
+
+    # tables the answers are kept under in RouteFinder's default SQLite caches, so
+    # backends never read each other's results. None keeps them in memory only
+    cache_namespace = None
+
+    def geocode(self, address):
+        """
+
+        Parameters
+        ----------
+        address
+
+        Returns
+        -------
+        list of geocoding results, each with "place_id", "formatted_address"
+        and "geometry" -> "location"
+        """
+        raise NotImplementedError()
+
+    def directions(
+        self,
+        origin,
+        destination,
+        waypoints=None,
+        mode=None,
+        units=None,
+        optimize_waypoints=False,
+        traffic_model=None,
+        departure_time=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        origin
+        destination
+        waypoints
+        mode
+        units
+        optimize_waypoints
+        traffic_model
+        departure_time
+
+        Returns
+        -------
+        list of routes, each with "legs" and "waypoint_order", empty if no route was found
+        """
+        raise NotImplementedError()
+
+    async def ageocode(self, address):
+        """asyncio counterpart of geocode, runs it in the default executor unless overridden"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.geocode, address
+        )
+
+    async def adirections(self, origin, destination, **kwargs):
+        """asyncio counterpart of directions, runs it in the default executor unless overridden"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.directions(origin, destination, **kwargs)
+        )
+
+    def stats(self):
+        """Usage counters of the backend, for logging"""
+        return {}
+
+
+class GoogleMapsBackend(RoutingBackend):
+    """
+    Google Maps Geocoding and Directions APIs. google_maps_api_key can be a
+    comma separated list of keys, requests are then spread over them round robin.
+    """
+
+    cache_namespace = "google_maps"
+
+    def __init__(
+        self, google_maps_api_key, max_concurrency=MAPS_MAX_WORKERS, key_pool=None
+    ):
+        self.key_pool = (
+            key_pool if key_pool is not None else KeyPool(google_maps_api_key)
+        )
+        # retries are left to the key pool, which rotates keys and backs off
+        # with jitter. The clients don't retry quota errors at all, and give up
+        # on server errors after retry_timeout instead of sleeping on their own
+        # for up to a minute
+        self.clients = {
+            key: googlemaps.Client(
+                key=key,
+                queries_per_second=MAPS_QUERIES_PER_SECOND,
+                retry_over_query_limit=False,
+                retry_timeout=MAPS_CLIENT_RETRY_TIMEOUT,
+            )
+            for key in self.key_pool.keys
+        }
+        self.gmaps = self.clients[self.key_pool.keys[0]]
+        self.async_gmaps = AsyncMapsClient(
+            google_maps_api_key, max_concurrency=max_concurrency, key_pool=self.key_pool
+        )
+
+    def geocode(self, address):
+        return self.key_pool.call(lambda key: self.clients[key].geocode(address))
+
+    def directions(self, origin, destination, **kwargs):
+        return self.key_pool.call(
+            lambda key: self.clients[key].directions(origin, destination, **kwargs)
+        )
+
+    async def ageocode(self, address):
+        return await self.async_gmaps.geocode(address)
+
+    async def adirections(self, origin, destination, **kwargs):
+        return await self.async_gmaps.directions(origin, destination, **kwargs)
+
+    def stats(self):
+        return self.key_pool.usage()
@@ -0,0 +1,184 @@
+from travel_mapper.constants import WAYPOINT_OPTIMIZER_TIME_LIMIT
+from travel_mapper.routing.resampling import haversine_km
+import logging
+import numpy as np
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+
+class WaypointOptimizer(object):
+    """
+    Orders the waypoints of a trip with a pinned start and end so that the total
+    distance is short: nearest neighbour construction followed by 2-opt and
+    Or-opt improvement, stopped after time_limit seconds. Pairwise distances
+    between places are cached across trips.
+    """
+
+    def __init__(self, time_limit=WAYPOINT_OPTIMIZER_TIME_LIMIT):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.time_limit = time_limit
+        self._distances = {}
+        self._lock = threading.Lock()
+
+    def distance_matrix(self, places):
+        """
+
+        Parameters
+        ----------
+        places
+            list of geocode results (with "place_id" and "geometry" -> "location")
+
+        Returns
+        -------
+        (n, n) array of great circle distances in km
+        """
+        ids = [place["place_id"] for place in places]
+        n = len(ids)
+        matrix = np.zeros((n, n))
+
+        with self._lock:
+            missing = []
+            for i in range(n):
+                for j in range(i + 1, n):
+                    cached = self._distances.get((ids[i], ids[j]))
+                    if cached is None:
+                        missing.append((i, j))
+                    else:
+                        matrix[i, j] = matrix[j, i] = cached
+
+        if missing:
+            locations = np.array(
+                [
+                    [p["geometry"]["location"]["lat"], p["geometry"]["location"]["lng"]]
+                    for p in places
+                ]
+            )
+            rows, cols = np.array(missing).T
+            distances = haversine_km(
+                locations[rows, 0],
+                locations[rows, 1],
+                locations[cols, 0],
+                locations[cols, 1],
+            )
+            matrix[rows, cols] = matrix[cols, rows] = distances
+            with self._lock:
+                for (i, j), distance in zip(missing, distances.tolist()):
+                    self._distances[(ids[i], ids[j])] = distance
+                    self._distances[(ids[j], ids[i])] = distance
+
+        return matrix
+
+    def order(self, start, waypoints, end):
+        """
+
+        Parameters
+        ----------
+        start
+            geocode result of the start of the trip
+        waypoints
+            geocode results of the waypoints
+        end
+            geocode result of the end of the trip
+
+        Returns
+        -------
+        list of indices into waypoints, in visiting order
+        """
+        if len(waypoints) < 2:
+            return list(range(len(waypoints)))
+
+        deadline = time.time() + self.time_limit
+        matrix = self.distance_matrix([start] + list(waypoints) + [end])
+
+        tour = self._nearest_neighbour(matrix)
+        initial_length = self.tour_length(matrix, tour)
+
+        improved = True
+        while improved and time.time() < deadline:
+            improved = self._two_opt(matrix, tour, deadline)
+            improved = self._or_opt(matrix, tour, deadline) or improved
+
+        self.logger.info(
+            "Ordered {} waypoints, route length {:.0f} km -> {:.0f} km".format(
+                len(waypoints), initial_length, self.tour_length(matrix, tour)
+            )
+        )
+        # drop the pinned start and end, shift back to waypoint indices
+        return [node - 1 for node in tour[1:-1]]
+
+    @staticmethod
+    def tour_length(matrix, tour):
+        return float(matrix[tour[:-1], tour[1:]].sum())
+
+    @staticmethod
+    def _nearest_neighbour(matrix):
+        end = len(matrix) - 1
+        unvisited = set(range(1, end))
+        tour = [0]
+        while unvisited:
+            candidates = list(unvisited)
+            nearest = candidates[int(np.argmin(matrix[tour[-1], candidates]))]
+            tour.append(nearest)
+            unvisited.remove(nearest)
+        tour.append(end)
+        return tour
+
+    @staticmethod
+    def _two_opt(matrix, tour, deadline):
+        # reverse tour[i:j + 1] whenever that shortens the tour, endpoints stay pinned
+        improved = False
+        n = len(tour)
+        for i in range(1, n - 2):
+            if time.time() > deadline:
+                break
+            a, b = tour[i - 1], tour[i]
+            for j in range(i + 1, n - 1):
+                c, d = tour[j], tour[j + 1]
+                delta = matrix[a, c] + matrix[b, d] - matrix[a, b] - matrix[c, d]
+                if delta < -1e-9:
+                    tour[i : j + 1] = tour[i : j + 1][::-1]
+                    b = tour[i]
+                    improved = True
+        return improved
+
+    @staticmethod
+    def _or_opt(matrix, tour, deadline):
+        # move runs of 1 to 3 consecutive stops to a better position in the tour
+        improved = False
+        for run in (1, 2, 3):
+            i = 1
+            while i + run < len(tour):
+                if time.time() > deadline:
+                    return improved
+                segment = tour[i : i + run]
+                prev, nxt = tour[i - 1], tour[i + run]
+                removal_gain = (
+                    matrix[prev, segment[0]]
+                    + matrix[segment[-1], nxt]
+                    - matrix[prev, nxt]
+                )
+                rest = tour[:i] + tour[i + run :]
+
+                best_delta, best_position, best_segment = -1e-9, None, None
+                for position in range(1, len(rest)):
+                    a, b = rest[position - 1], rest[position]
+                    for candidate in (segment, segment[::-1]):
+                        delta = (
+                            matrix[a, candidate[0]]
+                            + matrix[candidate[-1], b]
+                            - matrix[a, b]
+                            - removal_gain
+                        )
+                        if delta < best_delta:
+                            best_delta, best_position = delta, position
+                            best_segment = candidate
+
+                if best_position is not None:
+                    tour[:] = rest[:best_position] + best_segment + rest[best_position:]
+                    improved = True
+                else:
+                    i += 1
+        return improved
@@ -0,0 +1,80 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat0, lng0, lat1, lng1):
+    """Vectorized great circle distance in km between arrays of points given in degrees"""
+    lat0, lng0, lat1, lng1 = map(np.radians, (lat0, lng0, lat1, lng1))
+    a = (
+        np.sin((lat1 - lat0) / 2) ** 2
+        + np.cos(lat0) * np.cos(lat1) * np.sin((lng1 - lng0) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def resample_legs(legs, distance_per_point_in_km=0.25):
+    """
+    Resample every leg at a true fixed spacing along its path. Points are
+    interpolated along the polyline, so dense city sections and sparse highway
+    sections end up with the same point density. The first and last point of
+    every leg are kept. All legs are processed in one pass over the
+    concatenated route.
+
+    Parameters
+    ----------
+    legs
+        list of (n, 2) arrays of lat, lng, one per leg
+    distance_per_point_in_km
+
+    Returns
+    -------
+    list of (m, 2) arrays of lat, lng, one per leg
+    """
+    if not legs:
+        return []
+
+    lengths = np.array([len(leg) for leg in legs])
+    coords = np.concatenate([np.asarray(leg, dtype=np.float64) for leg in legs])
+    if len(coords) == 0:
+        return [np.empty((0, 2)) for _ in legs]
+
+    ends = np.cumsum(lengths) - 1
+    starts = ends - lengths + 1
+
+    # cumulative distance along the whole route, hops between legs count as 0
+    hops = haversine_km(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    leg_of_point = np.repeat(np.arange(len(legs)), lengths)
+    hops[leg_of_point[1:] != leg_of_point[:-1]] = 0.0
+    cumulative = np.concatenate(([0.0], np.cumsum(hops)))
+
+    non_empty = lengths > 0
+    leg_start_km = np.zeros(len(legs))
+    leg_km = np.zeros(len(legs))
+    leg_start_km[non_empty] = cumulative[starts[non_empty]]
+    leg_km[non_empty] = cumulative[ends[non_empty]] - leg_start_km[non_empty]
+
+    # targets every distance_per_point_in_km along each leg, plus the leg end
+    counts = np.where(
+        non_empty, np.ceil(leg_km / distance_per_point_in_km).astype(int) + 1, 0
+    )
+    target_leg = np.repeat(np.arange(len(legs)), counts)
+    rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    targets = leg_start_km[target_leg] + np.minimum(
+        rank * distance_per_point_in_km, leg_km[target_leg]
+    )
+
+    # locate each target within its own leg, the clipping keeps targets sitting
+    # exactly on a leg boundary from interpolating into the neighbouring leg
+    first, last = starts[target_leg], ends[target_leg]
+    upper = np.clip(np.searchsorted(cumulative, targets, side="right"), first + 1, last)
+    upper = np.maximum(upper, first)
+    lower = np.maximum(upper - 1, first)
+
+    span = cumulative[upper] - cumulative[lower]
+    fraction = np.divide(
+        targets - cumulative[lower], span, out=np.zeros_like(span), where=span > 0
+    )
+    points = coords[lower] + (coords[upper] - coords[lower]) * fraction[:, None]
+
+    return np.split(points, np.cumsum(counts)[:-1])
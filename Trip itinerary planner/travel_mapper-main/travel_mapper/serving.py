@@ -0,0 +1,141 @@
+"""
+Caps on how many requests work on a backend (the LLM, Google Maps) at once
+when the UI is serving many users, with queue depth and wait time reporting.
+"""
+
+from collections import deque
+import asyncio
+import threading
+import time
+
+
+class ConcurrencyLimit(object):
+    """
+    Semaphore shared by threads and event loops alike: use it as "with limit:"
+    in blocking code and "async with limit:" in coroutines. Waiters are let in
+    first come, first served, so a burst queues up instead of piling onto the
+    backend.
+    """
+
+    def __init__(self, name, limit=None):
+        """
+
+        Parameters
+        ----------
+        name
+            of the backend, for the stats
+        limit
+            requests allowed in at once, None for no limit
+        """
+        self.name = name
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._in_use = 0
+        # callables handing a freed slot to a waiter, oldest first
+        self._waiters = deque()
+        self._acquired = 0
+        self._waited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._max_queued = 0
+
+    def _try_acquire(self):
+        # with self._lock held
+        if self._waiters or (self.limit is not None and self._in_use >= self.limit):
+            return False
+        self._in_use += 1
+        return True
+
+    def _enqueue(self, wake):
+        # with self._lock held
+        self._waiters.append(wake)
+        self._max_queued = max(self._max_queued, len(self._waiters))
+
+    def _record_wait(self, started):
+        wait = time.perf_counter() - started
+        with self._lock:
+            self._acquired += 1
+            if wait > 0:
+                self._waited += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+    def acquire(self):
+        started = time.perf_counter()
+        with self._lock:
+            if self._try_acquire():
+                self._acquired += 1
+                return
+            event = threading.Event()
+            self._enqueue(event.set)
+        event.wait()
+        self._record_wait(started)
+
+    async def aacquire(self):
+        """asyncio counterpart of acquire"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                self._acquired += 1
+                return
+            future = loop.create_future()
+
+            def wake():
+                # released from any thread, resolve the future on its own loop
+                loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(None)
+                )
+
+            self._enqueue(wake)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = wake not in self._waiters
+                if not granted:
+                    self._waiters.remove(wake)
+            if granted:
+                # the slot was handed over as we were cancelled, pass it on
+                self.release()
+            raise
+        self._record_wait(started)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._in_use -= 1
+                return
+            # the slot goes straight to the next waiter, _in_use doesn't change
+            wake = self._waiters.popleft()
+        wake()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_use,
+                "queued": len(self._waiters),
+                "max_queued": self._max_queued,
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "mean_wait": round(self._total_wait / self._waited, 3)
+                if self._waited
+                else 0.0,
+                "max_wait": round(self._max_wait, 3),
+            }
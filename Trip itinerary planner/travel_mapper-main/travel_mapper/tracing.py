@@ -0,0 +1,195 @@
+"""
+Span style instrumentation of a trip request. A trace is started around a
+request (TravelMapperBase.parse does it), stages open spans inside it and
+count LLM tokens and Maps API calls. The current trace and span live in
+context variables, so concurrent requests on an event loop or in threads
+started through propagate don't mix. Without a trace nothing is recorded.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+import functools
+import threading
+import time
+
+_current_trace = contextvars.ContextVar("travel_mapper_trace", default=None)
+_current_span = contextvars.ContextVar("travel_mapper_span", default=None)
+
+
+class Span(object):
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.counters = defaultdict(int)
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        """Seconds, up to now if the span is still open"""
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def walk(self):
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "duration": round(self.duration, 6),
+            "attributes": self.attributes,
+            "counters": dict(self.counters),
+            "children": [child.to_dict() for child in list(self.children)],
+        }
+
+
+class Trace(object):
+    """Tree of spans of one request, with counters totalled over all of them"""
+
+    def __init__(self, name):
+        self.root = Span(name)
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        return self.root.duration
+
+    def add_span(self, parent, span):
+        with self._lock:
+            parent.children.append(span)
+
+    def count(self, span, name, n):
+        with self._lock:
+            self.counters[name] += n
+            span.counters[name] += n
+
+    def spans(self, name=None):
+        return [span for span in self.root.walk() if name is None or span.name == name]
+
+    def stage_durations(self):
+        """Total seconds spent in each stage, by span name"""
+        durations = defaultdict(float)
+        for span in self.root.walk():
+            if span is not self.root:
+                durations[span.name] += span.duration
+        return dict(durations)
+
+    def to_dict(self):
+        return {
+            "name": self.root.name,
+            "duration": round(self.duration, 6),
+            "counters": dict(self.counters),
+            "stages": {
+                name: round(duration, 6)
+                for name, duration in self.stage_durations().items()
+            },
+            "spans": self.root.to_dict(),
+        }
+
+    def __str__(self):
+        lines = []
+
+        def add(span, depth):
+            attributes = "".join(
+                " {}={}".format(k, v) for k, v in sorted(span.attributes.items())
+            )
+            lines.append(
+                "{}{} {:.3f}s{}{}".format(
+                    "  " * depth,
+                    span.name,
+                    span.duration,
+                    attributes,
+                    " " + str(dict(span.counters)) if span.counters else "",
+                )
+            )
+            for child in list(span.children):
+                add(child, depth + 1)
+
+        add(self.root, 0)
+        return "\n".join(lines)
+
+
+class TracedResult(tuple):
+    """A tuple result that also carries the Trace of the request that made it"""
+
+    def __new__(cls, values, trace):
+        result = super().__new__(cls, values)
+        result.trace = trace
+        return result
+
+
+@contextmanager
+def trace(name):
+    """Start a trace, the spans opened inside the with block belong to it"""
+    new_trace = Trace(name)
+    trace_token = _current_trace.set(new_trace)
+    span_token = _current_span.set(new_trace.root)
+    try:
+        yield new_trace
+    finally:
+        new_trace.root.end = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the with block as a child of the current span, yields None outside of a trace"""
+    current_trace = _current_trace.get()
+    if current_trace is None:
+        yield None
+        return
+
+    new_span = Span(name, attributes)
+    current_trace.add_span(_current_span.get(), new_span)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    finally:
+        new_span.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name):
+    """Decorator running a (synchronous) function in a span"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    """Add n to a counter of the current span and trace"""
+    current_trace = _current_trace.get()
+    if current_trace is not None:
+        current_trace.count(_current_span.get(), name, n)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def propagate(fn):
+    """
+    Wrap fn so it runs in the caller's trace and span when called from another
+    thread, e.g. by a ThreadPoolExecutor or run_in_executor, which don't carry
+    context variables over
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # a context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+
+    return wrapper
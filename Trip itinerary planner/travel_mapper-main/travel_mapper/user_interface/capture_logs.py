@@ -1,22 +1,174 @@
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from travel_mapper.user_interface.constants import (
+    LOG_BUFFER_ENTRIES,
+    LOG_FILE_MAX_BYTES,
+    LOG_FILE_BACKUPS,
+)
+import contextvars
+import os
+import queue
 import sys
+import threading
+
+# session of the request being handled, prints are tagged with it
+_current_session = contextvars.ContextVar("log_session", default=None)
+
+
+@contextmanager
+def log_session(session_id):
+    """Tag what is printed inside the with block (and in tasks started from it) with session_id"""
+    token = _current_session.set(session_id)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def current_session():
+    return _current_session.get()
+
+
+class LogRingBuffer:
+    # The last capacity writes, each with an offset that keeps increasing so readers can ask for
+    # what was written since their last read. Older writes are dropped, memory stays bounded.
+    def __init__(self, capacity=LOG_BUFFER_ENTRIES):
+        self._entries = deque(maxlen=capacity)
+        self._next_offset = 0
+        self._lock = threading.Lock()
+
+    def append(self, text, session=None):
+        with self._lock:
+            self._entries.append((self._next_offset, session, text))
+            self._next_offset += 1
+
+    def read(self, offset=0, session=None):
+        """
+        Parameters
+        ----------
+        offset
+            returned by the previous read, 0 for everything still in the buffer
+        session
+            only return what was printed for this session, None for everything
+
+        Returns
+        -------
+        text written since offset and the offset to read from next time
+        """
+        with self._lock:
+            first_offset = self._next_offset - len(self._entries)
+            start = max(offset - first_offset, 0)
+            entries = list(islice(self._entries, start, None))
+            next_offset = self._next_offset
+        text = "".join(
+            entry_text
+            for _, entry_session, entry_text in entries
+            if session is None or entry_session == session
+        )
+        return text, next_offset
+
+
+class BackgroundLogWriter:
+    # Appends to a log file from a daemon thread, so printing never waits for the disk. The file
+    # is rotated to filename.1 ... filename.<backup_count> when it grows past max_bytes.
+    _FLUSH = object()
+    _CLOSE = object()
+
+    def __init__(self, filename, max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_FILE_BACKUPS):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.SimpleQueue()
+        self._file = open(filename, "w")
+        self._size = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        self._queue.put(text)
+
+    def flush(self):
+        # the writer thread flushes after every batch, this only wakes it up
+        self._queue.put(self._FLUSH)
+
+    def close(self):
+        """Write everything queued so far and close the file"""
+        if self._thread.is_alive():
+            self._queue.put(self._CLOSE)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            # write whatever piled up meanwhile, flushing once
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if isinstance(item, str):
+                    self._write(item)
+            self._file.flush()
+            if self._CLOSE in items:
+                self._file.close()
+                return
+
+    def _write(self, text):
+        if not text:
+            return
+        if self.max_bytes and self._size + len(text) > self.max_bytes and self._size:
+            self._rotate()
+        self._file.write(text)
+        self._size += len(text)
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            older = "{}.{}".format(self.filename, i)
+            if os.path.exists(older):
+                os.replace(older, "{}.{}".format(self.filename, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.filename, self.filename + ".1")
+        self._file = open(self.filename, "w")
+        self._size = 0
 
 
 class PrintLogCapture:
-    # To capture print statements and write them to both the terminal and a log file.
-    def __init__(self, filename):
+    # To capture print statements: they still go to the terminal, and are kept in a bounded
+    # in-memory ring buffer (tagged with the session that printed them) for the UI to read,
+    # and written to a rotating log file by a background thread.
+    def __init__(
+        self,
+        filename,
+        capacity=LOG_BUFFER_ENTRIES,
+        max_bytes=LOG_FILE_MAX_BYTES,
+        backup_count=LOG_FILE_BACKUPS,
+    ):
         self.terminal = sys.stdout
-        self.log = open(filename, "w")
+        self.buffer = LogRingBuffer(capacity)
+        self.log = BackgroundLogWriter(filename, max_bytes, backup_count)
 
     def write(self, message):
         self.terminal.write(message)
+        self.buffer.append(message, current_session())
         self.log.write(message)
 
     def flush(self):
         self.terminal.flush()
         self.log.flush()
-    """Flushes the buffers of both the terminal and the log file. """
+    """Flushes the terminal, the log file is flushed in the background. """
 
     def isatty(self):
         return False
 
-    """ Returns False as this is not an interactive terminal."""
\ No newline at end of file
+    """ Returns False as this is not an interactive terminal."""
+
+    def read(self, offset=0, session=None):
+        return self.buffer.read(offset, session)
+    """ What was printed since offset (for session, or by everyone), and the offset to read from next. """
+
+    def close(self):
+        self.log.close()
+    """ Writes out what is still queued for the log file and closes it. """
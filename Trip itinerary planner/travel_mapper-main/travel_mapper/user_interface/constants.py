@@ -4,3 +4,16 @@ I want to visit national parks and cities with great food.
 I want to use a rental car and drive for no more than 7 hours on any given day.
 """
 VALID_MESSAGE = "The given Itinerary or Response is Valid"
+STREAM_RESULTS = True
+# Gradio queue: requests handled at once (the worker pool) and requests waiting before new ones are turned away
+QUEUE_CONCURRENCY = 16
+QUEUE_MAX_SIZE = 100
+# of the requests being handled, how many may call each backend at once
+LLM_CONCURRENCY = 8
+MAPS_CONCURRENCY = 4
+# printed output kept in memory for the UI (number of writes) and the rotating log file
+LOG_BUFFER_ENTRIES = 10000
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+# most recent characters of the log shown in the UI
+LOG_VIEW_CHARS = 20000
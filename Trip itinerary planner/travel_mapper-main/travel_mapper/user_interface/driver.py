@@ -1,21 +1,81 @@
 #!/usr/bin/env python
 
+import argparse
 import sys
 import gradio as gr
 from travel_mapper.TravelMapper import TravelMapperForUI, load_secrets, assert_secrets
-from travel_mapper.user_interface.capture_logs import PrintLogCapture
+from travel_mapper.user_interface.capture_logs import PrintLogCapture, log_session
 from travel_mapper.user_interface.utils import generate_generic_leafmap
-from travel_mapper.user_interface.constants import EXAMPLE_QUERY
+from travel_mapper.user_interface.constants import (
+    EXAMPLE_QUERY,
+    STREAM_RESULTS,
+    QUEUE_CONCURRENCY,
+    QUEUE_MAX_SIZE,
+    LLM_CONCURRENCY,
+    MAPS_CONCURRENCY,
+    LOG_VIEW_CHARS,
+)
+from travel_mapper.constants import MODEL_NAME, SUPPORTED_MODELS
+from travel_mapper import http_pool
 
 
-def read_logs():
-    sys.stdout.flush()
-    with open("output.log", "r") as f:
-        return f.read()
-# reads and returns the content of the "output.log" file.
+def read_logs(offset=0, session=None):
+    if isinstance(sys.stdout, PrintLogCapture):
+        return sys.stdout.read(offset, session)
+    return "", offset
+# returns what was printed since offset (by the given session's requests, or by everyone) and the
+# offset to read from next time, from the in-memory buffer of PrintLogCapture rather than output.log.
 
-def main():
+def show_new_logs(request: gr.Request, offset, logs):
+    new_logs, offset = read_logs(offset, request.session_hash)
+    return offset, (logs + new_logs)[-LOG_VIEW_CHARS:]
+# appends the logs of this browser session printed since the last refresh to the ones shown.
+
+def session_handler(fn):
+    async def handler(request: gr.Request, *args):
+        with log_session(request.session_hash):
+            return await fn(*args)
+    return handler
+# wraps a TravelMapperForUI async method as a Gradio handler, what it prints is tagged with the
+# browser session so concurrent users each see their own logs.
+
+def streaming_handler(stream_fn):
+    async def handler(request: gr.Request, *args):
+        updates = stream_fn(*args).__aiter__()
+        try:
+            while True:
+                # Gradio may resume the generator from another task, so the session is set per step
+                with log_session(request.session_hash):
+                    try:
+                        outputs = await updates.__anext__()
+                    except StopAsyncIteration:
+                        return
+                yield tuple(gr.update() if value is None else value for value in outputs)
+        finally:
+            # the user left early, let the stream release what it holds
+            await updates.aclose()
+    return handler
+# wraps a TravelMapperForUI streaming method as a Gradio generator handler, parts that
+# haven't changed (None) are left alone instead of being sent to the browser again.
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the travel mapper UI")
+    parser.add_argument("--concurrency", type=int, default=QUEUE_CONCURRENCY,
+                        help="requests handled at once by the Gradio queue")
+    parser.add_argument("--max-queue-size", type=int, default=QUEUE_MAX_SIZE,
+                        help="requests allowed to wait, more are turned away")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY,
+                        help="requests calling the LLM at once")
+    parser.add_argument("--maps-concurrency", type=int, default=MAPS_CONCURRENCY,
+                        help="requests calling Google Maps at once")
+    parser.add_argument("--server-name", default=None)
+    parser.add_argument("--server-port", type=int, default=None)
+    return parser.parse_args(argv)
+# serving options, the defaults come from user_interface/constants.py
+
+def main(argv=None):
     # The main function to launch the Application.
+    args = parse_args(argv)
     secrets = load_secrets()
     assert_secrets(secrets)
     # Using the load_secrets() function, it loads API keys and uses assert_secrets() to confirm their existence.
@@ -23,12 +83,13 @@ def main():
         openai_api_key=secrets["OPENAI_API_KEY"],
         google_maps_key=secrets["GOOGLE_MAPS_API_KEY"],
         google_palm_api_key=secrets["GOOGLE_PALM_API_KEY"],
+        llm_concurrency=args.llm_concurrency,
+        maps_concurrency=args.maps_concurrency,
     )
     sys.stdout = PrintLogCapture("output.log")
 
     # Using the help of Gradio as a template to build the UI.
     app = gr.Blocks()
-    generic_map = generate_generic_leafmap()
 
     with app:
         gr.Markdown("## Team-16 Generates Personalised Travel Itineraries")
@@ -38,11 +99,12 @@ def main():
                 with gr.Row():
                     with gr.Column():
                         text_input_map = gr.Textbox(EXAMPLE_QUERY, label="Travel Prompt:", lines=4)
-                        radio_map = gr.Radio(value="gpt-3.5-turbo", choices=["gpt-3.5-turbo", "gpt-4", "models/text-bison-001"], label="models")
+                        radio_map = gr.Radio(value=MODEL_NAME, choices=SUPPORTED_MODELS, label="models")
                         query_validation_text = gr.Textbox(label="Validation of Prompt:", lines=2)
 
                     with gr.Column():
-                        map_output = gr.HTML(generic_map, label="Travel map")
+                        # a callable value is only built when the page is first loaded, not before serving
+                        map_output = gr.HTML(generate_generic_leafmap, label="Travel map")
                         itinerary_output = gr.Textbox(value="The Itinerary will be generated here", label="Itinerary", lines=3)
                 map_button = gr.Button("Generate")
 
@@ -51,26 +113,56 @@ def main():
                 with gr.Row():
                     with gr.Column():
                         text_input_no_map = gr.Textbox(value=EXAMPLE_QUERY, label="Travel Prompt:", lines=3)
-                        radio_no_map = gr.Radio(value="gpt-3.5-turbo", choices=["gpt-3.5-turbo", "gpt-4", "models/text-bison-001"], label="Model choices")
+                        radio_no_map = gr.Radio(value=MODEL_NAME, choices=SUPPORTED_MODELS, label="Model choices")
                         query_validation_no_map = gr.Textbox(label="Validation of Prompt:", lines=2)
 
                     with gr.Column():
                         text_output_no_map = gr.Textbox(value="The Itinerary will be generated here", label="Itinerary:", lines=3)
                 text_button = gr.Button("Generate")
 
+            # Server Status Tab
+            with gr.TabItem("Server Status"):
+                serving_stats = gr.JSON(label="Requests in flight, queued and their wait times (s) per backend")
+                stats_button = gr.Button("Refresh")
+                logs_output = gr.Textbox(label="Logs of your requests", lines=10, max_lines=20)
+                logs_offset = gr.State(0)
+                logs_button = gr.Button("Show new logs")
+
+        # async handlers let one process serve many trips without a thread per request,
+        # the streaming ones show the itinerary as it is written instead of after the whole pipeline
+        if STREAM_RESULTS:
+            map_handler = streaming_handler(travel_mapper.astream_with_leafmap)
+            text_handler = streaming_handler(travel_mapper.astream_without_leafmap)
+        else:
+            map_handler = session_handler(travel_mapper.agenerate_with_leafmap)
+            text_handler = session_handler(travel_mapper.agenerate_without_leafmap)
+
         map_button.click(
-            travel_mapper.generate_with_leafmap,
+            map_handler,
             inputs=[text_input_map, radio_map],
             outputs=[map_output, itinerary_output, query_validation_text],
         )
         # Input and Output commands for Map View and Non Map View Respectively.
         text_button.click(
-            travel_mapper.generate_without_leafmap,
+            text_handler,
             inputs=[text_input_no_map, radio_no_map],
             outputs=[text_output_no_map, query_validation_no_map],
         )
 
-    app.launch()
+        # answered outside the queue, so the status can be checked while it is full
+        stats_button.click(travel_mapper.serving_stats, None, serving_stats, queue=False)
+        # only what was printed since the last refresh is read
+        logs_button.click(show_new_logs, [logs_offset, logs_output], [logs_offset, logs_output], queue=False)
+
+    # generator handlers need the queue. Up to concurrency requests are handled at once, the
+    # rest wait their turn (users see their position) and past max_queue_size are turned away
+    # straight away instead of timing out
+    app.queue(concurrency_count=args.concurrency, max_size=args.max_queue_size)
+    try:
+        app.launch(server_name=args.server_name, server_port=args.server_port)
+    finally:
+        # the keep-alive connections to the OpenAI and Google Maps APIs
+        http_pool.close_all_sessions()
 
 
 if __name__ == "__main__":
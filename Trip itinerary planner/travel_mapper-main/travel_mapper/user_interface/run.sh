@@ -2,4 +2,4 @@
 # run this from the top level directory of the travel mapper project
 export PYTHONPATH=$PYTHONPATH:$(pwd)
 echo "Starting travel mapper UI"
-$(pwd)/travel_mapper/user_interface/driver.py
\ No newline at end of file
+$(pwd)/travel_mapper/user_interface/driver.py "$@"
\ No newline at end of file